@@ -0,0 +1,309 @@
+"""Performance benchmarks for the Surgeo models and data loading paths.
+
+Every benchmark is timed with time.perf_counter() (best of several runs)
+and then run once more under tracemalloc to record its peak memory. The
+inputs are synthetic: names and geographies are sampled from the shipped
+reference tables, and a share of them are lower-cased, given suffixes,
+replaced with unknown values or left blank so that the normalization and
+missing-value paths are exercised as well.
+
+Results can be saved as a JSON baseline and later runs compared against
+it. A comparison prints the ratio to the baseline for every benchmark and
+exits with a non-zero status if anything got slower or bigger by more
+than the tolerance. Baselines are machine specific, so compare only runs
+made on the same hardware.
+
+Example
+-------
+    .. code-block::
+
+        $ python benchmarks/run_benchmarks.py --sizes 10000 --save baseline.json
+        $ python benchmarks/run_benchmarks.py --sizes 10000 --compare baseline.json
+        $ python benchmarks/run_benchmarks.py --only surgeo --sizes 1000000
+
+"""
+
+import argparse
+import gc
+import json
+import pathlib
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+# Benchmark the checkout this script lives in rather than an installed copy
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parents[1]))
+
+import surgeo
+from surgeo.app.surgeo_cli import SurgeoCLI
+from surgeo.models.base_model import BaseModel
+from surgeo.models.bifsg_model import BlockLoader
+
+
+SIZES = (10_000, 1_000_000, 10_000_000)
+
+# Small states keep the block benchmarks quick to set up
+BLOCK_STATES = ['10', '11']
+
+
+class SyntheticInputs(object):
+    """Generates reproducible model inputs of a given size"""
+
+    def __init__(self, seed: int = 0):
+        self._rng = np.random.default_rng(seed)
+        model = BaseModel()
+        data_dir = model._package_root / 'data'
+
+        def keys(table_name):
+            return model._parquet_to_df(data_dir / f'{table_name}.parquet').index
+
+        self._surnames = keys('prob_race_given_surname_2010').to_numpy(dtype=str)
+        self._first_names = keys('prob_race_given_first_name_harvard').to_numpy(dtype=str)
+        self._zctas = keys('prob_race_given_zcta_2010').to_numpy(dtype=str)
+        self._blocks = (
+            BlockLoader()
+                .load_family(BLOCK_STATES)
+                .index
+                .to_numpy(dtype=str)
+        )
+
+    def names(self, pool: np.ndarray, size: int) -> pd.Series:
+        """Sample names, some of them dirty, unknown or missing"""
+        names = pd.Series(self._rng.choice(pool, size), dtype=object)
+        draw = self._rng.random(size)
+        names[draw < 0.10] = names[draw < 0.10].str.lower()
+        suffixed = (draw >= 0.10) & (draw < 0.15)
+        names[suffixed] = names[suffixed] + ' JR'
+        unknown = (draw >= 0.15) & (draw < 0.20)
+        names[unknown] = 'ZZ' + names[unknown]
+        names[(draw >= 0.20) & (draw < 0.22)] = np.nan
+        return names
+
+    def geographies(self, pool: np.ndarray, size: int) -> pd.Series:
+        """Sample ZCTAs or blocks, some without leading zeros or missing"""
+        geos = pd.Series(self._rng.choice(pool, size), dtype=object)
+        draw = self._rng.random(size)
+        stripped = draw < 0.10
+        geos[stripped] = geos[stripped].str.lstrip('0')
+        geos[(draw >= 0.10) & (draw < 0.12)] = np.nan
+        return geos
+
+    def frame(self, size: int) -> pd.DataFrame:
+        """All of the inputs in the CLI's default column layout"""
+        return pd.DataFrame({
+            'first_name': self.names(self._first_names, size),
+            'name': self.names(self._surnames, size),
+            'zcta5': self.geographies(self._zctas, size),
+        })
+
+    def blocks(self, size: int) -> pd.Series:
+        return self.geographies(self._blocks, size)
+
+
+def measure(func, repeat: int, memory: bool = True) -> dict:
+    """Time func (best of repeat runs) and record its peak traced memory"""
+    times = []
+    for _ in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    result = {'seconds': min(times)}
+    if memory:
+        gc.collect()
+        tracemalloc.start()
+        try:
+            func()
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        result['peak_bytes'] = peak
+    return result
+
+
+def run_cli(*argv) -> None:
+    """Run SurgeoCLI in-process with the given command line arguments"""
+    saved_argv = sys.argv
+    sys.argv = ['surgeo_cli', *argv]
+    try:
+        SurgeoCLI().main()
+    finally:
+        sys.argv = saved_argv
+
+
+def construction_benchmarks() -> dict:
+    """Benchmarks whose cost does not depend on the input size"""
+
+    def cold(model_class, *args):
+        def construct():
+            surgeo.TABLE_REGISTRY.evict()
+            model_class(*args)
+        return construct
+
+    benchmarks = {}
+    for model_class in (
+        surgeo.SurnameModel,
+        surgeo.FirstNameModel,
+        surgeo.GeocodeModel,
+        surgeo.SurgeoModel,
+        surgeo.BIFSGModel,
+    ):
+        name = model_class.__name__
+        benchmarks[f'construct_cold.{name}'] = cold(model_class)
+        benchmarks[f'construct_warm.{name}'] = model_class
+    benchmarks['BlockLoader.load_fips'] = lambda: BlockLoader().load_fips(BLOCK_STATES)
+    return benchmarks
+
+
+def sized_benchmarks(inputs: SyntheticInputs, size: int, temp_dir: pathlib.Path) -> dict:
+    """Benchmarks run against synthetic inputs of the given size"""
+    df = inputs.frame(size)
+    blocks = inputs.blocks(size)
+    first_names, surnames, zctas = df['first_name'], df['name'], df['zcta5']
+
+    base_model = BaseModel()
+    surname_model = surgeo.SurnameModel()
+    first_name_model = surgeo.FirstNameModel()
+    geocode_model = surgeo.GeocodeModel()
+    surgeo_model = surgeo.SurgeoModel()
+    bifsg_model = surgeo.BIFSGModel()
+    block_model = surgeo.BIFSGModel('BLOCK')
+
+    input_path = temp_dir / f'input_{size}.csv'
+    output_path = temp_dir / f'output_{size}.csv'
+    df.to_csv(input_path, index=False)
+
+    return {
+        '_normalize_names': lambda: base_model._normalize_names(surnames),
+        'SurnameModel.get_probabilities':
+            lambda: surname_model.get_probabilities(surnames),
+        'FirstNameModel.get_probabilities':
+            lambda: first_name_model.get_probabilities(first_names),
+        'GeocodeModel.get_probabilities':
+            lambda: geocode_model.get_probabilities(zctas),
+        'SurgeoModel.get_probabilities':
+            lambda: surgeo_model.get_probabilities(surnames, zctas),
+        'BIFSGModel.get_probabilities':
+            lambda: bifsg_model.get_probabilities(first_names, surnames, zctas),
+        'BIFSGModel.get_probabilities[BLOCK]':
+            lambda: block_model.get_probabilities(first_names, surnames, blocks),
+        'SurgeoCLI.surgeo':
+            lambda: run_cli(str(input_path), str(output_path), 'surgeo'),
+        'SurgeoCLI.bifsg':
+            lambda: run_cli(str(input_path), str(output_path), 'bifsg'),
+    }
+
+
+def run(sizes, only=None, memory=True) -> dict:
+    """Run every benchmark whose name contains only (or all of them)"""
+    results = {}
+
+    def record(name, func, repeat):
+        if only and only not in name:
+            return
+        result = measure(func, repeat, memory)
+        results[name] = result
+        peak = result.get('peak_bytes')
+        peak_text = f'{peak / 2 ** 20:10.1f} MiB' if peak is not None else ''
+        print(f'{name:<55} {result["seconds"]:10.4f} s {peak_text}', flush=True)
+
+    for name, func in construction_benchmarks().items():
+        record(name, func, repeat=3)
+    inputs = SyntheticInputs()
+    with tempfile.TemporaryDirectory() as temp_dir:
+        for size in sizes:
+            benchmarks = sized_benchmarks(inputs, size, pathlib.Path(temp_dir))
+            for name, func in benchmarks.items():
+                record(f'{name}[{size}]', func, repeat=3 if size <= 100_000 else 1)
+    return results
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list:
+    """Print the ratio to the baseline and return the regressed benchmarks"""
+    regressions = []
+    print(f'\n{"benchmark":<55} {"time":>8} {"memory":>8}')
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        ratios = {
+            metric: result[metric] / baseline[name][metric]
+            for metric in ('seconds', 'peak_bytes')
+            if metric in result and baseline[name].get(metric)
+        }
+        flagged = [metric for metric, ratio in ratios.items() if ratio > 1 + tolerance]
+        if flagged:
+            regressions.append(name)
+        time_text = f'{ratios["seconds"]:7.2f}x' if 'seconds' in ratios else ''
+        memory_text = f'{ratios["peak_bytes"]:7.2f}x' if 'peak_bytes' in ratios else ''
+        marker = '  <-- regression' if flagged else ''
+        print(f'{name:<55} {time_text:>8} {memory_text:>8}{marker}')
+    return regressions
+
+
+def main():
+    """Parse arguments, run the benchmarks, and save or compare results"""
+    parser = argparse.ArgumentParser(description='Benchmark Surgeo.')
+    parser.add_argument(
+        '--sizes',
+        help='Input sizes (rows) to benchmark',
+        nargs='+',
+        type=int,
+        default=list(SIZES),
+    )
+    parser.add_argument(
+        '--only',
+        help='Only run benchmarks whose name contains this text',
+    )
+    parser.add_argument(
+        '--no-memory',
+        help='Skip the tracemalloc run (much faster for large sizes)',
+        action='store_false',
+        dest='memory',
+    )
+    parser.add_argument(
+        '--save',
+        help='Write the results to this JSON baseline file',
+    )
+    parser.add_argument(
+        '--compare',
+        help='Compare the results to this JSON baseline file',
+    )
+    parser.add_argument(
+        '--tolerance',
+        help='Allowed slowdown/growth before a result counts as a regression',
+        type=float,
+        default=0.2,
+    )
+    args = parser.parse_args()
+
+    results = run(args.sizes, args.only, args.memory)
+
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump({
+                'meta': {
+                    'surgeo': surgeo.VERSION,
+                    'python': platform.python_version(),
+                    'numpy': np.__version__,
+                    'pandas': pd.__version__,
+                    'machine': platform.platform(),
+                },
+                'results': results,
+            }, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)['results']
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print(f'\n{len(regressions)} benchmark(s) regressed by more than '
+                  f'{args.tolerance:.0%}.')
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
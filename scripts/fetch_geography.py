@@ -115,6 +115,10 @@ GEO_MAP_2010 = {
 
 TEMP_DIR = pathlib.Path(tempfile.gettempdir()) / 'surgeo_temp'
 
+# Rows per parquet row group. The tables are sorted by geography, so small row
+# groups let readers that filter on block/ZCTA ids skip most of each file.
+ROW_GROUP_SIZE = 16_384
+
 def make_geo_df(file_path:str, geo_level="ZCTA") -> pd.DataFrame:
     '''Helper func: takes zip and creates a geographic file from data'''
     # Read zip data
@@ -556,10 +560,10 @@ def write_files(ratio_by_column:pd.DataFrame, ratio_by_row:pd.DataFrame, rbc_fil
         import pyarrow.parquet as pq
 
         table = pa.Table.from_pandas(ratio_by_column)
-        pq.write_table(table, rbc_path)
+        pq.write_table(table, rbc_path, row_group_size=ROW_GROUP_SIZE)
 
         table = pa.Table.from_pandas(ratio_by_row)
-        pq.write_table(table, rbr_path)
+        pq.write_table(table, rbr_path, row_group_size=ROW_GROUP_SIZE)
 
     else: 
         raise Exception("Mode is not recognized. Choose 'csv' or 'pickle'")
@@ -39,6 +39,9 @@ setup(
         'xlrd',
         'openpyxl',
     ],
+    extras_require={
+        'zstd': ['zstandard'],
+    },
     package_dir={'surgeo': './surgeo'},
     package_data={'surgeo': ['./data/*', './static/*']},
 )
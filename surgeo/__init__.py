@@ -1,9 +1,14 @@
 """Surgeo is a Bayesian Improved Geocoding Surname Analysis module."""
 
+from surgeo.models.async_model import AsyncModel
+from surgeo.models.batch_scorer import BatchScorer
 from  surgeo.models.bifsg_model import BIFSGModel
+from surgeo.models.dataset_scorer import DatasetScorer
 from surgeo.models.first_name_model import FirstNameModel
 from surgeo.models.geocode_model import GeocodeModel
+from surgeo.models.parallel_model import ParallelModel
 from surgeo.models.surname_model import SurnameModel
 from surgeo.models.surgeo_model import SurgeoModel
+from surgeo.models.table_registry import TABLE_REGISTRY
 
 VERSION = '1.1.2'
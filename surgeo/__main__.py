@@ -1,4 +1,4 @@
-"""Access to the GUI/CLI via 'python -m surgeo' (with or without args)"""
+"""Access to the GUI/CLI/server via 'python -m surgeo' (with or without args)"""
 from surgeo.app.common_entry import SurgeoCommonEntry
 
 
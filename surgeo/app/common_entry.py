@@ -5,6 +5,7 @@ import sys
 
 import surgeo
 
+from surgeo.app import surgeo_server
 from surgeo.app.surgeo_cli import SurgeoCLI
 from surgeo.app.surgeo_gui import SurgeoGUI
 
@@ -13,8 +14,9 @@ class SurgeoCommonEntry(object):
     """An entry point for both the GUI and CLI Surgeo applications
 
     This class simply gets the number of args sent to the entry point. If
-    there is a single argument, the GUI is run. If addtional arguments are
-    supplied, the CLI is run. The CLI will then parse the arguments as
+    there is a single argument, the GUI is run. If the first argument is
+    "serve", the scoring server is run with the remaining arguments. If
+    addtional arguments are supplied, the CLI is run. The CLI will then parse the arguments as
     nothing it is not necessary to pass the arguments from the common entry
     to the CLI.
 
@@ -24,7 +26,8 @@ class SurgeoCommonEntry(object):
         """The entry point's main function
 
         This gets the number of arguments supplied. If no arguments are
-        supplied in addition to the 'surgeo' command, the GUI is run.
+        supplied in addition to the 'surgeo' command, the GUI is run. If
+        the first argument is 'serve', the scoring server is run.
         Otherwise, the CLI is run.
 
         """
@@ -35,6 +38,9 @@ class SurgeoCommonEntry(object):
         if arg_count == 1:
             gui = SurgeoGUI()
             gui.main()
+        # If 'serve', run the scoring server
+        elif sys.argv[1] == 'serve':
+            surgeo_server.main(sys.argv[2:])
         # Else, run CLI
         else:
             cli = SurgeoCLI()
@@ -3,16 +3,20 @@
 import argparse
 import pathlib
 import sys
+import time
 import traceback
 
 import pandas as pd
 
 import surgeo
 
+from surgeo.app import surgeo_io
 from surgeo.utility.surgeo_exception import SurgeoException
 from surgeo.models.bifsg_model import BIFSGModel
 from surgeo.models.first_name_model import FirstNameModel
 from surgeo.models.geocode_model import GeocodeModel
+from surgeo.models.parallel_model import ParallelModel
+from surgeo.models.progress import _NO_PROGRESS, _Stage, ProgressPrinter, StageProfiler
 from surgeo.models.surgeo_model import SurgeoModel
 from surgeo.models.surname_model import SurnameModel
 
@@ -39,12 +43,17 @@ class SurgeoCLI(object):
                           [--state_column STATE_COLUMN]
                           [--county_column COUNTY_COLUMN]
                           [--tract_column TRACT_COLUMN]
+                          [--chunksize CHUNKSIZE]
+                          [--workers WORKERS]
+                          [--id_columns ID_COLUMNS]
+                          [--progress]
+                          [--profile] [--profile_memory]
                           input output type
 
             Get Surgeo arguments.
 
-            input                 Input CSV or XLSX of data.
-            output                Output CSV or XLSX of data.
+            input                 Input CSV (optionally .gz or .zst), parquet, feather or XLSX of data.
+            output                Output CSV (optionally .gz or .zst), parquet, feather or XLSX of data.
             type                  The model type being run ("first", "sur", "geo", "bifsg", or "surgeo")
 
             optional arguments:
@@ -59,6 +68,18 @@ class SurgeoCLI(object):
             --state_column STATE_COLUMN input column containing two digit FIPS state code
             --county_column input column containing three digit FIPS County Code
             --tract_column input column containing six digit tract code
+            --chunksize CHUNKSIZE
+                                Stream the input in chunks of this many rows
+            --workers WORKERS
+                                Score in parallel across this many processes
+            --id_columns ID_COLUMNS
+                                Comma separated input columns to copy to the output
+            --progress
+                                Report the time and throughput of each stage to stderr
+            --profile
+                                Print the time spent in each stage to stderr at the end
+            --profile_memory
+                                Like --profile, also tracking the memory each stage allocates
 
     """
 
@@ -76,9 +97,27 @@ class SurgeoCLI(object):
         self._county_col = args.county_column
         self._tract_col = args.tract_column
         self._ct = args.ct
+        self._chunksize = args.chunksize
+        self._workers = args.workers
+        self._id_cols = [
+            column.strip()
+            for column in (args.id_columns or '').split(',')
+            if column.strip()
+        ]
         self._zcta_col_default = 'zcta5'
         self._first_col_default = 'first_name'
         self._sur_col_default = 'name'
+        # Models are loaded once and reused across chunks
+        self._models = {}
+        # Writes stage timings and running totals to stderr
+        self._progress = ProgressPrinter() if args.progress else None
+        # Adds up stage timings for a breakdown at the end
+        if args.profile or args.profile_memory:
+            self._profiler = StageProfiler(memory=args.profile_memory)
+        else:
+            self._profiler = None
+        self._rows_done = 0
+        self._started = time.perf_counter()
 
     def main(self):
         """This is the public interface function for this CLI.
@@ -86,14 +125,14 @@ class SurgeoCLI(object):
         In summary, this function triggers various routines that:
 
         1. Read arguments;
-        2. Take a user defined path argument and load an Excel or CSV into a
-           dataframe;
+        2. Take a user defined path argument and load an Excel, CSV, parquet
+           or feather file into a dataframe;
         3. Route that dataframe to a speciic processing function based on the
            "type" function argument (e.g. first_name, surname, geocoding, bifsg, or surgeo);
         4. Optional specifies the column names to analyze (if not using the
            default "zcta5", "name", or "first_name" headers);
         5. Runs the appropriate algorithm and returns a new dataframe;
-        6. Writes the resulting data to a new CSV based to output path
+        6. Writes the resulting data to a new file based on the output path
            specified by user.
 
         Raises
@@ -104,54 +143,203 @@ class SurgeoCLI(object):
             inappropriate outputs are not specified.
 
         """
-        input_df = self._load_df()
-        processed_df = self._process_df(input_df)
-        self._write_df(processed_df)
+        try:
+            if self._chunksize is not None:
+                self._main_chunked()
+            else:
+                with self._stage('input', 0) as stage:
+                    input_df = self._load_df()
+                    stage.rows = len(input_df)
+                processed_df = self._process_df(input_df)
+                with self._stage('output', len(processed_df)):
+                    self._write_df(self._add_id_columns(input_df, processed_df))
+                self._report_rows(len(input_df))
+        finally:
+            self._close_models()
+            if self._profiler is not None:
+                self._profiler.close()
+        if self._profiler is not None:
+            print(self._profiler.report(), file=sys.stderr)
+
+    def _main_chunked(self):
+        """Stream the input through the model one chunk at a time
+
+        Each chunk is read, scored against a model that is loaded once, and
+        appended to the output, so peak memory depends on the chunk size
+        rather than on the size of the input file.
+
+        """
+        if self._chunksize < 1:
+            raise SurgeoException('--chunksize must be a positive integer.')
+        chunks = self._load_chunks()
+        with surgeo_io.TableWriter(self._output_path) as writer:
+            while True:
+                with self._stage('input', 0) as stage:
+                    chunk = next(chunks, None)
+                    stage.rows = 0 if chunk is None else len(chunk)
+                if chunk is None:
+                    break
+                # Models align their component frames on a fresh RangeIndex
+                chunk = chunk.reset_index(drop=True)
+                processed_df = self._process_df(chunk)
+                with self._stage('output', len(processed_df)):
+                    writer.write(self._add_id_columns(chunk, processed_df))
+                self._report_rows(len(chunk))
+
+    def _on_stage(self, event):
+        """Pass a stage event on to --progress and --profile"""
+        for callback in (self._progress, self._profiler):
+            if callback is not None:
+                callback(event)
+
+    def _stage_callback(self):
+        """The progress callback given to models (None if not reporting)"""
+        if self._progress is None and self._profiler is None:
+            return None
+        return self._on_stage
+
+    def _stage(self, stage, rows):
+        """Time reading or writing as a stage of the CLI itself"""
+        if self._stage_callback() is None:
+            return _NO_PROGRESS
+        return _Stage(self._on_stage, type(self).__name__, stage, rows)
+
+    def _report_rows(self, rows):
+        """Write the running row total and throughput (with --progress)"""
+        self._rows_done += rows
+        if self._progress is None:
+            return
+        elapsed = time.perf_counter() - self._started
+        rate = self._rows_done / elapsed if elapsed > 0 else 0
+        self._progress.write(
+            f'{self._rows_done:,} rows written in {elapsed:.1f} s '
+            f'({rate:,.0f} rows/s overall)'
+        )
 
     def _load_df(self):
         """This creates a dataframe based on self._input_path"""
-        suffix = self._input_path.suffix
-        # If it's excel, read_excel()
-        if suffix == '.xlsx' or suffix == 'xls':
-            # xlrd doesn't support xlsx as of 2021-01-23
-            df = pd.read_excel(self._input_path, engine='openpyxl')
-        # If CSV, read read_csv()
-        elif suffix == '.csv':
-            df = pd.read_csv(
-                self._input_path,
-                skip_blank_lines=False,
-            )
-        # If path is unrecognized, throw error
+        return surgeo_io.read_table(
+            self._input_path,
+            self._input_columns(),
+            self._text_columns(),
+        )
+
+    def _load_chunks(self):
+        """This yields dataframes of self._chunksize rows from self._input_path"""
+        return surgeo_io.iter_tables(
+            self._input_path,
+            self._chunksize,
+            self._input_columns(),
+            self._text_columns(),
+        )
+
+    def _input_columns(self):
+        """The columns to read: those the model uses plus any ID columns
+
+        Only these columns are parsed (or, for parquet and feather, read at
+        all), which matters for wide inputs. Returns None (read everything)
+        if the model's columns can't be determined.
+
+        """
+        needed_columns = self._needed_columns()
+        if needed_columns is None:
+            return None
+        return list(dict.fromkeys(self._id_cols + needed_columns))
+
+    def _text_columns(self):
+        """The ZCTA column, read as strings to keep its leading zeros"""
+        if self._model_type == 'bifsg' or (
+            self._model_type in ('geo', 'surgeo') and not self._ct
+        ):
+            return [self._zcta_col or self._zcta_col_default]
+        return None
+
+    def _needed_columns(self):
+        """The input columns used by the model type and column arguments
+
+        Returns None if they can't be determined (e.g. an unknown model
+        type, which is reported once the data is processed).
+
+        """
+        first_col = self._first_col or self._first_col_default
+        sur_col = self._sur_col or self._sur_col_default
+        # Census tracts take precedence over ZCTAs, as in _run_surgeo()
+        if self._ct and self._state_col is not None:
+            geo_cols = [self._state_col, self._county_col, self._tract_col]
+        elif self._ct:
+            geo_cols = ['state', 'county', 'tract']
         else:
-            raise SurgeoException(
-                f'File ending for "{self._input_path}" not '
-                'recognized. Please use .csv or .xlsx.'
-            )
-        return df
+            geo_cols = [self._zcta_col or self._zcta_col_default]
+        columns = {
+            'first' : [first_col],
+            'sur'   : [sur_col],
+            'geo'   : geo_cols,
+            'bifsg' : [first_col, sur_col, self._zcta_col or self._zcta_col_default],
+            'surgeo': [sur_col] + geo_cols,
+        }.get(self._model_type)
+        # Incomplete tract arguments are reported once the data is processed
+        if columns is None or None in columns:
+            return None
+        # Drop duplicates (e.g. a first name column reused as a surname)
+        return list(dict.fromkeys(columns))
+
+    def _get_model(self, model_class, *args):
+        """Instantiate a model once and reuse it for every later chunk
+
+        If more than one worker was requested, the model is wrapped in a
+        ParallelModel so that it is scored across a process pool. Stages
+        run in the worker processes then: --progress prints them from the
+        workers, but --profile can only add up the CLI's reads and writes.
+
+        """
+        key = (model_class, args)
+        if key not in self._models:
+            if self._workers is not None and self._workers != 1:
+                if self._profiler is not None:
+                    print(
+                        '--profile only times reading and writing with '
+                        '--workers; model stages run in the worker processes.',
+                        file=sys.stderr,
+                    )
+                model = ParallelModel(
+                    model_class,
+                    *args,
+                    workers=self._workers,
+                    progress=self._progress,
+                )
+            else:
+                model = model_class(*args, progress=self._stage_callback())
+            self._models[key] = model
+        return self._models[key]
+
+    def _close_models(self):
+        """Shut down any worker pools started by parallel models"""
+        for model in self._models.values():
+            if isinstance(model, ParallelModel):
+                model.close()
 
     def _run_geo(self, df):
         """Method called from self._process_df() to get geo results"""
         if self._ct:
-            model = GeocodeModel("TRACT")
+            model = self._get_model(GeocodeModel, "TRACT")
         else:
-            model = GeocodeModel("ZCTA")
-        # If an optional name is specified, select that column and run
-        if self._zcta_col is not None and not self._ct:
-            model = GeocodeModel()
+            model = self._get_model(GeocodeModel, "ZCTA")
         # TODO: if they supply a name not found in CSV ... more specific error?
-        # If an optional name is specified, select that column and run
-        if self._zcta_col is not None:
-            target = df[self._zcta_col]
-            result = model.get_probabilities(target)
-        # Otherwise use 'zcta5' (and raise error if need be.)
-        elif self._state_col is not None and self._ct:
+        # Census tracts take precedence over ZCTAs, as in _run_surgeo()
+        if self._state_col is not None and self._ct:
             target = df[[self._state_col, self._county_col, self._tract_col]]
             result = model.get_probabilities_tract(target)
         elif self._ct:
             try:
-                target = df[['state', 'column', 'tract']]
+                target = df[['state', 'county', 'tract']]
             except KeyError:
                 raise SurgeoException("Columns for state, county, and tract not found.")
+            result = model.get_probabilities_tract(target)
+        # If an optional name is specified, select that column and run
+        elif self._zcta_col is not None:
+            target = df[self._zcta_col]
+            result = model.get_probabilities(target)
+        # Otherwise use 'zcta5' (and raise error if need be.)
         else:
             try:
                 target = df[self._zcta_col_default]
@@ -164,7 +352,7 @@ class SurgeoCLI(object):
     def _run_sur(self, df):
         """This runs a surname model for a given dataframe"""
         # Instantiate model
-        model = SurnameModel()
+        model = self._get_model(SurnameModel)
         # If target is specified, get probabilities based on that target
         # TODO: if they supply a name not found in CSV ... more specific error?
         if self._sur_col is not None:
@@ -183,7 +371,7 @@ class SurgeoCLI(object):
     def _run_first(self, df):
         """This runs a first name model for a given dataframe"""
         # Instantiate model
-        model = FirstNameModel()
+        model = self._get_model(FirstNameModel)
         # If target is specified, get probabilities based on that 
         # TODO: if they supply a name not found in CSV ... more specific error?
         if self._first_col is not None:
@@ -206,22 +394,22 @@ class SurgeoCLI(object):
         if self._zcta_col is not None and not self._ct:
             try:
                 geo_target = df[self._zcta_col]
-                model = SurgeoModel()
+                model = self._get_model(SurgeoModel)
             except KeyError:
                 raise SurgeoException(f'Column "{self._zcta_col}"" not found.')
         elif self._ct and self._state_col is not None:
             try:
                 geo_target = df[[self._state_col, self._county_col, self._tract_col]]
-                model = SurgeoModel(geo_level='TRACT')
+                model = self._get_model(SurgeoModel, 'TRACT')
             except KeyError:
                 raise SurgeoException(f'Columns for state, county, and tract not found.')
         elif self._ct:
             geo_target = df[['state','county','tract']]
-            model = SurgeoModel(geo_level='TRACT')
+            model = self._get_model(SurgeoModel, 'TRACT')
         # Otherwise use zcta5 for ZIP target
         else:
             geo_target = df[self._zcta_col_default]
-            model = SurgeoModel()
+            model = self._get_model(SurgeoModel)
         # If Surname target spcified, check for accuracy
         if self._sur_col is not None:
             sur_target = df[self._sur_col]
@@ -239,7 +427,7 @@ class SurgeoCLI(object):
     def _run_bifsg(self, df):
         """Runs a BIFSG model for a given dataframe"""
         # Instantiate model
-        model = BIFSGModel()
+        model = self._get_model(BIFSGModel)
         # If ZIP target is specified, check accuracy
         if self._zcta_col is not None:
             try:
@@ -296,21 +484,16 @@ class SurgeoCLI(object):
         result_df = process_func(df)
         return result_df
 
+    def _add_id_columns(self, input_df, result_df):
+        """Put the --id_columns of the input in front of the model's results"""
+        if not self._id_cols:
+            return result_df
+        ids = input_df[self._id_cols].reset_index(drop=True)
+        return pd.concat([ids, result_df.reset_index(drop=True)], axis=1)
+
     def _write_df(self, df):
-        """Write to CSV or XLSX depending on file suffix"""
-        suffix = self._output_path.suffix
-        # If excel, write to Excel
-        if suffix == '.xlsx':
-            df.to_excel(self._output_path, index=False)
-        # If CSV write to CSV
-        elif suffix == '.csv':
-            df.to_csv(self._output_path, index=False)
-        # Otherwise throw error.
-        else:
-            raise SurgeoException(
-                f'"{self._output_path}" is not a valid. '
-                f'Please specify a path ending in ".csv" or ".xlsx".'
-            )
+        """Write to CSV, parquet, feather or XLSX depending on file suffix"""
+        surgeo_io.write_table(df, self._output_path)
 
     def _get_parsed_args(self):
         """Create an argument parser and parse CLI arguments"""
@@ -319,12 +502,12 @@ class SurgeoCLI(object):
         # Add input file path argument
         parser.add_argument(
             'input',
-            help='Input CSV or XLSX of data.',
+            help='Input CSV (optionally .gz or .zst), parquet, feather or XLSX of data.',
         )
         # Output file path argument
         parser.add_argument(
             'output',
-            help='Output CSV or XLSX of data.',
+            help='Output CSV (optionally .gz or .zst), parquet, feather or XLSX of data.',
         )
         # Model type argument
         parser.add_argument(
@@ -368,6 +551,49 @@ class SurgeoCLI(object):
             help='The input column to analyze as first name',
             dest='first_name_column'
         )
+        # Optional parallel worker count argument
+        parser.add_argument(
+            '--workers',
+            help='Score in parallel across this many processes',
+            dest='workers',
+            type=int,
+        )
+        # Optional pass-through columns argument
+        parser.add_argument(
+            '--id_columns',
+            help='Comma separated input columns to copy to the output (e.g. loan_id,branch)',
+            dest='id_columns',
+        )
+        # Optional progress reporting argument
+        parser.add_argument(
+            '--progress',
+            action='store_true',
+            help='Report the time and throughput of each stage to stderr',
+            dest='progress',
+            default=False,
+        )
+        # Optional profiling arguments
+        parser.add_argument(
+            '--profile',
+            action='store_true',
+            help='Print the time spent in each stage to stderr at the end',
+            dest='profile',
+            default=False,
+        )
+        parser.add_argument(
+            '--profile_memory',
+            action='store_true',
+            help='Like --profile, also tracking the memory each stage allocates',
+            dest='profile_memory',
+            default=False,
+        )
+        # Optional streaming chunk size argument
+        parser.add_argument(
+            '--chunksize',
+            help='Stream the input in chunks of this many rows',
+            dest='chunksize',
+            type=int,
+        )
         # Parse args and return
         parsed_args = parser.parse_args()
         return parsed_args
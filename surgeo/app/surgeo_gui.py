@@ -1,7 +1,9 @@
 """Script containing a basic GUI program."""
 
 import pathlib
+import queue
 import sys
+import threading
 import traceback
 
 import tkinter as tk
@@ -9,10 +11,9 @@ import tkinter.ttk as ttk
 import tkinter.filedialog as filedialog
 import tkinter.messagebox as messagebox
 
-import pandas as pd
-
 import surgeo
 
+from surgeo.app import surgeo_io
 from surgeo.utility.surgeo_exception import SurgeoException
 from surgeo.models.bifsg_model import BIFSGModel
 from surgeo.models.first_name_model import FirstNameModel
@@ -33,14 +34,24 @@ class SurgeoGUI(object):
     It also has various helper functions to integrate the surgeo logic
     within the program.
 
-    It currently supports .xlsx, .xls, and .csv inputs; it currently
-    supports .xlsx and .csv outputs.
+    It supports .csv (optionally compressed), .parquet, .feather, .xlsx and
+    .xls inputs, and the same outputs except .xls. Jobs run on a worker
+    thread a chunk at a time, so the window stays responsive, shows their
+    progress, and can cancel them.
 
     """
 
+    # Rows read, scored and written at a time
+    _CHUNKSIZE = 50_000
+
+    # How often the window checks on a running job
+    _POLL_MS = 100
+
     def __init__(self):
         # Create dictionary to track all objects and populate with root
         self._objects = {'root': tk.Tk()}
+        # The job running on a worker thread, if any
+        self._job = None
         # https://cx-freeze.readthedocs.io/en/latest/faq.html#using-data-files
         # If it's frozen, we can't use __file__
         if getattr(sys, 'frozen', False):
@@ -71,9 +82,9 @@ class SurgeoGUI(object):
         self._objects['frame'] = tk.Frame(master=self._objects['root'])
         # Set title and window size
         self._objects['root'].title(f"Surgeo v.{surgeo.VERSION}")
-        self._objects['root'].minsize(700, 160)
+        self._objects['root'].minsize(700, 200)
         # Bind enter to a function that starts the analysis
-        self._objects['root'].bind('<Return>', self._execute)
+        self._objects['root'].bind('<Return>', self._start)
         # Add icon
         self._objects['root'].tk.call(
             'wm',
@@ -91,6 +102,9 @@ class SurgeoGUI(object):
             title='Select Input Path',
             filetypes=(
                 ('CSV files' , '*.csv' ),
+                ('Compressed CSV files', ('*.csv.gz', '*.csv.zst')),
+                ('Parquet files', '*.parquet'),
+                ('Feather files', ('*.feather', '*.arrow')),
                 ('Excel XLSX', '*.xlsx'),
                 ('Excel XLS' , '*.xls' )
             )
@@ -103,6 +117,9 @@ class SurgeoGUI(object):
         # This has to be used twice (filetypes and defaultextention)
         files = (
             ('CSV files' , '*.csv' ),
+            ('Compressed CSV files', ('*.csv.gz', '*.csv.zst')),
+            ('Parquet files', '*.parquet'),
+            ('Feather files', ('*.feather', '*.arrow')),
             ('Excel XLSX', '*.xlsx'),
         )
         # Get filename from dialog
@@ -268,23 +285,50 @@ class SurgeoGUI(object):
         #######################################################################
         # Row 7 EXECUTE
         #######################################################################
-        # Proces inputs button (this runs self._execute)
+        # Proces inputs button (this runs self._execute in the background)
         # Note: this is also bound to <Enter> in the window setup func.
         execute_button = ttk.Button(
             root,
             text='Execute',
-            command=self._execute,
+            command=self._start,
         )
         execute_button.grid(row=6, column=2, padx=10, pady=3, sticky='w')
         self._objects['execute_button'] = execute_button
+        # Progress of a running job
+        progress_bar = ttk.Progressbar(
+            root,
+            orient='horizontal',
+            mode='determinate',
+            length=480,
+        )
+        progress_bar.grid(row=6, column=1, padx=10, pady=3, sticky='w')
+        self._objects['progress_bar'] = progress_bar
+        #######################################################################
+        # Row 8 STATUS
+        #######################################################################
+        # Status text (rows written so far) and associated variable
+        status_var = tk.StringVar()
+        self._objects['status_var'] = status_var
+        status_label = ttk.Label(root, textvariable=status_var)
+        status_label.grid(row=7, column=1, padx=10, sticky='w')
+        self._objects['status_label'] = status_label
+        # Cancel button (only enabled while a job is running)
+        cancel_button = ttk.Button(
+            root,
+            text='Cancel',
+            command=self._cancel,
+        )
+        cancel_button.state(['disabled'])
+        cancel_button.grid(row=7, column=2, padx=10, pady=3, sticky='w')
+        self._objects['cancel_button'] = cancel_button
 
-    def _check_inputs(self, df):
+    def _check_inputs(self, df, settings):
         """Take DF and raise error if improper column names given"""
         # Create shortnames for variables
-        first_name_var = self._objects['first_name_var'].get()
-        surname_var = self._objects['surname_var'].get()
-        zip_var = self._objects['zip_var'].get()
-        model_var = self._objects['model_var'].get()
+        first_name_var = settings['first_name_var']
+        surname_var = settings['surname_var']
+        zip_var = settings['zip_var']
+        model_var = settings['model_var']
         # If it's first name, make sure column is there. Otherwise error.
         if model_var == 'First Name':
             if first_name_var not in df.columns:
@@ -323,99 +367,252 @@ class SurgeoGUI(object):
                 raise SurgeoException(f'{surname_var} not in input data. '
                                       f'Columns are: {df.columns}.')
 
-    def _load_df(self, input_path):
-        """This creates a dataframe based on self._input_path"""
-        path = pathlib.Path(input_path)
-        suffix = path.suffix
-        # If it's excel, read_excel()
-        if suffix == '.xlsx' or suffix == 'xls':
-            df = pd.read_excel(path, engine='openpyxl')
-        # If CSV, read read_csv()
-        elif suffix == '.csv':
-            df = pd.read_csv(path, skip_blank_lines=False)
-        # If path is unrecognized, throw error
-        else:
-            raise SurgeoException(
-                f'File ending for "{path}" not '
-                'recognized. Please use .csv or .xlsx.'
+    def _get_settings(self):
+        """Copy the user inputs out of the tkinter variables
+
+        The job runs on a worker thread, which must not touch tkinter, so
+        it is given this copy instead.
+
+        """
+        return {
+            name: self._objects[name].get()
+            for name in [
+                'input_var',
+                'output_var',
+                'first_name_var',
+                'surname_var',
+                'zip_var',
+                'model_var',
+            ]
+        }
+
+    def _model_columns(self, settings):
+        """The input columns used by the selected model"""
+        first_name_var = settings['first_name_var']
+        surname_var = settings['surname_var']
+        zip_var = settings['zip_var']
+        columns = {
+            'BIFSG': [first_name_var, surname_var, zip_var],
+            'First Name': [first_name_var],
+            'Geocode': [zip_var],
+            'Surname': [surname_var],
+        }.get(settings['model_var'], [surname_var, zip_var])
+        return list(dict.fromkeys(columns))
+
+    def _get_model(self, model_var):
+        """Instantiate the selected model"""
+        model_class = {
+            'BIFSG': BIFSGModel,
+            'First Name': FirstNameModel,
+            'Geocode': GeocodeModel,
+            'Surname': SurnameModel,
+        }.get(model_var, SurgeoModel)
+        return model_class()
+
+    def _score(self, model, settings, input_df):
+        """Run the selected model over one chunk of the input"""
+        first_name_var = settings['first_name_var']
+        surname_var = settings['surname_var']
+        zip_var = settings['zip_var']
+        model_var = settings['model_var']
+        # If BIFSG, it takes first name, surname and ZIP
+        if model_var == 'BIFSG':
+            return model.get_probabilities(
+                input_df[first_name_var],
+                input_df[surname_var],
+                input_df[zip_var]
+            )
+        # If first name, run the first name model on its column
+        elif model_var == 'First Name':
+            return model.get_probabilities(input_df[first_name_var])
+        # If geo, run the geo model on the ZIP column
+        elif model_var == 'Geocode':
+            return model.get_probabilities(input_df[zip_var])
+        # If sur, run the sur model on the surname column
+        elif model_var == 'Surname':
+            return model.get_probabilities(input_df[surname_var])
+        # If surgeo, note that it takes two input columns unlike others
+        else: # model_var == 'Surgeo (Surname + Geocode)':
+            return model.get_probabilities(
+                input_df[surname_var],
+                input_df[zip_var]
             )
-        return df
 
-    def _execute(self, event=None, show_msgbox=True):
+    def _run_job(self, settings, on_progress=None, cancel_event=None):
+        """Stream the input through the model a chunk at a time
+
+        Only one chunk is held in memory at once, so inputs larger than
+        memory can be scored. After each chunk, on_progress is called with
+        the rows written so far and the total (None if unknown). If
+        cancel_event is set, the job stops at the next chunk. A partial
+        output (from cancelling or an error) is deleted.
+
+        Returns
+        -------
+        int
+            The number of rows written, or None if the job was cancelled
+
+        """
+        input_path = pathlib.Path(settings['input_var'])
+        output_path = pathlib.Path(settings['output_var'])
+        # Check both endings before spending time on the models
+        surgeo_io.file_format(output_path)
+        total_rows = surgeo_io.count_rows(input_path)
+        model = self._get_model(settings['model_var'])
+        chunks = surgeo_io.iter_tables(
+            input_path,
+            self._CHUNKSIZE,
+            self._model_columns(settings),
+            # ZIP codes stay strings, whatever the types in each chunk
+            [settings['zip_var']],
+        )
+        rows_written = 0
+        writing = False
+        finished = False
+        try:
+            with surgeo_io.TableWriter(output_path) as writer:
+                for input_df in chunks:
+                    if cancel_event is not None and cancel_event.is_set():
+                        return None
+                    # Ensure the inputs are OK
+                    if not rows_written:
+                        self._check_inputs(input_df, settings)
+                    output_df = self._score(model, settings, input_df)
+                    writing = True
+                    writer.write(output_df)
+                    rows_written += len(input_df)
+                    if on_progress is not None:
+                        on_progress(rows_written, total_rows)
+            finished = True
+        finally:
+            chunks.close()
+            # Don't leave a partial output behind
+            if writing and not finished:
+                output_path.unlink(missing_ok=True)
+        return rows_written
+
+    def _start(self, event=None):
+        """Run the analysis on a worker thread (button and enter key)"""
+        if self._job is None:
+            self._execute(event, background=True)
+
+    def _cancel(self):
+        """Ask the running job to stop after its current chunk"""
+        if self._job is not None:
+            self._job['cancel_event'].set()
+            self._objects['status_var'].set('Cancelling...')
+
+    def _execute(self, event=None, show_msgbox=True, background=False):
         """This takes all the user inputs and runs the analysis.
 
         It can be triggered by the enter key (in which case it supplied an
         event), or it can be triggered by clicking the "Execute" button.
         The outcome in either event is identical.
 
+        If background is True, the analysis runs on a worker thread while
+        the window shows its progress and offers a Cancel button; otherwise
+        this blocks until the results are written.
+
         """
+        settings = self._get_settings()
+        if not background:
+            try:
+                rows_written = self._run_job(settings)
+                self._finish(('done', rows_written), show_msgbox)
+            except Exception:
+                self._finish(('error', traceback.format_exc()), show_msgbox)
+            return
+        # The worker reports back through a queue polled by the main loop
+        self._job = {
+            'cancel_event': threading.Event(),
+            'messages': queue.Queue(),
+            'show_msgbox': show_msgbox,
+        }
+        self._job['thread'] = threading.Thread(
+            target=self._run_worker,
+            args=(settings, self._job),
+            daemon=True,
+        )
+        self._objects['execute_button'].state(['disabled'])
+        self._objects['cancel_button'].state(['!disabled'])
+        self._objects['status_var'].set('Loading model...')
+        self._set_progress(0, None)
+        self._job['thread'].start()
+        self._objects['root'].after(self._POLL_MS, self._poll_job)
 
-        # Get tkinter variables and stuff strings in short names.
-        # Input path from file selection
-        input_var = self._objects['input_var'].get()
-        # Output path from file selection
-        output_var = self._objects['output_var'].get()
-        # Surname column header from text field
-        first_name_var = self._objects['first_name_var'].get()
-        # Surname column header from text field
-        surname_var = self._objects['surname_var'].get()
-        # ZCTA column header from text field
-        zip_var = self._objects['zip_var'].get()
-        # Model being run from drop down window
-        model_var = self._objects['model_var'].get()
-        # Output path suffix (to determine if .csv or .xlsx)
-        suffix = pathlib.Path(output_var).suffix
-        # This large try block captures any errors for error window
+    def _run_worker(self, settings, job):
+        """Worker thread body: run the job and queue progress and outcome"""
+        def on_progress(rows_written, total_rows):
+            job['messages'].put(('progress', rows_written, total_rows))
         try:
-            # Load the dataframe
-            input_df = self._load_df(input_var)
-            # Ensure the inputs are OK
-            self._check_inputs(input_df)
-            # If first name, run the first name model assign result to df
-            if model_var == 'BIFSG':
-                bifsg = BIFSGModel()
-                output_df = bifsg.get_probabilities(
-                    input_df[first_name_var],
-                    input_df[surname_var],
-                    input_df[zip_var]
-                )
-            # If first name, run the first name model assign result to df
-            elif model_var == 'First Name':
-                first = FirstNameModel()
-                output_df = first.get_probabilities(input_df[first_name_var])
-            # If geo, run the geo model assign result to df
-            elif model_var == 'Geocode':
-                geo = GeocodeModel()
-                output_df = geo.get_probabilities(input_df[zip_var])
-            # If sur, run the sur model and assign result to df
-            elif model_var == 'Surname':
-                sur = SurnameModel()
-                output_df = sur.get_probabilities(input_df[surname_var])
-            # If surgeo, run the surgeo model and assign to df
-            else: # model_var == 'Surgeo (Surname + Geocode)':
-                surgeo = SurgeoModel()
-                # Note that surgeo takes two input columns unlike others
-                output_df = surgeo.get_probabilities(
-                    input_df[surname_var],
-                    input_df[zip_var]
-                )
-            # If output is .xlsx, write to Excel
-            if suffix == '.xlsx':
-                output_df.to_excel(output_var, index=False)
-            # Otherwise write to CSV
+            rows_written = self._run_job(settings, on_progress, job['cancel_event'])
+            if rows_written is None:
+                job['messages'].put(('cancelled',))
             else:
-                output_df.to_csv(output_var, index=False)
-            # Show message on success
-            if show_msgbox:
-                messagebox.showinfo(
-                    'Success',
-                    f'{len(output_df)} items successfully written.'
-                )
+                job['messages'].put(('done', rows_written))
         except Exception:
-            # Show error box on fail
-            err = traceback.format_exc()
-            if show_msgbox:
-                messagebox.showerror('Error', err)
+            job['messages'].put(('error', traceback.format_exc()))
+
+    def _poll_job(self):
+        """Show the worker's progress and its outcome once it finishes"""
+        job = self._job
+        while True:
+            try:
+                message = job['messages'].get_nowait()
+            except queue.Empty:
+                break
+            if message[0] == 'progress':
+                self._set_progress(*message[1:])
+                continue
+            self._job = None
+            self._objects['execute_button'].state(['!disabled'])
+            self._objects['cancel_button'].state(['disabled'])
+            self._finish(message, job['show_msgbox'])
+            return
+        self._objects['root'].after(self._POLL_MS, self._poll_job)
+
+    def _set_progress(self, rows_written, total_rows):
+        """Update the progress bar and the status text"""
+        progress_bar = self._objects['progress_bar']
+        if total_rows:
+            progress_bar.stop()
+            progress_bar.configure(mode='determinate')
+            progress_bar['value'] = min(100, 100 * rows_written / total_rows)
+            status = f'{rows_written:,} of {total_rows:,} rows'
+        else:
+            # Without a row count the bar just shows that work is going on
+            if str(progress_bar['mode']) != 'indeterminate':
+                progress_bar.configure(mode='indeterminate')
+                progress_bar.start()
+            status = f'{rows_written:,} rows'
+        if rows_written:
+            self._objects['status_var'].set(status)
+
+    def _finish(self, message, show_msgbox):
+        """Reset the progress display and report how the job ended"""
+        if 'progress_bar' in self._objects:
+            progress_bar = self._objects['progress_bar']
+            progress_bar.stop()
+            progress_bar.configure(mode='determinate')
+            progress_bar['value'] = 100 if message[0] == 'done' else 0
+            self._objects['status_var'].set({
+                'done': 'Finished',
+                'cancelled': 'Cancelled',
+                'error': 'Failed',
+            }[message[0]])
+        if not show_msgbox:
+            return
+        # Show message on success
+        if message[0] == 'done':
+            messagebox.showinfo(
+                'Success',
+                f'{message[1]} items successfully written.'
+            )
+        elif message[0] == 'cancelled':
+            messagebox.showinfo('Cancelled', 'No output was written.')
+        # Show error box on fail
+        else:
+            messagebox.showerror('Error', message[1])
 
 
 if __name__ == '__main__':
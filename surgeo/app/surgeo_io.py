@@ -0,0 +1,529 @@
+"""Module containing the file readers and writers used by the applications.
+
+The CLI and GUI read their input and write their output through this
+module, which picks the format from the file name:
+
+* ``.csv``, optionally compressed as ``.csv.gz`` or ``.csv.zst`` (zstandard
+  compression needs the optional ``zstandard`` package);
+* ``.parquet``;
+* ``.feather`` or ``.arrow`` (the Arrow IPC file format); and,
+* ``.xlsx`` or ``.xls``.
+
+Only the columns that are asked for are parsed (or, for parquet and
+feather, read at all), and every format can be read and written a chunk at
+a time. Excel workbooks are streamed row by row, so they are never held in
+memory whole; results longer than a sheet's row limit continue on further
+sheets, which are read back as one table.
+
+"""
+
+import pathlib
+
+import pandas as pd
+
+from surgeo.utility.surgeo_exception import SurgeoException
+
+
+CSV = 'csv'
+
+PARQUET = 'parquet'
+
+FEATHER = 'feather'
+
+EXCEL = 'excel'
+
+# File endings of each format (compressed CSVs are checked first)
+_SUFFIXES = {
+    ('.csv', '.gz'): CSV,
+    ('.csv', '.zst'): CSV,
+    ('.csv', '.zstd'): CSV,
+    ('.csv',): CSV,
+    ('.parquet',): PARQUET,
+    ('.feather',): FEATHER,
+    ('.arrow',): FEATHER,
+    ('.xlsx',): EXCEL,
+    ('.xls',): EXCEL,
+}
+
+SUPPORTED_SUFFIXES = ', '.join(''.join(suffixes) for suffixes in _SUFFIXES)
+
+# Rows in an Excel sheet, including the header
+EXCEL_MAX_ROWS = 1_048_576
+
+# Rows converted to a dataframe at a time when reading a whole workbook
+_EXCEL_CHUNKSIZE = 100_000
+
+
+def file_format(path) -> str:
+    """Identify the format of a file from its name
+
+    Parameters
+    ----------
+    path : Union[str, pathlib.Path]
+        The file path
+
+    Returns
+    -------
+    str
+        One of CSV, PARQUET, FEATHER or EXCEL
+
+    Raises
+    ------
+    SurgeoException
+        If the file ending is not recognized
+
+    """
+    suffixes = tuple(suffix.lower() for suffix in pathlib.Path(path).suffixes)
+    for known_suffixes, format_name in _SUFFIXES.items():
+        if suffixes[-len(known_suffixes):] == known_suffixes:
+            return format_name
+    raise SurgeoException(
+        f'File ending for "{path}" not recognized. '
+        f'Please use one of {SUPPORTED_SUFFIXES}.'
+    )
+
+
+def read_table(path, columns: list = None, text_columns: list = None) -> pd.DataFrame:
+    """Read a whole file into a dataframe
+
+    Parameters
+    ----------
+    path : Union[str, pathlib.Path]
+        The file to read
+    columns : list
+        Columns to read, in the order they should be returned (all of them
+        if None). The other columns are skipped while parsing, or not read
+        at all from parquet and feather files.
+    text_columns : list
+        Columns of CSV and Excel files to read as strings rather than
+        numbers (e.g. ZIP codes, whose leading zeros would otherwise be lost)
+
+    Returns
+    -------
+    pd.DataFrame
+        The file's data
+
+    """
+    format_name = file_format(path)
+    if format_name == PARQUET:
+        import pyarrow.parquet as pq
+
+        columns = _existing(pq.read_schema(path).names, columns, path)
+        return pq.read_table(path, columns=columns).to_pandas()
+    if format_name == FEATHER:
+        return _read_arrow_file(path, columns).to_pandas()
+    if format_name == EXCEL:
+        chunks = list(_iter_excel(path, _EXCEL_CHUNKSIZE, columns, text_columns))
+        return pd.concat(chunks, ignore_index=True)
+    return _with_columns(
+        pd.read_csv,
+        path,
+        columns,
+        skip_blank_lines=False,
+        compression=_compression(path),
+        dtype=_text_dtypes(text_columns),
+    )
+
+
+def iter_tables(path, chunksize: int, columns: list = None, text_columns: list = None):
+    """Read a file as a series of dataframes of at most chunksize rows
+
+    Parameters
+    ----------
+    path : Union[str, pathlib.Path]
+        The file to read
+    chunksize : int
+        The most rows per dataframe
+    columns : list
+        Columns to read (all of them if None)
+    text_columns : list
+        Columns of CSV and Excel files to read as strings. Without this a
+        column's type is inferred from each chunk on its own, so e.g. ZIP
+        codes in a chunk with a blank one would be read as floats.
+
+    Yields
+    ------
+    pd.DataFrame
+        Consecutive row chunks of the file, each with a fresh RangeIndex
+
+    """
+    format_name = file_format(path)
+    if format_name == PARQUET:
+        import pyarrow.parquet as pq
+
+        parquet_file = pq.ParquetFile(path)
+        columns = _existing(parquet_file.schema_arrow.names, columns, path)
+        for batch in parquet_file.iter_batches(batch_size=chunksize, columns=columns):
+            yield batch.to_pandas()
+    elif format_name == FEATHER:
+        # Memory-mapped, so only the chunk being converted is in memory
+        table = _read_arrow_file(path, columns)
+        for start in range(0, table.num_rows, chunksize):
+            yield table.slice(start, chunksize).to_pandas()
+    elif format_name == CSV:
+        reader = _with_columns(
+            pd.read_csv,
+            path,
+            columns,
+            skip_blank_lines=False,
+            chunksize=chunksize,
+            compression=_compression(path),
+            dtype=_text_dtypes(text_columns),
+        )
+        with reader:
+            for chunk in reader:
+                if columns is not None:
+                    chunk = chunk[columns]
+                yield chunk.reset_index(drop=True)
+    else:
+        yield from _iter_excel(path, chunksize, columns, text_columns)
+
+
+def count_rows(path) -> int:
+    """Count (or estimate) the data rows in a file without reading it all
+
+    Parquet and feather files record their row counts, and Excel sheets
+    their dimensions. Uncompressed CSVs are scanned for line breaks, which
+    overcounts rows whose quoted values span lines. Returns None when the
+    count isn't available cheaply (compressed CSVs and legacy workbooks).
+
+    """
+    format_name = file_format(path)
+    if format_name == PARQUET:
+        import pyarrow.parquet as pq
+
+        return pq.ParquetFile(path).metadata.num_rows
+    if format_name == FEATHER:
+        return _read_arrow_file(path).num_rows
+    if format_name == EXCEL:
+        return _count_excel_rows(path)
+    if _compression(path) is not None:
+        return None
+    line_breaks = 0
+    last_block = b''
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            line_breaks += block.count(b'\n')
+            last_block = block
+    # The header is a line, and the last line may not end with a line break
+    unterminated = 1 if last_block and not last_block.endswith(b'\n') else 0
+    return max(line_breaks + unterminated - 1, 0)
+
+
+def write_table(df: pd.DataFrame, path) -> None:
+    """Write a dataframe to a file in the format given by its name"""
+    with TableWriter(path) as writer:
+        writer.write(df)
+
+
+class TableWriter(object):
+    """Writes dataframes to one file, a chunk at a time.
+
+    The first chunk fixes the columns (and, for parquet and feather, the
+    schema); later chunks are appended to it. Excel workbooks are written
+    row by row in openpyxl's write-only mode; once a sheet is full, the
+    rows continue on a new sheet (Sheet2, Sheet3, ...) under the same
+    header.
+
+    Parameters
+    ----------
+    path : Union[str, pathlib.Path]
+        The file to write (its name gives the format)
+
+    Example
+    -------
+        .. code-block:: python
+
+            with TableWriter('output.parquet') as writer:
+                for chunk in chunks:
+                    writer.write(chunk)
+
+    """
+
+    def __init__(self, path):
+        self._path = pathlib.Path(path)
+        self._format = file_format(path)
+        self._writer = None
+        self._schema = None
+        self._chunks_written = 0
+        self._sheet = None
+        self._sheet_rows = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def write(self, df: pd.DataFrame) -> None:
+        """Append a dataframe to the file"""
+        if self._format == CSV:
+            df.to_csv(
+                self._path,
+                index=False,
+                mode='a' if self._chunks_written else 'w',
+                header=not self._chunks_written,
+                compression=_compression(self._path),
+            )
+        elif self._format == EXCEL:
+            self._write_excel(df)
+        else:
+            self._write_arrow(df)
+        self._chunks_written += 1
+
+    def close(self) -> None:
+        """Finish the file (required for parquet, feather and Excel)"""
+        if self._writer is None:
+            return
+        if self._format == EXCEL:
+            self._writer.save(self._path)
+        else:
+            self._writer.close()
+        self._writer = None
+
+    def _write_excel(self, df: pd.DataFrame) -> None:
+        """Append a chunk's rows to the workbook, starting sheets as needed"""
+        if self._writer is None:
+            import openpyxl
+
+            if self._path.suffix.lower() != '.xlsx':
+                raise SurgeoException(
+                    f'"{self._path}" cannot be written. '
+                    f'Please specify a path ending in ".xlsx".'
+                )
+            self._writer = openpyxl.Workbook(write_only=True)
+            self._header = [str(column) for column in df.columns]
+        # Missing values become empty cells rather than NaN
+        values = df.astype(object).where(df.notna(), None)
+        for row in values.itertuples(index=False, name=None):
+            if self._sheet is None or self._sheet_rows >= EXCEL_MAX_ROWS:
+                self._add_sheet()
+            self._sheet.append(row)
+            self._sheet_rows += 1
+        if self._sheet is None:
+            # An empty result still gets a header
+            self._add_sheet()
+
+    def _add_sheet(self) -> None:
+        """Start a new sheet with the header row"""
+        self._sheet = self._writer.create_sheet(f'Sheet{len(self._writer.worksheets) + 1}')
+        self._sheet.append(self._header)
+        self._sheet_rows = 1
+
+    def _write_arrow(self, df: pd.DataFrame) -> None:
+        """Convert a chunk to Arrow and write it with the format's writer"""
+        import pyarrow as pa
+
+        if self._schema is None:
+            table = pa.Table.from_pandas(df, preserve_index=False)
+            self._schema = table.schema
+            if self._format == PARQUET:
+                import pyarrow.parquet as pq
+
+                self._writer = pq.ParquetWriter(self._path, self._schema)
+            else:
+                self._writer = pa.ipc.new_file(str(self._path), self._schema)
+        else:
+            # Every chunk of a file must have the same schema
+            table = pa.Table.from_pandas(df, schema=self._schema, preserve_index=False)
+        self._writer.write_table(table)
+
+
+def _read_arrow_file(path, columns: list = None):
+    """Memory-map an Arrow IPC (feather) file as a table"""
+    import pyarrow as pa
+
+    table = pa.ipc.open_file(pa.memory_map(str(path))).read_all()
+    if columns is not None:
+        table = table.select(_existing(table.column_names, columns, path))
+    return table
+
+
+def _iter_excel(path, chunksize: int, columns: list = None, text_columns: list = None):
+    """Stream a workbook's rows as dataframes of at most chunksize rows
+
+    Rows are read from the first sheet and then from any following sheets
+    that have the same header (i.e. a result split across sheets). Blank
+    rows are kept, except at the end of a sheet.
+
+    """
+    header = None
+    rows = []
+    chunks_yielded = 0
+    for sheet_rows in _excel_sheets(path):
+        sheet_header = next(sheet_rows, None)
+        if sheet_header is None:
+            continue
+        sheet_header = [
+            f'Unnamed: {i}' if value is None else str(value)
+            for i, value in enumerate(_trim(sheet_header))
+        ]
+        if header is None:
+            header = sheet_header
+            names = _existing(header, columns, path) or header
+            positions = [header.index(name) for name in names]
+        elif sheet_header != header:
+            # Only continuation sheets are part of the table
+            break
+        blank_rows = 0
+        for row in sheet_rows:
+            if all(value is None for value in row):
+                blank_rows += 1
+                continue
+            rows.extend([(None,) * len(positions)] * blank_rows)
+            blank_rows = 0
+            rows.append(tuple(
+                row[position] if position < len(row) else None
+                for position in positions
+            ))
+            while len(rows) >= chunksize:
+                yield _excel_frame(rows[:chunksize], names, text_columns)
+                chunks_yielded += 1
+                rows = rows[chunksize:]
+    if header is None:
+        raise SurgeoException(f'No data found in "{path}".')
+    # An empty sheet still yields a frame with its columns
+    if rows or not chunks_yielded:
+        yield _excel_frame(rows, names, text_columns)
+
+
+def _excel_frame(rows: list, names: list, text_columns: list = None) -> pd.DataFrame:
+    """Turn rows of cell values into a dataframe with inferred types"""
+    df = pd.DataFrame(rows, columns=names)
+    for name in text_columns or []:
+        if name in df.columns:
+            df[name] = df[name].map(_cell_text, na_action='ignore')
+    return df.infer_objects()
+
+
+def _cell_text(value) -> str:
+    """A cell value as a string (whole numbers without a trailing '.0')"""
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    return str(value)
+
+
+def _text_dtypes(text_columns: list) -> dict:
+    """The read_csv dtype argument for columns read as strings"""
+    if not text_columns:
+        return None
+    return {name: str for name in text_columns}
+
+
+def _excel_sheets(path):
+    """Yield an iterator of row tuples for each sheet of a workbook
+
+    python-calamine is used if it is installed (it is several times faster
+    than openpyxl and reads .xls as well); otherwise .xlsx files are read
+    with openpyxl's read-only mode, which streams rows from disk.
+
+    """
+    try:
+        import python_calamine
+    except ImportError:
+        python_calamine = None
+    if python_calamine is not None:
+        workbook = python_calamine.CalamineWorkbook.from_path(str(path))
+        for sheet_name in workbook.sheet_names:
+            sheet = workbook.get_sheet_by_name(sheet_name)
+            # Calamine reads empty cells as empty strings
+            yield (
+                tuple(None if value == '' else value for value in row)
+                for row in sheet.iter_rows()
+            )
+    elif pathlib.Path(path).suffix.lower() == '.xlsx':
+        import openpyxl
+
+        workbook = openpyxl.load_workbook(path, read_only=True, data_only=True)
+        try:
+            for sheet in workbook.worksheets:
+                yield sheet.iter_rows(values_only=True)
+        finally:
+            workbook.close()
+    else:
+        # Legacy .xls workbooks can't be streamed without calamine
+        for _, df in pd.read_excel(path, sheet_name=None, header=None).items():
+            df = df.astype(object).where(df.notna(), None)
+            yield df.itertuples(index=False, name=None)
+
+
+def _count_excel_rows(path) -> int:
+    """Data rows in a workbook's table according to its sheet dimensions"""
+    if pathlib.Path(path).suffix.lower() != '.xlsx':
+        return None
+    import openpyxl
+
+    workbook = openpyxl.load_workbook(path, read_only=True, data_only=True)
+    try:
+        header = None
+        rows = 0
+        for sheet in workbook.worksheets:
+            sheet_header = next(sheet.iter_rows(max_row=1, values_only=True), None)
+            if sheet_header is None:
+                continue
+            if header is None:
+                header = _trim(sheet_header)
+            elif _trim(sheet_header) != header:
+                break
+            if sheet.max_row is None:
+                return None
+            rows += sheet.max_row - 1
+        return rows
+    finally:
+        workbook.close()
+
+
+def _trim(row) -> tuple:
+    """Drop the empty cells at the end of a row"""
+    row = tuple(row)
+    while row and row[-1] is None:
+        row = row[:-1]
+    return row
+
+
+def _with_columns(reader, path, columns: list, **kwargs):
+    """Call a pandas reader that parses only the given columns (usecols)
+
+    Single frames are returned with their columns in the requested order;
+    chunked readers (which yield frames in file order) are returned as is.
+
+    """
+    try:
+        result = reader(path, usecols=columns, **kwargs)
+    except ValueError as e:
+        # pandas reports missing usecols as a ValueError
+        if columns is None or 'usecols' not in str(e).lower():
+            raise
+        raise SurgeoException(f'Reading "{path}" failed. {e}')
+    if columns is not None and isinstance(result, pd.DataFrame):
+        result = result[columns]
+    return result
+
+
+def _existing(available, columns: list, path) -> list:
+    """Check that the requested columns are present"""
+    if columns is None:
+        return None
+    missing = [column for column in columns if column not in list(available)]
+    if missing:
+        raise SurgeoException(
+            f'Columns {missing} not found in "{path}". '
+            f'Columns are: {list(available)}.'
+        )
+    return list(columns)
+
+
+def _compression(path) -> str:
+    """The pandas compression of a CSV path (checking zstandard is there)"""
+    suffix = pathlib.Path(path).suffix.lower()
+    if suffix == '.gz':
+        return 'gzip'
+    if suffix in ('.zst', '.zstd'):
+        try:
+            import zstandard
+        except ImportError:
+            raise SurgeoException(
+                f'Reading or writing "{path}" requires the zstandard package.'
+            )
+        return 'zstd'
+    return None
@@ -0,0 +1,535 @@
+"""Module containing a long-running local scoring server."""
+
+import argparse
+import collections
+import http.server
+import io
+import json
+import os
+import socketserver
+import sys
+import threading
+import time
+import traceback
+import urllib.parse
+
+import numpy as np
+import pandas as pd
+
+from surgeo.utility.surgeo_exception import SurgeoException
+from surgeo.models.bifsg_model import BIFSGModel
+from surgeo.models.first_name_model import FirstNameModel
+from surgeo.models.geocode_model import GeocodeModel
+from surgeo.models.surgeo_model import SurgeoModel
+from surgeo.models.surname_model import SurnameModel
+
+
+# Media type of Arrow IPC stream payloads
+ARROW_STREAM_TYPE = 'application/vnd.apache.arrow.stream'
+
+JSON_TYPE = 'application/json'
+
+
+class ServerMetrics(object):
+    """Thread-safe request counters and latency percentiles
+
+    Latencies are kept for the most recent requests of each model type
+    (a bounded window), so the percentiles describe recent traffic.
+
+    """
+
+    _WINDOW = 10_000
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._started = time.time()
+        self._in_flight = 0
+        self._max_in_flight = 0
+        self._requests = collections.Counter()
+        self._errors = collections.Counter()
+        self._rows = collections.Counter()
+        self._latencies = collections.defaultdict(
+            lambda: collections.deque(maxlen=self._WINDOW)
+        )
+
+    def start(self) -> None:
+        """Record a request entering the server"""
+        with self._lock:
+            self._in_flight += 1
+            self._max_in_flight = max(self._max_in_flight, self._in_flight)
+
+    def finish(self, endpoint: str, seconds: float, rows: int = 0, error: bool = False) -> None:
+        """Record a request leaving the server"""
+        with self._lock:
+            self._in_flight -= 1
+            self._requests[endpoint] += 1
+            self._rows[endpoint] += rows
+            if error:
+                self._errors[endpoint] += 1
+            self._latencies[endpoint].append(seconds)
+
+    def snapshot(self) -> dict:
+        """The current metrics as a JSON-serializable dictionary"""
+        with self._lock:
+            endpoints = {}
+            for endpoint, count in self._requests.items():
+                latencies = np.array(self._latencies[endpoint]) * 1000
+                p50, p90, p99 = np.percentile(latencies, [50, 90, 99])
+                endpoints[endpoint] = {
+                    'requests': count,
+                    'errors': self._errors[endpoint],
+                    'rows': self._rows[endpoint],
+                    'latency_ms': {
+                        'mean': float(latencies.mean()),
+                        'p50': float(p50),
+                        'p90': float(p90),
+                        'p99': float(p99),
+                        'max': float(latencies.max()),
+                    },
+                }
+            return {
+                'uptime_seconds': time.time() - self._started,
+                'in_flight': self._in_flight,
+                'max_in_flight': self._max_in_flight,
+                'requests': sum(self._requests.values()),
+                'errors': sum(self._errors.values()),
+                'endpoints': endpoints,
+            }
+
+
+class _BodyError(Exception):
+    """A request body that can't be read, with the status to reply with"""
+
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+
+
+class _ScoringHandler(http.server.BaseHTTPRequestHandler):
+    """Routes HTTP requests to the SurgeoServer that owns the listener"""
+
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        path = urllib.parse.urlparse(self.path).path
+        if path == '/health':
+            self._send_json(200, {'status': 'ok'})
+        elif path == '/metrics':
+            self._send_json(200, self.server.surgeo.metrics.snapshot())
+        else:
+            self._send_json(404, {'error': f'No such endpoint: {path}'})
+
+    def do_POST(self):
+        url = urllib.parse.urlparse(self.path)
+        parts = url.path.strip('/').split('/')
+        if len(parts) != 2 or parts[0] != 'score':
+            self._send_json(404, {'error': f'No such endpoint: {url.path}'})
+            return
+        model_type = parts[1]
+        query = urllib.parse.parse_qs(url.query)
+        geo_level = query.get('geo_level', ['ZCTA'])[0].upper()
+        endpoint = self.server.surgeo.endpoint_name(model_type, geo_level)
+        metrics = self.server.surgeo.metrics
+        metrics.start()
+        start = time.perf_counter()
+        rows = 0
+        try:
+            body = self._read_body()
+            content_type = self.headers.get('Content-Type', JSON_TYPE).split(';')[0]
+            df = self.server.surgeo.read_payload(body, content_type)
+            rows = len(df)
+            result = self.server.surgeo.score(model_type, geo_level, df)
+            accept = self.headers.get('Accept', content_type)
+            if ARROW_STREAM_TYPE in accept:
+                status, body, content_type = (
+                    200,
+                    self.server.surgeo.write_arrow(result),
+                    ARROW_STREAM_TYPE,
+                )
+            else:
+                status, body, content_type = (
+                    200,
+                    result.to_json(orient='split', index=False).encode(),
+                    JSON_TYPE,
+                )
+        except _BodyError as e:
+            # The unread body would be parsed as the next request
+            self.close_connection = True
+            status, body, content_type = e.status, self._json({'error': str(e)}), JSON_TYPE
+        except (SurgeoException, KeyError, ValueError) as e:
+            status, body, content_type = 400, self._json({'error': str(e)}), JSON_TYPE
+        except Exception as e:
+            traceback.print_exc()
+            status, body, content_type = (
+                500,
+                self._json({'error': f'{type(e).__name__}: {e}'}),
+                JSON_TYPE,
+            )
+        # Recorded before replying, so a client sees its request in /metrics
+        metrics.finish(endpoint, time.perf_counter() - start, rows, status != 200)
+        self._send(status, body, content_type)
+
+    def _read_body(self) -> bytes:
+        """Read the request body, checking its Content-Length first"""
+        length = self.headers.get('Content-Length')
+        if length is None:
+            raise _BodyError(411, 'Content-Length is required.')
+        length = length.strip()
+        if not (length.isascii() and length.isdigit()):
+            raise _BodyError(400, f'Invalid Content-Length: "{length}".')
+        max_body_size = self.server.surgeo.max_body_size
+        if int(length) > max_body_size:
+            raise _BodyError(413, f'Bodies are limited to {max_body_size} bytes.')
+        return self.rfile.read(int(length))
+
+    def _json(self, payload: dict) -> bytes:
+        return json.dumps(payload).encode()
+
+    def _send_json(self, status: int, payload: dict) -> None:
+        self._send(status, self._json(payload), JSON_TYPE)
+
+    def _send(self, status: int, body: bytes, content_type: str) -> None:
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def address_string(self):
+        # Unix socket clients have no address
+        return self.client_address[0] if self.client_address else self.server.server_address
+
+    def log_message(self, format, *args):
+        if self.server.surgeo.verbose:
+            super().log_message(format, *args)
+
+
+class _TCPServer(http.server.ThreadingHTTPServer):
+    daemon_threads = True
+
+
+class _UnixServer(socketserver.ThreadingUnixStreamServer):
+    daemon_threads = True
+
+
+class SurgeoServer(object):
+    """A local HTTP server that scores batches against warm models
+
+    Starting Python, importing pandas and loading the reference tables
+    costs far more than scoring a small batch. This server loads its
+    models once and then scores every request against them, so callers
+    that send many small batches only pay the scoring cost.
+
+    Requests are handled on a thread per connection. Models are created
+    on first use (or up front with preload) and shared by every request;
+    the block-level BIFSG model keeps a cache of state tables, so its
+    requests are serialized.
+
+    Endpoints
+    ---------
+    POST /score/<type>?geo_level=<level>
+        Score a batch. The type is one of "first", "sur", "geo", "surgeo"
+        or "bifsg" and the geo level one of "ZCTA" (default), "TRACT" or
+        "BLOCK" (bifsg only). The body is either JSON (an object of
+        columns or a list of records) or an Arrow IPC stream
+        (Content-Type: application/vnd.apache.arrow.stream). Inputs use
+        the CLI's default column names: "first_name", "name", and
+        "zcta5", "block" or "state"/"county"/"tract" depending on the geo
+        level. Results are returned as JSON in pandas' "split" layout, or
+        as an Arrow stream if that is the request's type or Accept header.
+    GET /metrics
+        Request, error and row counts plus latency percentiles per model,
+        and the number of requests in flight
+    GET /health
+        Returns {"status": "ok"}
+
+    Parameters
+    ----------
+    host : str
+        Interface to listen on (ignored if socket_path is given)
+    port : int
+        TCP port to listen on (0 picks a free port)
+    socket_path : str
+        Listen on this Unix domain socket instead of TCP
+    dtype : str
+        Precision of the models ('float64' or 'float32')
+    preload : list
+        (type, geo level) pairs of models to load before serving
+    verbose : bool
+        Whether to log every request to stderr
+    max_body_size : int
+        The largest request body accepted, in bytes (larger ones get a 413)
+
+    Example
+    -------
+        .. code-block::
+
+            $ python -m surgeo serve --port 8000
+            $ curl -X POST localhost:8000/score/surgeo \\
+                -d '{"name": ["SMITH"], "zcta5": ["63144"]}'
+
+    """
+
+    _MODEL_CLASSES = {
+        'first': FirstNameModel,
+        'sur': SurnameModel,
+        'geo': GeocodeModel,
+        'surgeo': SurgeoModel,
+        'bifsg': BIFSGModel,
+    }
+
+    _GEO_LEVELS = {
+        'geo': ('ZCTA', 'TRACT'),
+        'surgeo': ('ZCTA', 'TRACT'),
+        'bifsg': ('ZCTA', 'TRACT', 'BLOCK'),
+    }
+
+    _GEO_COLUMNS = {
+        'ZCTA': 'zcta5',
+        'BLOCK': 'block',
+        'TRACT': ['state', 'county', 'tract'],
+    }
+
+    DEFAULT_PRELOAD = (('surgeo', 'ZCTA'), ('bifsg', 'ZCTA'))
+
+    def __init__(self,
+                 host: str = '127.0.0.1',
+                 port: int = 8000,
+                 socket_path: str = None,
+                 dtype: str = 'float64',
+                 preload=DEFAULT_PRELOAD,
+                 verbose: bool = False,
+                 max_body_size: int = 256 * 2**20):
+        self._dtype = dtype
+        self.verbose = verbose
+        self.max_body_size = max_body_size
+        self.metrics = ServerMetrics()
+        self._models = {}
+        self._model_locks = {}
+        self._lock = threading.Lock()
+        for model_type, geo_level in preload:
+            self._get_model(model_type, geo_level)
+        if socket_path is not None:
+            if os.path.exists(socket_path):
+                os.unlink(socket_path)
+            self._httpd = _UnixServer(socket_path, _ScoringHandler)
+        else:
+            self._httpd = _TCPServer((host, port), _ScoringHandler)
+        self._httpd.surgeo = self
+
+    @property
+    def address(self):
+        """The (host, port) or socket path the server listens on"""
+        return self._httpd.server_address
+
+    def serve_forever(self) -> None:
+        """Handle requests until shutdown() is called"""
+        self._httpd.serve_forever()
+
+    def shutdown(self) -> None:
+        """Stop serve_forever() and close the listening socket"""
+        self._httpd.shutdown()
+        self._httpd.server_close()
+        if isinstance(self._httpd, _UnixServer) and os.path.exists(self.address):
+            os.unlink(self.address)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, exc_traceback):
+        self._httpd.server_close()
+
+    def read_payload(self, body: bytes, content_type: str) -> pd.DataFrame:
+        """Parse a JSON or Arrow IPC stream request body into a dataframe"""
+        if content_type == ARROW_STREAM_TYPE:
+            import pyarrow as pa
+
+            table = pa.ipc.open_stream(body).read_all()
+            # Strings stay in Arrow memory through the models
+            return table.to_pandas(types_mapper=pd.ArrowDtype)
+        try:
+            payload = json.loads(body or b'{}')
+        except json.JSONDecodeError as e:
+            raise SurgeoException(f'Request body is not valid JSON: {e}')
+        if not isinstance(payload, (dict, list)):
+            raise SurgeoException('JSON payload must be an object of columns or a list of records.')
+        return pd.DataFrame(payload)
+
+    def write_arrow(self, df: pd.DataFrame) -> bytes:
+        """Serialize a result dataframe as an Arrow IPC stream"""
+        import pyarrow as pa
+
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        sink = io.BytesIO()
+        with pa.ipc.new_stream(sink, table.schema) as writer:
+            writer.write_table(table)
+        return sink.getvalue()
+
+    def score(self, model_type: str, geo_level: str, df: pd.DataFrame) -> pd.DataFrame:
+        """Score a batch with a warm model
+
+        Parameters
+        ----------
+        model_type : str
+            One of "first", "sur", "geo", "surgeo" or "bifsg"
+        geo_level : str
+            'ZCTA', 'TRACT' or 'BLOCK'
+        df : pd.DataFrame
+            The batch, with the CLI's default column names
+
+        Returns
+        -------
+        pd.DataFrame
+            The model's results
+
+        """
+        model, lock = self._get_model(model_type, geo_level)
+        df = df.reset_index(drop=True)
+        try:
+            geo = df[self._GEO_COLUMNS[geo_level]] if model_type in self._GEO_LEVELS else None
+            if model_type == 'first':
+                args = (df['first_name'],)
+            elif model_type == 'sur':
+                args = (df['name'],)
+            elif model_type == 'geo':
+                args = (geo,)
+            elif model_type == 'surgeo':
+                args = (df['name'], geo)
+            else:
+                args = (df['first_name'], df['name'], geo)
+        except KeyError as e:
+            raise SurgeoException(f'Column {e} not found in the request.')
+        with lock:
+            if model_type == 'geo' and geo_level == 'TRACT':
+                return model.get_probabilities_tract(geo)
+            return model.get_probabilities(*args)
+
+    def endpoint_name(self, model_type: str, geo_level: str) -> str:
+        """The name a request is recorded under in /metrics
+
+        Unknown types and geo levels all share the 'invalid' entry, so
+        requests to arbitrary URLs can't grow the metrics without limit.
+
+        """
+        if model_type not in self._MODEL_CLASSES:
+            return 'invalid'
+        if geo_level not in self._GEO_LEVELS.get(model_type, ('ZCTA',)):
+            return 'invalid'
+        return f'{model_type}[{geo_level}]'
+
+    def _get_model(self, model_type: str, geo_level: str):
+        """Load a model once and return it with the lock guarding its use"""
+        if model_type not in self._MODEL_CLASSES:
+            raise SurgeoException(
+                f'"{model_type}" is not valid model type. '
+                f'Please use one of {list(self._MODEL_CLASSES)}.'
+            )
+        if geo_level not in self._GEO_LEVELS.get(model_type, ('ZCTA',)):
+            raise SurgeoException(
+                f'geo_level "{geo_level}" is not supported by "{model_type}".'
+            )
+        key = (model_type, geo_level)
+        with self._lock:
+            if key not in self._models:
+                model_class = self._MODEL_CLASSES[model_type]
+                if model_type in self._GEO_LEVELS:
+                    model = model_class(geo_level, dtype=self._dtype)
+                else:
+                    model = model_class(dtype=self._dtype)
+                self._models[key] = model
+                # The block model updates its state table cache on each call
+                if geo_level == 'BLOCK':
+                    self._model_locks[key] = threading.Lock()
+                else:
+                    self._model_locks[key] = _NoLock()
+            return self._models[key], self._model_locks[key]
+
+    def main(self) -> None:
+        """Serve until interrupted"""
+        print(f'Surgeo server listening on {self.address}', flush=True)
+        try:
+            self.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self._httpd.server_close()
+
+
+class _NoLock(object):
+    """Stands in for a lock around models that are safe to share"""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+
+def _parse_preload(value: str) -> tuple:
+    """Parse a "type" or "type:GEO_LEVEL" preload argument"""
+    model_type, _, geo_level = value.partition(':')
+    return model_type.lower(), (geo_level or 'ZCTA').upper()
+
+
+def main(argv=None):
+    """Parse server arguments (e.g. after 'surgeo serve') and serve"""
+    parser = argparse.ArgumentParser(
+        prog='surgeo serve',
+        description='Serve Surgeo models over HTTP.',
+    )
+    parser.add_argument(
+        '--host',
+        help='Interface to listen on',
+        default='127.0.0.1',
+    )
+    parser.add_argument(
+        '--port',
+        help='TCP port to listen on',
+        type=int,
+        default=8000,
+    )
+    parser.add_argument(
+        '--socket',
+        help='Listen on this Unix domain socket instead of TCP',
+        dest='socket_path',
+    )
+    parser.add_argument(
+        '--dtype',
+        help='Precision of the models',
+        choices=['float64', 'float32'],
+        default='float64',
+    )
+    parser.add_argument(
+        '--preload',
+        help='Models to load before serving, as "type" or "type:GEO_LEVEL" '
+             '(defaults to surgeo and bifsg at ZCTA level)',
+        nargs='*',
+        type=_parse_preload,
+        default=list(SurgeoServer.DEFAULT_PRELOAD),
+    )
+    parser.add_argument(
+        '--verbose',
+        help='Log every request',
+        action='store_true',
+    )
+    parser.add_argument(
+        '--max_body_size',
+        help='The largest request body accepted, in bytes',
+        type=int,
+        default=256 * 2**20,
+    )
+    args = parser.parse_args(argv)
+    server = SurgeoServer(
+        args.host,
+        args.port,
+        args.socket_path,
+        args.dtype,
+        args.preload,
+        args.verbose,
+        args.max_body_size,
+    )
+    server.main()
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,255 @@
+"""Module containing the AsyncModel class"""
+
+import asyncio
+import concurrent.futures
+import inspect
+import threading
+
+from surgeo.models.batching import check_request, concat_requests, split_result
+from surgeo.models.parallel_model import _init_worker, _score_partition
+from surgeo.utility.surgeo_exception import SurgeoException
+
+
+class AsyncModel(object):
+    """An asyncio facade over any of the Surgeo models.
+
+    This class:
+
+    1. Runs the wrapped model in a thread or process pool, so that scoring
+       never blocks the event loop;
+    2. Merges requests that arrive close together into a single vectorized
+       get_probabilities() call and hands each caller its own rows; and,
+    3. Applies back-pressure: once max_pending requests are queued or
+       running, further callers wait until one of them finishes.
+
+    Requests are collected until batch_size rows are queued or the oldest
+    has waited batch_wait_ms milliseconds, whichever comes first. Batches
+    are then scored concurrently, up to max_workers at a time.
+
+    Parameters
+    ----------
+    model_class : type
+        The model class to run (e.g. SurgeoModel or BIFSGModel)
+    *model_args
+        Positional arguments used to instantiate model_class (e.g. 'TRACT')
+    executor : str
+        'thread' (default) to score in threads sharing one model, or
+        'process' to score in worker processes with a model each
+    max_workers : int
+        Number of threads or processes (defaults to the executor's default)
+    max_pending : int
+        Number of requests that may be queued or running at once
+    batch_size : int
+        Number of rows that triggers a batch without waiting
+    batch_wait_ms : float
+        How long the first request of a batch waits for others to join
+
+    Example
+    -------
+        .. code-block:: python
+
+            model = surgeo.AsyncModel(surgeo.SurgeoModel, batch_wait_ms=2)
+
+            async def score(names, zctas):
+                return await model.get_probabilities(names, zctas)
+
+    """
+
+    def __init__(self,
+                 model_class,
+                 *model_args,
+                 executor='thread',
+                 max_workers=None,
+                 max_pending=1024,
+                 batch_size=10_000,
+                 batch_wait_ms=2.0):
+        if executor not in ('thread', 'process'):
+            raise SurgeoException("executor must be 'thread' or 'process'.")
+        if max_workers is not None and max_workers < 1:
+            raise SurgeoException('max_workers must be a positive integer.')
+        if max_pending < 1:
+            raise SurgeoException('max_pending must be a positive integer.')
+        if batch_size < 1:
+            raise SurgeoException('batch_size must be a positive integer.')
+        if batch_wait_ms < 0:
+            raise SurgeoException('batch_wait_ms must not be negative.')
+        self._model_class = model_class
+        self._model_args = model_args
+        self._executor_type = executor
+        self._max_workers = max_workers
+        self._max_pending = max_pending
+        self._batch_size = batch_size
+        self._batch_wait = batch_wait_ms / 1000
+        self._executor = None
+        # Only used by thread executors; the block-level BIFSG model
+        # updates its state table cache on every call
+        self._model = None
+        self._model_lock = threading.Lock()
+        # Event loop state, created on first use
+        self._semaphore = None
+        self._pending = {}
+        self._pending_rows = {}
+        self._timers = {}
+        # The event loop only keeps weak references to running batches
+        self._batches = set()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        """Shut down the thread or process pool"""
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+
+    async def get_probabilities(self, *args):
+        """Obtain probabilities from the wrapped model without blocking
+
+        Parameters
+        ----------
+        *args : pd.Series or pd.DataFrame
+            The same inputs taken by the wrapped model's get_probabilities()
+
+        Returns
+        -------
+        pd.DataFrame
+            Dataframe of probability results for these inputs only
+
+        """
+        return await self._submit('get_probabilities', args)
+
+    async def get_probabilities_tract(self, geo_df):
+        """Obtain tract probabilities from a wrapped GeocodeModel"""
+        return await self._submit('get_probabilities_tract', (geo_df,))
+
+    async def _submit(self, method_name, args):
+        """Queue a request (waiting for room if need be) and await its rows
+
+        Malformed requests are rejected here, before they can join (and
+        fail) a batch of other callers' requests.
+
+        """
+        args, _ = check_request(args, self._input_count(method_name))
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self._max_pending)
+        async with self._semaphore:
+            future = asyncio.get_running_loop().create_future()
+            self._enqueue(method_name, args, future)
+            return await future
+
+    def _input_count(self, method_name):
+        """The number of inputs a model method takes (None if it varies)"""
+        parameters = list(
+            inspect.signature(getattr(self._model_class, method_name)).parameters.values()
+        )[1:]
+        if any(
+            parameter.kind is parameter.VAR_POSITIONAL
+            or parameter.default is not parameter.empty
+            for parameter in parameters
+        ):
+            return None
+        return len(parameters)
+
+    def _enqueue(self, method_name, args, future):
+        """Add a request to the pending batch and schedule its flush"""
+        loop = asyncio.get_running_loop()
+        rows = max((len(arg) for arg in args), default=0)
+        self._pending.setdefault(method_name, []).append((args, future))
+        self._pending_rows[method_name] = self._pending_rows.get(method_name, 0) + rows
+        if self._pending_rows[method_name] >= self._batch_size:
+            self._flush(method_name)
+        elif method_name not in self._timers:
+            self._timers[method_name] = loop.call_later(
+                self._batch_wait,
+                self._flush,
+                method_name,
+            )
+
+    def _flush(self, method_name):
+        """Send the pending requests for a method off as one batch"""
+        timer = self._timers.pop(method_name, None)
+        if timer is not None:
+            timer.cancel()
+        batch = self._pending.pop(method_name, [])
+        self._pending_rows.pop(method_name, None)
+        if batch:
+            task = asyncio.get_running_loop().create_task(self._run_batch(method_name, batch))
+            self._batches.add(task)
+            task.add_done_callback(self._batches.discard)
+
+    async def _run_batch(self, method_name, batch):
+        """Score a batch in the executor and resolve each request's future
+
+        If the batch fails, each request is scored on its own, so an error
+        only reaches the caller whose request caused it.
+
+        """
+        try:
+            inputs, lengths = concat_requests([args for args, _ in batch])
+            result = await self._run_in_executor(method_name, inputs)
+            frames = split_result(result, lengths)
+        except Exception as e:
+            if len(batch) == 1:
+                self._resolve(batch[0][1], error=e)
+            else:
+                for args, future in batch:
+                    await self._run_batch(method_name, [(args, future)])
+            return
+        for (_, future), frame in zip(batch, frames):
+            self._resolve(future, frame)
+
+    async def _run_in_executor(self, method_name, inputs):
+        """Run a model method over inputs in the thread or process pool"""
+        if self._executor_type == 'process':
+            call = (_score_partition, method_name, inputs)
+        else:
+            call = (self._score, method_name, inputs)
+        return await asyncio.get_running_loop().run_in_executor(self._get_executor(), *call)
+
+    def _resolve(self, future, result=None, error=None):
+        """Set a request's result or error (unless its caller gave up)"""
+        if future.done():
+            return
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(result)
+
+    def _score(self, method_name, inputs):
+        """Score inputs with the model shared by the executor's threads"""
+        model = self._get_model()
+        if getattr(model, '_GEO_LEVEL', None) == 'BLOCK':
+            with self._model_lock:
+                return getattr(model, method_name)(*inputs)
+        return getattr(model, method_name)(*inputs)
+
+    def _get_model(self):
+        """Instantiate the shared model on first use"""
+        with self._model_lock:
+            if self._model is None:
+                self._model = self._model_class(*self._model_args)
+            return self._model
+
+    def _get_executor(self):
+        """Start the thread or process pool on first use"""
+        if self._executor is None:
+            if self._executor_type == 'process':
+                self._executor = concurrent.futures.ProcessPoolExecutor(
+                    max_workers=self._max_workers,
+                    initializer=_init_worker,
+                    initargs=(self._model_class, self._model_args),
+                )
+            else:
+                self._executor = concurrent.futures.ThreadPoolExecutor(
+                    max_workers=self._max_workers,
+                )
+        return self._executor
@@ -1,12 +1,19 @@
 """Contains the base model for First Name, Surname, Geocode, BIFSG, and Surgeo models."""
 
+import json
 import pathlib
+import re
 import string
 import sys
 
 import numpy as np
 import pandas as pd
 
+from surgeo.models.lookup_table import LookupTable
+from surgeo.models.progress import _NO_PROGRESS, _Stage
+from surgeo.models.table_registry import TABLE_REGISTRY
+from surgeo.utility.surgeo_exception import SurgeoException
+
 
 class BaseModel(object):
     """Base class for the first name, surname, geocode, bifsg, and
@@ -17,8 +24,9 @@ class BaseModel(object):
     of responsibility for the subclass. This base class does the following
     operations:
 
-    1. Creating functions to provide lookup dataframes; and,
-    2. Housing normalization routines for dirty ZIP code and name data.
+    1. Creating functions to provide lookup dataframes;
+    2. Compiling those dataframes into LookupTables for fast joins; and,
+    3. Housing normalization routines for dirty ZIP code and name data.
 
     Note
     ----
@@ -43,7 +51,38 @@ class BaseModel(object):
 
     """
 
-    def __init__(self):
+    # Characters removed from names before they are matched
+    _NAME_UNWANTED_CHARACTERS = (
+        string.digits +
+        string.punctuation +
+        string.whitespace
+    )
+
+    _NAME_TRANSLATION = str.maketrans('', '', _NAME_UNWANTED_CHARACTERS)
+
+    # The same characters as an Arrow (RE2) character class
+    _NAME_UNWANTED_PATTERN = '[' + ''.join(
+        f'\\x{ord(character):02x}' for character in _NAME_UNWANTED_CHARACTERS
+    ) + ']'
+
+    # The JR, SR, III and IV suffix patterns combined into one regex. The
+    # groups are in the reverse of the order in which the suffixes used to be
+    # stripped one at a time, so the leftmost match removes the same text.
+    _NAME_SUFFIX = re.compile(
+        r'(?:\s?IV\s*?)?'
+        r'(?:\s?III\s*?)?'
+        r'(?:\s?S\.*?R\.*\s*?)?'
+        r'(?:\s?J\.*?R\.*\s*?)?$'
+    )
+
+    # Cleaned ASCII names contain no whitespace or dots, so any suffix that
+    # could be stripped from them matches this
+    _NAME_SUFFIX_CANDIDATE = '(?:IV|III|SR|JR)$'
+
+    # Supported precisions for the probability tables and results
+    _DTYPES = ('float64', 'float32')
+
+    def __init__(self, dtype='float64', progress=None):
         # https://cx-freeze.readthedocs.io/en/latest/faq.html#using-data-files
         # If it's frozen, we can't use __file__
         if getattr(sys, 'frozen', False):
@@ -55,7 +94,34 @@ class BaseModel(object):
             self._package_root = pathlib.Path(__file__).parents[1]
 
         self._DATA_DIR = f'{self._package_root}/data/'
+        # Memory-mappable tables built by surgeo.utility.compile_data
+        self._COMPILED_DIR = self._package_root / 'data' / 'compiled'
+        # Precision of the probability tables (and so of the results)
+        self._dtype = self._check_dtype(dtype)
+        # Called with a StageEvent as each stage starts and finishes
+        self._progress = progress
+
+    def _check_dtype(self, dtype) -> np.dtype:
+        """Validate a precision option ('float64' or 'float32')"""
+        try:
+            dtype = np.dtype(dtype)
+        except TypeError:
+            dtype = None
+        if dtype is None or dtype.name not in self._DTYPES:
+            raise SurgeoException("dtype must be 'float64' or 'float32'")
+        return dtype
     
+    def _stage(self, stage: str, rows: int):
+        """Time a stage of get_probabilities() for the progress callback
+
+        Returns a context manager. Without a progress callback it does
+        nothing, so uninstrumented models pay no timing cost.
+
+        """
+        if self._progress is None:
+            return _NO_PROGRESS
+        return _Stage(self._progress, type(self).__name__, stage, rows)
+
     def _parquet_to_df(self, filename:str) -> pd.DataFrame:
         import pyarrow as pa
         import pyarrow.parquet as pq
@@ -84,7 +150,7 @@ class BaseModel(object):
         This method should be deprecated in favor of load_pickle.        
         """
 
-        prob_race_given_zcta = self._parquet_to_df(f'{self._package_root}/data/prob_race_given_zcta_2010.pkl')
+        prob_race_given_zcta = self._parquet_to_df(f'{self._package_root}/data/prob_race_given_zcta_2010.parquet')
 
         return prob_race_given_zcta
 
@@ -148,78 +214,352 @@ class BaseModel(object):
 
     def _get_prob_zcta_given_race(self):
         """Create dataframe of ZCTA ratios given a race (for SurGeo)"""
-        prob_zcta_given_race = pd.read_csv(
-            self._package_root / 'data' / 'prob_zcta_given_race_2010.csv',
-            index_col='zcta5',
-            na_values=[''],
-            keep_default_na=False,
-        )
-        # Convert geocode zip codes to 00000-formatted strings
-        prob_zcta_given_race.index = (
-            prob_zcta_given_race.index.astype('str')
-                                .str.zfill(5)
+        # ZCTAs are stored as 00000-formatted strings
+        prob_zcta_given_race = self._parquet_to_df(
+            self._package_root / 'data' / 'prob_zcta_given_race_2010.parquet'
         )
         return prob_zcta_given_race
 
-    # def _get_prob_race_given_surname(self):
-    #     """Create dataframe of race probabilities given surnames (for Sur)"""
-    #     # Create surname df (beware ... some NA values like "NAN" are names)
-    #     prob_race_given_surname = pd.read_csv(
-    #         self._package_root / 'data' / 'prob_race_given_surname_2010.csv',
-    #         index_col='name',
-    #         na_values=[''],
-    #         keep_default_na=False,
-    #     )
-    #     return prob_race_given_surname
+    def _get_prob_race_given_surname(self):
+        """Create dataframe of race probabilities given surnames (for Sur)"""
+        # Names are stored as strings (so NA values like "NAN" are names)
+        prob_race_given_surname = self._parquet_to_df(
+            self._package_root / 'data' / 'prob_race_given_surname_2010.parquet'
+        )
+        return prob_race_given_surname
 
     def _get_prob_race_given_first_name(self):
         """Create dataframe of race probabilities given first names (for First)"""
-        # Create first name df (beware ... some NA values like "NAN" are names)
-        prob_race_given_first_name = pd.read_csv(
-            self._package_root / 'data' / 'prob_race_given_first_name_harvard.csv',
-            index_col='name',
-            na_values=[''],
-            keep_default_na=False,
+        # Names are stored as strings (so NA values like "NAN" are names)
+        prob_race_given_first_name = self._parquet_to_df(
+            self._package_root / 'data' / 'prob_race_given_first_name_harvard.parquet'
         )
         return prob_race_given_first_name
 
-    # def _get_prob_first_name_given_race(self):
-    #     """Create dataframe of first name ratios given a race (for BIFSG)"""
-    #     prob_first_name_given_race = pd.read_csv(
-    #         self._package_root / 'data' / 'prob_first_name_given_race_harvard.csv',
-    #         index_col='name',
-    #         na_values=[''],
-    #         keep_default_na=False,
-    #     )
-    #     return prob_first_name_given_race
+    def _get_prob_first_name_given_race(self):
+        """Create dataframe of first name ratios given a race (for BIFSG)"""
+        prob_first_name_given_race = self._parquet_to_df(
+            self._package_root / 'data' / 'prob_first_name_given_race_harvard.parquet'
+        )
+        return prob_first_name_given_race
+
+    def _compile_lookup(self, prob_df: pd.DataFrame, key_encoding: str = None) -> LookupTable:
+        """Compile a key-indexed probability dataframe for fast lookups"""
+        return LookupTable.from_frame(prob_df, key_encoding, self._dtype)
+
+    def _key_encoding(self, table_name: str) -> str:
+        """The integer key encoding of a data table (None for name tables)"""
+        for encoding in ('zcta', 'tract', 'block'):
+            if f'_{encoding}_' in table_name:
+                return encoding
+        return None
+
+    def _load_lookup(self,
+                     table_name: str,
+                     geo_level: str = None,
+                     loader=None) -> LookupTable:
+        """Get a data table by name from the process-wide TABLE_REGISTRY.
+
+        The table is loaded (with loader(), or _read_lookup() by default)
+        the first time it is requested in the process; every later model
+        shares that same read-only copy.
+        """
+        if loader is None:
+            loader = lambda: self._read_lookup(table_name)
+        return TABLE_REGISTRY.get(
+            table_name,
+            geo_level,
+            lambda: self._timed_read(loader),
+            self._dtype.name,
+        )
+
+    def _timed_read(self, loader) -> LookupTable:
+        """Load a table as a 'read' stage for the progress callback"""
+        with self._stage('read', 0) as stage:
+            table = loader()
+            stage.rows = len(table)
+        return table
+
+    def _read_lookup(self, table_name: str) -> LookupTable:
+        """Open a data table by name as a LookupTable.
+
+        If the table has been compiled (see surgeo.utility.compile_data) and
+        is at least as new as its parquet file, it is memory-mapped with no
+        copying or parsing. Otherwise the parquet file is read and compiled
+        in memory.
+        """
+        parquet_path = self._package_root / 'data' / f'{table_name}.parquet'
+        if self._is_compiled(table_name):
+            # A copy is made if the table was compiled at a higher precision
+            return LookupTable.open(self._COMPILED_DIR / table_name).astype(self._dtype)
+        return self._compile_lookup(
+            self._parquet_to_df(parquet_path),
+            self._key_encoding(table_name),
+        )
+
+    def _is_compiled(self, table_name: str) -> bool:
+        """Check for an up-to-date compiled copy of a data table"""
+        parquet_path = self._package_root / 'data' / f'{table_name}.parquet'
+        meta_path = self._COMPILED_DIR / table_name / 'meta.json'
+        if not meta_path.exists():
+            return False
+        # Tables compiled before keys were integer encoded are rebuilt
+        with open(meta_path) as f:
+            if json.load(f).get('key_encoding') != self._key_encoding(table_name):
+                return False
+        # Upcasting a float32 copy wouldn't reproduce the float64 values
+        compiled_dtype = LookupTable.saved_dtype(self._COMPILED_DIR / table_name)
+        if compiled_dtype.itemsize < self._dtype.itemsize:
+            return False
+        if parquet_path.exists():
+            return meta_path.stat().st_mtime >= parquet_path.stat().st_mtime
+        return True
+
+    def _as_series(self, values) -> pd.Series:
+        """Wrap Arrow arrays as Arrow-backed series; pass series through"""
+        import pyarrow as pa
+
+        if isinstance(values, (pa.Array, pa.ChunkedArray)):
+            return pd.Series(pd.arrays.ArrowExtensionArray(values))
+        return values
+
+    def _is_arrow_string(self, dtype) -> bool:
+        """Check whether a dtype keeps its strings in Arrow memory"""
+        if isinstance(dtype, pd.StringDtype):
+            return dtype.storage == 'pyarrow'
+        if isinstance(dtype, pd.ArrowDtype):
+            import pyarrow as pa
+
+            return (
+                pa.types.is_string(dtype.pyarrow_dtype)
+                or pa.types.is_large_string(dtype.pyarrow_dtype)
+            )
+        return False
+
+    def _to_strings(self, values: pd.Series) -> pd.Series:
+        """Stringify a series, leaving Arrow-backed strings where they are"""
+        if self._is_arrow_string(values.dtype):
+            return values
+        return pd.Series(values.values, index=values.index, dtype=str)
+
+    def _get_name_probs(self,
+                        names: pd.Series,
+                        prob_table: LookupTable) -> pd.DataFrame:
+        """Normalizes names and looks up their probabilities.
+
+        Only the distinct names are normalized and looked up; the results
+        are then broadcast back to every row using the factorized codes.
+        """
+        # Stringify first so that e.g. 1, 1.0 and True are not conflated
+        names = self._to_strings(self._as_series(names).fillna(''))
+        return self._factorized_lookup(names, self._normalize_names, prob_table)
+
+    def _get_zcta_probs(self,
+                        zctas: pd.Series,
+                        prob_table: LookupTable) -> pd.DataFrame:
+        """Normalizes ZCTAs and looks up their probabilities.
+
+        Only the distinct ZCTAs are normalized and looked up; the results
+        are then broadcast back to every row using the factorized codes.
+        """
+        # Stringify first so that e.g. 631 and 631.0 are not conflated
+        zctas = self._to_strings(self._as_series(zctas).reset_index(drop=True))
+        return self._factorized_lookup(zctas, self._normalize_zctas, prob_table)
+
+    def _get_tract_probs(self,
+                         geo_df: pd.DataFrame,
+                         prob_table: LookupTable) -> pd.DataFrame:
+        """Normalizes state/county/tract columns and looks up their probs."""
+        with self._stage('normalize', len(geo_df)):
+            normalized_tracts = self._normalize_tracts(geo_df)
+        with self._stage('lookup', len(geo_df)):
+            rows = prob_table.get_rows(normalized_tracts[['state', 'county', 'tract']])
+            probs = pd.DataFrame(
+                prob_table.take(rows),
+                index=normalized_tracts.index,
+                columns=prob_table.columns,
+            )
+            return pd.concat([normalized_tracts, probs], axis=1)
+
+    def _factorized_lookup(self,
+                           values: pd.Series,
+                           normalize,
+                           prob_table: LookupTable) -> pd.DataFrame:
+        """Normalize and look up the unique values, then broadcast to all rows"""
+        with self._stage('normalize', len(values)):
+            codes, uniques = pd.factorize(values)
+            uniques = pd.Series(uniques, dtype=values.dtype)
+            # Missing values get a code of -1; give them their own unique slot
+            missing = codes == -1
+            if missing.any():
+                codes[missing] = len(uniques)
+                uniques = pd.concat(
+                    [uniques, pd.Series([np.nan], dtype=values.dtype)],
+                    ignore_index=True,
+                )
+            normalized = normalize(uniques)
+        with self._stage('lookup', len(values)):
+            # Resolve each unique key to a row id once, then broadcast by code
+            rows = prob_table.get_rows(normalized).take(codes)
+            probs = pd.DataFrame(
+                prob_table.take(rows),
+                index=values.index,
+                columns=prob_table.columns,
+            )
+            probs.insert(
+                0,
+                normalized.name,
+                pd.Series(normalized.array.take(codes), index=values.index),
+            )
+            return probs
+
+    def _fused_posterior(self, prob_arrays: list, out: np.ndarray = None) -> np.ndarray:
+        """Multiply component probabilities and normalize each row in place.
+
+        This is the NumPy equivalent of the dataframe expression
+        ``numer = a * b * ...; numer.div(numer.sum(axis=1), axis=0)`` and
+        gives bit-for-bit identical results: products are taken left to
+        right, NaN cells are skipped when summing a row, and rows that sum
+        to zero come out as NaN. No intermediate dataframes are created and
+        the result is written into out (allocated if not supplied).
+
+        Parameters
+        ----------
+        prob_arrays : list
+            Two or more (rows x races) float arrays with matching columns
+        out : np.ndarray
+            Optional preallocated (rows x races) float array for the result
+
+        Returns
+        -------
+        np.ndarray
+            The row-normalized posterior probabilities (out)
+
+        """
+        first, *rest = prob_arrays
+        if out is None:
+            out = np.empty(first.shape, dtype=np.result_type(*prob_arrays))
+        np.multiply(first, rest[0], out=out)
+        for prob_array in rest[1:]:
+            np.multiply(out, prob_array, out=out)
+        # Sum columns left to right with NaN as zero (as DataFrame.sum does)
+        denom = np.zeros(len(out), dtype=out.dtype)
+        for column in out.T:
+            denom += np.where(np.isnan(column), 0, column)
+        # 0 / 0 gives NaN for rows with no usable probabilities
+        with np.errstate(divide='ignore', invalid='ignore'):
+            np.divide(out, denom[:, np.newaxis], out=out)
+        return out
 
     def _normalize_names(self, names: pd.Series) -> pd.Series:
-        """Take names and run a normalization routine"""
-        # Make a transalation table of unwanted characers
-        unwanted_characters = (
-            string.digits +
-            string.punctuation +
-            string.whitespace
+        """Take names and run a normalization routine
+
+        ASCII names are cleaned and upper cased in a single pass with Arrow
+        kernels. Only the names that may end in a suffix and any non-ASCII
+        names then go through _normalize_name(), which applies the full
+        rules, so the result is identical for every name.
+        """
+        import pyarrow as pa
+        import pyarrow.compute as pc
+
+        # Remember NAN is a valid name
+        values = pa.array(self._to_strings(names.fillna('')), type=pa.large_string())
+        if isinstance(values, pa.ChunkedArray):
+            values = values.combine_chunks()
+        cleaned = pc.ascii_upper(
+            pc.replace_substring_regex(values, self._NAME_UNWANTED_PATTERN, '')
+        )
+        redo = pc.or_(
+            pc.invert(pc.string_is_ascii(values)),
+            pc.match_substring_regex(cleaned, self._NAME_SUFFIX_CANDIDATE),
         )
-        # Remove unwanted characters efficiently
-        translation_table =  str.maketrans('', '', unwanted_characters)
-        # Run our string operations (remember NAN is a valid name)
-        output = (
-            names.fillna('')
-                 .astype(str)
-                 .str.translate(translation_table)
-                 .str.upper()
-                 .str.replace(r'\s?J\.*?R\.*\s*?$', '', regex=True)
-                 .str.replace(r'\s?S\.*?R\.*\s*?$', '', regex=True)
-                 .str.replace(r'\s?III\s*?$',      '', regex=True)
-                 .str.replace(r'\s?IV\s*?$',       '', regex=True)
+        positions = np.flatnonzero(redo.to_numpy(zero_copy_only=False))
+        if len(positions) > 0:
+            redone = [
+                self._normalize_name(name)
+                for name in values.take(positions).to_pylist()
+            ]
+            cleaned = pc.replace_with_mask(cleaned, redo, pa.array(redone, cleaned.type))
+        output = pd.Series(pd.arrays.ArrowExtensionArray(cleaned), index=names.index)
+        # Keep the caller's Arrow string dtype, or the default str dtype
+        if not self._is_arrow_string(names.dtype):
+            return output.astype(str).rename('name')
+        return output.astype(names.dtype).rename('name')
+
+    def _normalize_name(self, name: str) -> str:
+        """Normalize a single name (see _normalize_names())"""
+        name = name.translate(self._NAME_TRANSLATION).upper()
+        return self._NAME_SUFFIX.sub('', name, count=1)
+
+    def score_record(self, *values) -> dict:
+        """Score one record (e.g. a surname and a ZCTA) with score_records()"""
+        return self.score_records(*([value] for value in values))[0]
+
+    def _is_missing(self, value) -> bool:
+        """Check whether a single input value is missing (None, NA or NaN)"""
+        return value is None or value is pd.NA or (isinstance(value, float) and value != value)
+
+    def _normalize_record_name(self, name) -> str:
+        """Normalize one name as _get_name_probs() does (missing names are '')"""
+        if not isinstance(name, str):
+            name = '' if self._is_missing(name) else str(name)
+        return self._normalize_name(name)
+
+    def _normalize_record_zcta(self, zcta):
+        """Normalize one ZCTA as _normalize_zctas() does (missing ZCTAs are NaN)"""
+        if self._is_missing(zcta):
+            return np.nan
+        return str(zcta).strip().zfill(5)
+
+    def _record_probs(self,
+                      keys: list,
+                      prob_table: LookupTable,
+                      columns: list = None) -> np.ndarray:
+        """Look up a few normalized keys one at a time (see score_records())
+
+        The probabilities come back as a (keys x columns) array, in the
+        order of columns if given (otherwise the table's own order).
+        """
+        rows = np.fromiter(
+            (prob_table.get_row(key) for key in keys),
+            dtype=np.intp,
+            count=len(keys),
         )
-        output.name = 'name'
-        return output
+        probs = prob_table.take(rows)
+        if columns is not None and list(columns) != prob_table.columns:
+            probs = probs[:, [prob_table.columns.index(column) for column in columns]]
+        return probs
+
+    def _record_geo_probs(self,
+                          geos: list,
+                          prob_table: LookupTable,
+                          columns: list = None) -> tuple:
+        """Normalize and look up a few ZCTAs or (state, county, tract) tuples
+
+        Returns the geography columns of the output (as a dict of lists) and
+        the probabilities (see _record_probs()).
+        """
+        if prob_table.key_encoding == 'tract':
+            tracts = [tuple(geo) for geo in geos]
+            geo_columns = {
+                name: [tract[position] for tract in tracts]
+                for position, name in enumerate(['state', 'county', 'tract'])
+            }
+            return geo_columns, self._record_probs(tracts, prob_table, columns)
+        zctas = [self._normalize_record_zcta(zcta) for zcta in geos]
+        return {'zcta5': zctas}, self._record_probs(zctas, prob_table, columns)
+
+    def _to_records(self, key_columns: dict, probs: np.ndarray, race_columns: list) -> list:
+        """Combine input columns and probabilities into one dict per row"""
+        columns = [*key_columns, *race_columns]
+        return [
+            dict(zip(columns, [*keys, *row]))
+            for *keys, row in zip(*key_columns.values(), probs.tolist())
+        ]
 
     def _normalize_zctas(self, zcta: pd.Series) -> pd.Series:
         """Transform ZCTAs into standardized strings"""
-        converted = pd.Series(zcta.values, dtype=str).str.strip()
+        converted = self._to_strings(zcta.reset_index(drop=True)).str.strip()
         zfilled = converted.str.zfill(5)
         zfilled.name = 'zcta5'
         return zfilled
@@ -0,0 +1,194 @@
+"""Module containing the BatchScorer class"""
+
+import collections
+import concurrent.futures
+import inspect
+import queue
+import threading
+import time
+
+import numpy as np
+
+from surgeo.utility.surgeo_exception import SurgeoException
+
+
+class BatchScorer(object):
+    """Scores single records by batching them into vectorized calls.
+
+    Every model call pays a fixed cost, which dominates when it is given
+    one record. This class queues single-record requests from any number
+    of threads; a background thread collects up to max_batch of them
+    (waiting at most max_wait_ms after the first one arrives), scores them
+    with one call to the model's score_records(), and hands each caller
+    its own row.
+
+    Parameters
+    ----------
+    model_class : type
+        The model class to run (e.g. SurgeoModel or BIFSGModel)
+    *model_args
+        Positional arguments used to instantiate model_class (e.g. 'TRACT')
+    max_batch : int
+        The most records scored in one call
+    max_wait_ms : float
+        How long the first record of a batch waits for others to join
+
+    Example
+    -------
+        .. code-block:: python
+
+            with surgeo.BatchScorer(surgeo.SurgeoModel) as scorer:
+                # Safe to call from many threads at once
+                row = scorer.score('SMITH', '63144')
+                print(scorer.stats())
+
+    """
+
+    _LATENCY_WINDOW = 10_000
+
+    def __init__(self, model_class, *model_args, max_batch=256, max_wait_ms=2.0):
+        if max_batch < 1:
+            raise SurgeoException('max_batch must be a positive integer.')
+        if max_wait_ms < 0:
+            raise SurgeoException('max_wait_ms must not be negative.')
+        self._model = model_class(*model_args)
+        self._width = len(inspect.signature(self._model.get_probabilities).parameters)
+        self._max_batch = max_batch
+        self._max_wait = max_wait_ms / 1000
+        self._queue = queue.Queue()
+        self._stats_lock = threading.Lock()
+        self._started = time.perf_counter()
+        self._records = 0
+        self._batches = 0
+        self._latencies = collections.deque(maxlen=self._LATENCY_WINDOW)
+        self._closed = False
+        # Held while checking _closed and queueing, so no record can be
+        # queued after the sentinel that stops the scoring thread
+        self._queue_lock = threading.Lock()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        """Score the records already queued, then stop the scoring thread"""
+        with self._queue_lock:
+            if self._closed:
+                return
+            self._closed = True
+            self._queue.put(None)
+        self._thread.join()
+
+    def submit(self, *values) -> concurrent.futures.Future:
+        """Queue one record for scoring
+
+        Parameters
+        ----------
+        *values
+            One value per input of the model's get_probabilities() (e.g. a
+            surname and a ZCTA for SurgeoModel)
+
+        Returns
+        -------
+        concurrent.futures.Future
+            Resolves to the record's results as a dictionary
+
+        """
+        if len(values) != self._width:
+            raise SurgeoException(
+                f'Expected {self._width} values per record. Got {len(values)}.'
+            )
+        future = concurrent.futures.Future()
+        with self._queue_lock:
+            if self._closed:
+                raise SurgeoException('BatchScorer is closed.')
+            self._queue.put((values, future, time.perf_counter()))
+        return future
+
+    def score(self, *values, timeout=None) -> dict:
+        """Score one record and wait for its results (see submit())"""
+        return self.submit(*values).result(timeout)
+
+    def stats(self) -> dict:
+        """Throughput and latency of the records scored so far
+
+        Latency is measured from submit() until the result is available,
+        over the most recent records.
+
+        """
+        with self._stats_lock:
+            elapsed = time.perf_counter() - self._started
+            latencies = np.array(self._latencies) * 1000
+            stats = {
+                'records': self._records,
+                'batches': self._batches,
+                'mean_batch_size': self._records / self._batches if self._batches else 0.0,
+                'records_per_second': self._records / elapsed if elapsed else 0.0,
+            }
+        if len(latencies):
+            p50, p99 = np.percentile(latencies, [50, 99])
+            stats['latency_ms'] = {
+                'p50': float(p50),
+                'p99': float(p99),
+                'max': float(latencies.max()),
+            }
+        return stats
+
+    def _run(self):
+        """Collect batches off the queue and score them until closed"""
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            batch = [item]
+            deadline = time.perf_counter() + self._max_wait
+            stop = False
+            while len(batch) < self._max_batch:
+                timeout = deadline - time.perf_counter()
+                try:
+                    item = self._queue.get(timeout=timeout) if timeout > 0 else self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is None:
+                    stop = True
+                    break
+                batch.append(item)
+            # Records whose callers cancelled them are dropped; the rest
+            # can no longer be cancelled
+            batch = [item for item in batch if item[1].set_running_or_notify_cancel()]
+            if batch:
+                self._score_batch(batch)
+            if stop:
+                return
+
+    def _score_batch(self, batch):
+        """Score a batch with one model call and resolve each record's future
+
+        If the call fails, each record is scored on its own, so an error
+        only reaches the caller whose record caused it.
+
+        """
+        try:
+            columns = [
+                list(column)
+                for column in zip(*(values for values, _, _ in batch))
+            ]
+            records = self._model.score_records(*columns)
+        except Exception as e:
+            if len(batch) == 1:
+                batch[0][1].set_exception(e)
+            else:
+                for item in batch:
+                    self._score_batch([item])
+            return
+        finished = time.perf_counter()
+        with self._stats_lock:
+            self._records += len(batch)
+            self._batches += 1
+            self._latencies.extend(finished - submitted for _, _, submitted in batch)
+        for (_, future, _), record in zip(batch, records):
+            future.set_result(record)
@@ -0,0 +1,92 @@
+"""Module containing helpers that merge small requests into one batch"""
+
+import pandas as pd
+
+from surgeo.utility.surgeo_exception import SurgeoException
+
+
+def as_pandas(values):
+    """Turn a model input (series, frame, list or Arrow array) into pandas"""
+    if isinstance(values, (pd.Series, pd.DataFrame)):
+        return values
+    try:
+        import pyarrow as pa
+    except ImportError:
+        pa = None
+    if pa is not None and isinstance(values, (pa.Array, pa.ChunkedArray)):
+        return pd.Series(pd.arrays.ArrowExtensionArray(values))
+    return pd.Series(values)
+
+
+def check_request(args, input_count: int = None) -> tuple:
+    """Convert one request's inputs to pandas and check they line up
+
+    Parameters
+    ----------
+    args : tuple
+        The request's model inputs (e.g. (names, zctas))
+    input_count : int
+        The number of inputs the model method takes (not checked if None)
+
+    Returns
+    -------
+    tuple
+        The inputs as pandas objects and the request's row count
+
+    Raises
+    ------
+    SurgeoException
+        If the request has the wrong number of inputs, or inputs of
+        different lengths
+
+    """
+    if input_count is not None and len(args) != input_count:
+        raise SurgeoException(
+            f'Expected {input_count} inputs but got {len(args)}.'
+        )
+    args = tuple(as_pandas(arg) for arg in args)
+    arg_lengths = set(len(arg) for arg in args)
+    if len(arg_lengths) > 1:
+        raise SurgeoException(f'Length mismatch. Input lengths: {arg_lengths}.')
+    return args, arg_lengths.pop() if arg_lengths else 0
+
+
+def concat_requests(requests) -> tuple:
+    """Concatenate the inputs of several requests into one set of inputs
+
+    Parameters
+    ----------
+    requests : list
+        One tuple of model inputs per request (e.g. (names, zctas)); every
+        request must pass the same number of inputs
+
+    Returns
+    -------
+    tuple
+        The concatenated inputs (each with a fresh RangeIndex) and the row
+        count of each request, for split_result()
+
+    """
+    if len(set(len(args) for args in requests)) > 1:
+        raise SurgeoException('Requests in a batch must pass the same inputs.')
+    checked = [check_request(args) for args in requests]
+    requests = [args for args, _ in checked]
+    lengths = [rows for _, rows in checked]
+    if len(requests) == 1:
+        inputs = tuple(arg.reset_index(drop=True) for arg in requests[0])
+    else:
+        inputs = tuple(
+            pd.concat(column, ignore_index=True)
+            for column in zip(*requests)
+        )
+    return inputs, lengths
+
+
+def split_result(result: pd.DataFrame, lengths) -> list:
+    """Split a batch result into one frame per request (see concat_requests)"""
+    frames = []
+    start = 0
+    for length in lengths:
+        frames.append(result.iloc[start:start + length].reset_index(drop=True))
+        start += length
+    return frames
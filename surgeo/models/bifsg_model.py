@@ -3,15 +3,38 @@
 import pandas as pd
 
 from surgeo.models.base_model import BaseModel
+from surgeo.models.lookup_table import LookupTable
 from surgeo.utility.surgeo_exception import SurgeoException
 
+import collections
+import concurrent.futures
 import sys
 import pathlib
 import tempfile
 
 class BlockLoader:
+    """Loads the per-state census block partitions.
 
-    def __init__(self): 
+    Block level data is split into one parquet file per state and per
+    family ('race_given_block' and 'block_given_race'). load_family() reads
+    only the family that is asked for, reads the state partitions on a pool
+    of threads (pyarrow releases the GIL while decoding), and can push a
+    filter on the block GEOIDs down into the parquet reader so that only
+    the requested rows are materialized as a dataframe.
+
+    Parameters
+    ----------
+    max_workers : int
+        Maximum number of threads used to read partitions (defaults to one
+        per state, up to eight)
+
+    """
+
+    _FAMILIES = ('race_given_block', 'block_given_race')
+
+    _MAX_WORKERS = 8
+
+    def __init__(self, max_workers: int = None):
 
         if getattr(sys, 'frozen', False):
             # The application is frozen
@@ -26,15 +49,62 @@ class BlockLoader:
         # self._DATA_DIR = f'{self._package_root}/surgeo/data/'
         self._DATA_DIR = f'{self._package_root}/data/'
 
+        if max_workers is not None and max_workers < 1:
+            raise SurgeoException('max_workers must be a positive integer.')
+        self._max_workers = max_workers
+
     def load_fips(self, fips:list[str]):
-        
-        import pandas as pd
+        """Load both block families for a list of state FIPS codes"""
 
         self.glob_datadir(fips)
         self.load_files()
 
         return (self.RACE_GIVEN_BLOCK, self.BLOCK_GIVEN_RACE)
 
+    def load_family(self,
+                    fips: list[str],
+                    family: str = 'block_given_race',
+                    blocks: list[str] = None) -> pd.DataFrame:
+        """Load a single block family for a list of state FIPS codes
+
+        Parameters
+        ----------
+        fips : list[str]
+            Two-digit state FIPS codes of the partitions to read
+        family : str
+            Either 'block_given_race' or 'race_given_block'
+        blocks : list[str]
+            If given, only these 15-digit block GEOIDs are read
+
+        Returns
+        -------
+        pd.DataFrame
+            Block-indexed dataframe of probabilities
+
+        """
+        partitions = self.load_partitions(fips, family, blocks)
+        return pd.concat(list(partitions.values()))
+
+    def load_partitions(self,
+                        fips: list[str],
+                        family: str = 'block_given_race',
+                        blocks: list[str] = None) -> dict:
+        """Load a single block family as a dict of state FIPS -> dataframe
+
+        Takes the same parameters as load_family(). States without a data
+        file are left out of the result.
+
+        """
+        if family not in self._FAMILIES:
+            raise SurgeoException(
+                f"family must be one of {', '.join(self._FAMILIES)}"
+            )
+        self.glob_datadir(fips)
+        filepaths = self._rgb if family == 'race_given_block' else self._bgr
+        if len(filepaths) == 0:
+            raise SurgeoException('No files found')
+        states = [f.split('__')[-1].split('.')[0] for f in filepaths]
+        return dict(zip(states, self._read_partitions(filepaths, blocks)))
 
     def glob_datadir(self, fips:list[str]) -> None:
 
@@ -45,19 +115,8 @@ class BlockLoader:
         block_parquet = glob(path)
         # fips_list = [f.split('__')[-1].split('.')[0] for f in block_parquet]
         filepaths = [f for f in block_parquet if f.split('__')[-1].split('.')[0] in fips]
-        # list(set([print(f) for f in fips_list if f in list(fips)])
 
-        # for block_fp in block_parquet:
-        #     fp = block_fp.split('__')[-1].split('.')[0]
-        #     if fp in list(fips):
-        #         print(fp)   
-
-        # filepaths = [
-        # [print(f) for f in block_parquet if f.split('__')[-1].split('.')[0] in fips]
-
-        # [print(f) for f in filepaths]
-
-        self._rgb, self._bgr = self.sort_stat_tables(filepaths)
+        self._rgb, self._bgr = self.sort_stat_tables(sorted(filepaths))
 
 
         return None
@@ -71,27 +130,41 @@ class BlockLoader:
         return (rgb, bgr)
     
     def load_files(self) -> None: 
-        
-        import pandas as pd
-
-        # [print(i) for i in self._rgb]
 
         if len(self._rgb) > 0:
-            self.RACE_GIVEN_BLOCK = pd.concat([self.load_parquet(f) for f in self._rgb])
-            self.BLOCK_GIVEN_RACE = pd.concat([self.load_parquet(f) for f in self._bgr])
+            self.RACE_GIVEN_BLOCK = pd.concat(self._read_partitions(self._rgb))
+            self.BLOCK_GIVEN_RACE = pd.concat(self._read_partitions(self._bgr))
         else: 
             raise Exception('No files found')       
         return None
 
-
-    def load_parquet(self, filepath:str):
+    def load_parquet(self, filepath:str, blocks:list[str] = None):
+        """Read one partition, optionally keeping only the given blocks"""
 
         import pyarrow as pa
         import pyarrow.parquet as pq
-        
-        testload = pq.read_table(filepath)
+
+        filters = None
+        if blocks is not None:
+            filters = [('block', 'in', list(blocks))]
+        testload = pq.read_table(filepath, filters=filters)
         return pa.Table.to_pandas(testload)
 
+    def _read_partitions(self, filepaths: list[str], blocks: list[str] = None) -> list:
+        """Read partitions on a thread pool, returning frames in order"""
+        if blocks is not None:
+            blocks = sorted(set(blocks))
+        max_workers = self._max_workers or min(len(filepaths), self._MAX_WORKERS)
+        if max_workers <= 1 or len(filepaths) <= 1:
+            frames = [self.load_parquet(f, blocks) for f in filepaths]
+        else:
+            with concurrent.futures.ThreadPoolExecutor(max_workers) as executor:
+                frames = list(executor.map(
+                    lambda filepath: self.load_parquet(filepath, blocks),
+                    filepaths,
+                ))
+        return frames
+
 
 class BIFSGModel(BaseModel):
     r"""Subclass for running a Bayesian Improved First Name Surname Geocode model.
@@ -107,6 +180,22 @@ class BIFSGModel(BaseModel):
        multiplying probabilities, checking input values, and obtaining
        ZCTA/name data components.
 
+    Parameters
+    ----------
+    geo_level : str
+        The geography level: 'ZCTA', 'TRACT' or 'BLOCK'
+    block_cache_bytes : int
+        Memory budget for the per-state block tables kept between calls
+        (BLOCK only). States not used recently are evicted first. Set to 0
+        to disable the cache and read only the requested blocks each call.
+    dtype : str
+        Precision of the probability tables and results: 'float64'
+        (default) or 'float32', which halves their memory (and so lets
+        the block cache hold twice as many states)
+    progress : callable
+        Optional callback given a surgeo.models.progress.StageEvent as
+        each stage of get_probabilities() starts and finishes
+
     Notes
     -----
     The surname probability dataframe for this model is identical to that
@@ -173,29 +262,45 @@ class BIFSGModel(BaseModel):
             'BLOCK': ''
         }
 
-    def __init__(self, geo_level = 'ZCTA'):
-        super().__init__()
+    # Default memory budget of the per-state block table cache (512 MiB)
+    DEFAULT_BLOCK_CACHE_BYTES = 512 * 2 ** 20
+
+    def __init__(self,
+                 geo_level = 'ZCTA',
+                 block_cache_bytes: int = DEFAULT_BLOCK_CACHE_BYTES,
+                 dtype='float64',
+                 progress=None):
+        super().__init__(dtype, progress)
 
         if geo_level in self.GEO_LEVEL_MAP:
             self._GEO_LEVEL = geo_level
         else: 
             raise Exception("geo_level parameter must be 'ZCTA', 'TRACT', 'BLOCK'")
 
-        # These data should be changed to load from pickle, too, for consistency, but they are so small that this is low priority.
-
-        race_given_surname_path = self._package_root / 'data' / 'prob_race_given_surname_2010.parquet'
-        fname_given_race = self._package_root / 'data' / 'prob_first_name_given_race_harvard.parquet'
-
-        self._PROB_RACE_GIVEN_SURNAME = self._parquet_to_df(race_given_surname_path)
-        self._PROB_FIRST_NAME_GIVEN_RACE = self._parquet_to_df(fname_given_race)
+        if block_cache_bytes < 0:
+            raise SurgeoException('block_cache_bytes must not be negative.')
+        # Least recently used state FIPS -> block LookupTable (BLOCK only)
+        self._block_cache_bytes = block_cache_bytes
+        self._block_cache = collections.OrderedDict()
+        self._block_cache_size = 0
+        self._block_states = None
+
+        # These are memory-mapped if they have been compiled, and otherwise
+        # read from parquet.
+        self._PROB_RACE_GIVEN_SURNAME = self._load_lookup(
+            'prob_race_given_surname_2010'
+        )
+        self._PROB_FIRST_NAME_GIVEN_RACE = self._load_lookup(
+            'prob_first_name_given_race_harvard'
+        )
 
         self.load_loc()
 
     def load_loc(self):
 
         if self._GEO_LEVEL in ['ZCTA', 'TRACT']:
-            loc_filepath = self._package_root / 'data' / self.GEO_LEVEL_MAP[self._GEO_LEVEL]
-            self._PROB_LOC_GIVEN_RACE = self._parquet_to_df(loc_filepath)
+            loc_table = pathlib.Path(self.GEO_LEVEL_MAP[self._GEO_LEVEL]).stem
+            self._PROB_LOC_GIVEN_RACE = self._load_lookup(loc_table, self._GEO_LEVEL)
         elif self._GEO_LEVEL in ['BLOCK']:
             '''
             Block level data is far larger than the other summary level datasets. Because of this, we will load the data on-the-fly
@@ -207,13 +312,83 @@ class BIFSGModel(BaseModel):
             raise Exception("geo_level must be either 'ZCTA', 'TRACT', or 'BLOCK'")
         
     def _block_load(self, fips:list[str]) -> None:
-        state_fips = list(set([i[:2] for i in list(set(fips))]))
-
-        bloader = BlockLoader()
-        _, self._PROB_LOC_GIVEN_RACE = bloader.load_fips(state_fips)
+        # Missing blocks are skipped (they simply get NaN probabilities)
+        blocks = self._normalize_zctas(pd.Series(pd.unique(fips))).dropna()
+        state_fips = sorted(set(blocks.str[:2]))
+
+        if self._block_cache_bytes == 0:
+            # Without a cache, only the rows for the blocks that are actually
+            # being scored are read
+            tables = self._read_block_tables(state_fips, blocks)
+            self._PROB_LOC_GIVEN_RACE = self._concat_block_tables(tables.values())
+            return None
+
+        # Chunked input usually covers the same states call after call
+        if state_fips == self._block_states:
+            return None
+
+        missing = [state for state in state_fips if state not in self._block_cache]
+        loaded = self._read_block_tables(missing) if missing else {}
+        tables = []
+        for state in state_fips:
+            if state in self._block_cache:
+                self._block_cache.move_to_end(state)
+                tables.append(self._block_cache[state])
+            elif state in loaded:
+                tables.append(loaded[state])
+        self._cache_block_tables(loaded)
+        self._PROB_LOC_GIVEN_RACE = self._concat_block_tables(tables)
+        self._block_states = state_fips
 
         return None
 
+    def _read_block_tables(self, state_fips: list[str], blocks: pd.Series = None) -> dict:
+        """Read the block -> race tables of a set of states
+
+        States that have been compiled are memory-mapped; the rest are read
+        from parquet (filtered to blocks, if given). States with no block
+        data at all are skipped (as in BlockLoader).
+
+        """
+        tables = {}
+        parquet_states = []
+        for state in state_fips:
+            name = f'prob_block_given_race_2010__{state}'
+            if self._is_compiled(name):
+                tables[state] = self._read_lookup(name)
+            elif (self._package_root / 'data' / f'{name}.parquet').exists():
+                parquet_states.append(state)
+        if parquet_states:
+            partitions = BlockLoader().load_partitions(
+                parquet_states,
+                'block_given_race',
+                blocks=blocks,
+            )
+            for state, block_given_race in partitions.items():
+                tables[state] = self._compile_lookup(block_given_race, 'block')
+        return tables
+
+    def _cache_block_tables(self, tables: dict) -> None:
+        """Add state tables to the cache, evicting the least recently used"""
+        for state, table in tables.items():
+            # A state larger than the whole budget is used but not kept
+            if table.nbytes > self._block_cache_bytes:
+                continue
+            self._block_cache[state] = table
+            self._block_cache_size += table.nbytes
+        while self._block_cache_size > self._block_cache_bytes:
+            _, table = self._block_cache.popitem(last=False)
+            self._block_cache_size -= table.nbytes
+
+    def _concat_block_tables(self, tables) -> LookupTable:
+        """Combine state tables (whose block GEOIDs never overlap)"""
+        tables = list(tables)
+        if len(tables) == 0:
+            raise SurgeoException('No files found')
+        if len(tables) == 1:
+            return tables[0]
+        return LookupTable.concat(tables)
+
     def get_probabilities(self, first_names, surnames, zctas):
         """Obtain a set of BIFSG probabilities for first_name/surname/ZCTA
         series
@@ -244,8 +419,8 @@ class BIFSGModel(BaseModel):
         """
 
         if self._GEO_LEVEL == 'BLOCK':
-
-            self._block_load(zctas)
+            with self._stage('load', len(zctas)):
+                self._block_load(zctas)
 
         # Check inputs
         self._check_inputs(first_names, surnames, zctas)
@@ -268,21 +443,78 @@ class BIFSGModel(BaseModel):
         )
         return result
 
+    def score_records(self, first_names, surnames, zctas) -> list:
+        """Obtain BIFSG probabilities for a few records without pandas.
+
+        This is a faster equivalent of get_probabilities() for small
+        batches (one to a few hundred records): names and ZCTAs are looked
+        up in dictionaries and the posterior is computed on small NumPy
+        arrays. One dictionary of results is returned per record, keyed
+        like the columns of get_probabilities(). Models at other geo levels
+        fall back to get_probabilities().
+
+        Parameters
+        ----------
+        first_names : list
+            First names to use for the BIFSG algorithm
+        surnames : list
+            Surnames to use for the BIFSG algorithm
+        zctas : list
+            ZIP/ZCTA codes for the BIFSG algorithm
+
+        Returns
+        -------
+        list
+            One dictionary of BIFSG probability results per record
+
+        """
+        self._check_inputs(first_names, surnames, zctas)
+        if self._GEO_LEVEL != 'ZCTA':
+            # Block tables are loaded for each call by get_probabilities()
+            return self.get_probabilities(
+                pd.Series(list(first_names), dtype=object),
+                pd.Series(list(surnames), dtype=object),
+                pd.Series(list(zctas), dtype=object),
+            ).to_dict(orient='records')
+        race_columns = self._PROB_RACE_GIVEN_SURNAME.columns
+        first_names = [self._normalize_record_name(name) for name in first_names]
+        surnames = [self._normalize_record_name(name) for name in surnames]
+        first_name_probs = self._record_probs(
+            first_names,
+            self._PROB_FIRST_NAME_GIVEN_RACE,
+            race_columns,
+        )
+        sur_probs = self._record_probs(surnames, self._PROB_RACE_GIVEN_SURNAME)
+        geo_columns, geo_probs = self._record_geo_probs(
+            zctas,
+            self._PROB_LOC_GIVEN_RACE,
+            race_columns,
+        )
+        bifsg_probs = self._fused_posterior([first_name_probs, sur_probs, geo_probs])
+        return self._to_records(
+            {**geo_columns, 'first_name': first_names, 'surname': surnames},
+            bifsg_probs,
+            race_columns,
+        )
+
     def _combined_probs(self,
                         first_name_probs: pd.DataFrame,
                         sur_probs: pd.DataFrame,
                         geo_probs: pd.DataFrame) -> pd.DataFrame:
         """Performs the BIFSG calculation"""
-        # Calculate each of the numerators
-        bifsg_numer = (
-            first_name_probs.iloc[:, 1:] *
-            sur_probs.iloc[:, 1:] *
-            geo_probs.iloc[:, 1:]
-        )
-        # Calculate the denominator
-        bifsg_denom = bifsg_numer.sum(axis=1)
-        # Caluclate the bifsg probabilities (each num / denom)
-        bifsg_probs = bifsg_numer.div(bifsg_denom, axis=0)
+        race_columns = self._PROB_RACE_GIVEN_SURNAME.columns
+        with self._stage('combine', len(sur_probs)):
+            # Multiply the components and divide by their row sums in one pass
+            bifsg_array = self._fused_posterior([
+                first_name_probs[race_columns].to_numpy(),
+                sur_probs[race_columns].to_numpy(),
+                geo_probs[race_columns].to_numpy(),
+            ])
+            bifsg_probs = pd.DataFrame(
+                bifsg_array,
+                index=sur_probs.index,
+                columns=race_columns,
+            )
         return bifsg_probs
 
     def _adjust_frame(self,
@@ -291,16 +523,17 @@ class BIFSGModel(BaseModel):
                       geo_probs: pd.DataFrame,
                       bifsg_probs: pd.DataFrame) -> pd.DataFrame:
         # Build frame from zctas, first names, surnames, and probabilities
-        bifsg_data = pd.concat([
-            geo_probs['zcta5'].to_frame(),
-            first_name_probs
-                .rename(columns={'name': 'first_name'})['first_name']
-                .to_frame(),
-            sur_probs
-                .rename(columns={'name': 'surname'})['surname']
-                .to_frame(),
-            bifsg_probs
-        ], axis=1)
+        with self._stage('assemble', len(bifsg_probs)):
+            bifsg_data = pd.concat([
+                geo_probs['zcta5'].to_frame(),
+                first_name_probs
+                    .rename(columns={'name': 'first_name'})['first_name']
+                    .to_frame(),
+                sur_probs
+                    .rename(columns={'name': 'surname'})['surname']
+                    .to_frame(),
+                bifsg_probs
+            ], axis=1)
         return bifsg_data
 
     def _check_inputs(self,
@@ -320,49 +553,22 @@ class BIFSGModel(BaseModel):
             raise SurgeoException(err_string)
 
     def _get_first_name_probs(self, first_names: pd.Series) -> pd.DataFrame:
-        """Normalizes ZCTAs/ZIPs and joins them to their race probs."""
-        # Normalize
-        normalized_first_names = (
-            self._normalize_names(first_names)
-                .to_frame()
-        )
-        # Merge names to dataframe, which gives probs for each name.
-        first_name_probs = normalized_first_names.merge(
+        """Normalizes first names and joins them to their race probs."""
+        first_name_probs = self._get_name_probs(
+            first_names,
             self._PROB_FIRST_NAME_GIVEN_RACE,
-            left_on='name',
-            right_index=True,
-            how='left',
         )
         return first_name_probs
 
     def _get_surname_probs(self, surnames: pd.Series) -> pd.DataFrame:
         """Normalizes names and joins names to their race probabilities."""
-        # Normalize names
-        normalized_names = (
-            self._normalize_names(surnames)
-                .to_frame()
-        )
-        # Merge names to dataframe, which gives probs for each name
-        surname_probs = normalized_names.merge(
+        surname_probs = self._get_name_probs(
+            surnames,
             self._PROB_RACE_GIVEN_SURNAME,
-            left_on='name',
-            right_index=True,
-            how='left',
         )
         return surname_probs
 
     def _get_geocode_probs(self, zctas: pd.Series) -> pd.DataFrame:
         """Normalizes ZCTAs/ZIPs and joins them to their race probs."""
-        # Normalize
-        normalized_zctas = (
-            self._normalize_zctas(zctas)
-                .to_frame()
-        )
-        # Merge names to dataframe, which gives probs for each name.
-        geocode_probs = normalized_zctas.merge(
-            self._PROB_LOC_GIVEN_RACE,
-            left_on='zcta5',
-            right_index=True,
-            how='left',
-        )
+        geocode_probs = self._get_zcta_probs(zctas, self._PROB_LOC_GIVEN_RACE)
         return geocode_probs
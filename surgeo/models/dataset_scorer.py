@@ -0,0 +1,282 @@
+"""Module containing the DatasetScorer class"""
+
+import concurrent.futures
+import glob
+import os
+import pathlib
+
+import pandas as pd
+
+from surgeo.utility.surgeo_exception import SurgeoException
+
+
+# Scorer owned by each worker process (populated by _init_worker)
+_WORKER_SCORER = None
+
+
+def _init_worker(scorer):
+    """Keep a copy of the scorer (its model is loaded on first use)"""
+    global _WORKER_SCORER
+    _WORKER_SCORER = scorer
+
+
+def _score_fragment(fragment, schema, output_path):
+    """Score one fragment in a worker process"""
+    return _WORKER_SCORER._write_fragment(fragment, schema, output_path)
+
+
+class DatasetScorer(object):
+    """Scores partitioned datasets that are larger than memory.
+
+    This class:
+
+    1. Opens a directory of files, a glob of files, a list of files or a
+       pyarrow.dataset.Dataset as a dataset of fragments (one per file);
+    2. Reads each fragment in batches of batch_size rows and scores them
+       with a model that is created once (per worker process) and reused,
+       so the lookup tables are loaded once; and,
+    3. Writes the results of each fragment to its own parquet file, at the
+       same relative path under the output directory (so hive partition
+       directories such as state=MO/ are kept).
+
+    score_frame() scores a single dataframe, and can be given to Dask's
+    DataFrame.map_partitions() to score a Dask DataFrame.
+
+    Parameters
+    ----------
+    model_class : type
+        The model class to run (e.g. SurgeoModel or BIFSGModel)
+    *model_args
+        Positional arguments used to instantiate model_class (e.g. 'TRACT')
+    columns : list
+        The input column for each argument of the model's
+        get_probabilities(), in order. An entry that is itself a list of
+        columns is passed as a dataframe (e.g. state, county and tract).
+    id_columns : list
+        Input columns to copy in front of the results (e.g. record IDs)
+    workers : int
+        Number of worker processes scoring fragments at once (default 1,
+        which scores them in this process)
+    batch_size : int
+        The most rows read and scored at once
+
+    Example
+    -------
+        .. code-block:: python
+
+            scorer = surgeo.DatasetScorer(
+                surgeo.SurgeoModel,
+                columns=['surname', 'zcta5'],
+                id_columns=['loan_id'],
+                workers=4,
+            )
+            scorer.score_dataset('loans/', 'scored/')
+
+            # Or with Dask
+            scored = loans.map_partitions(scorer.score_frame)
+
+    """
+
+    _COMPRESSION_SUFFIXES = ('.gz', '.bz2', '.zst')
+
+    def __init__(self,
+                 model_class,
+                 *model_args,
+                 columns,
+                 id_columns=None,
+                 workers=1,
+                 batch_size=100_000):
+        if workers < 1:
+            raise SurgeoException('workers must be a positive integer.')
+        if batch_size < 1:
+            raise SurgeoException('batch_size must be a positive integer.')
+        self._model_class = model_class
+        self._model_args = model_args
+        self._columns = list(columns)
+        self._id_columns = list(id_columns or [])
+        self._workers = workers
+        self._batch_size = batch_size
+        self._model = None
+
+    def __getstate__(self):
+        # Workers (and Dask) load their own model instead of unpickling one
+        state = self.__dict__.copy()
+        state['_model'] = None
+        return state
+
+    def score_frame(self, df: pd.DataFrame) -> pd.DataFrame:
+        """Score a dataframe holding the input columns
+
+        Parameters
+        ----------
+        df : pd.DataFrame
+            The input rows (e.g. one partition of a Dask DataFrame)
+
+        Returns
+        -------
+        pd.DataFrame
+            The ID columns followed by the model's results, with the index
+            of df
+
+        """
+        result = self._score(df.reset_index(drop=True))
+        if self._id_columns:
+            ids = df[self._id_columns].reset_index(drop=True)
+            result = pd.concat([ids, result], axis=1)
+        result.index = df.index
+        return result
+
+    def score_dataset(self, source, output_dir, format='parquet') -> list:
+        """Score every fragment of a dataset into its own parquet file
+
+        Parameters
+        ----------
+        source : Union[str, pathlib.Path, list, pyarrow.dataset.Dataset]
+            A directory (read with hive partitioning), a glob pattern such
+            as 'loans/*.parquet', a list of files, or a dataset
+        output_dir : Union[str, pathlib.Path]
+            The directory to write the results to
+        format : str
+            The format of the source files ('parquet', 'feather', 'csv',
+            ...) unless source is already a dataset
+
+        Returns
+        -------
+        list
+            The paths of the files written, in fragment order
+
+        """
+        dataset = self._open_dataset(source, format)
+        fragments = list(dataset.get_fragments())
+        output_paths = self._output_paths(fragments, pathlib.Path(output_dir))
+        if self._workers == 1 or len(fragments) < 2:
+            for fragment, output_path in zip(fragments, output_paths):
+                self._write_fragment(fragment, dataset.schema, output_path)
+            return output_paths
+        with concurrent.futures.ProcessPoolExecutor(
+            max_workers=min(self._workers, len(fragments)),
+            initializer=_init_worker,
+            initargs=(self,),
+        ) as executor:
+            futures = [
+                executor.submit(_score_fragment, fragment, dataset.schema, output_path)
+                for fragment, output_path in zip(fragments, output_paths)
+            ]
+            for future in futures:
+                future.result()
+        return output_paths
+
+    def _get_model(self):
+        """Instantiate the model on first use"""
+        if self._model is None:
+            self._model = self._model_class(*self._model_args)
+        return self._model
+
+    def _score(self, df: pd.DataFrame) -> pd.DataFrame:
+        """Run the model over the input columns of a dataframe"""
+        args = []
+        for column in self._columns:
+            try:
+                args.append(df[column])
+            except KeyError:
+                raise SurgeoException(f'Column "{column}" not found.')
+        return self._get_model().get_probabilities(*args)
+
+    def _input_columns(self) -> list:
+        """The columns to read: the ID columns plus the model's columns"""
+        columns = list(self._id_columns)
+        for column in self._columns:
+            columns.extend(column if isinstance(column, list) else [column])
+        return list(dict.fromkeys(columns))
+
+    def _write_fragment(self, fragment, schema, output_path) -> int:
+        """Score a fragment batch by batch and write it to output_path
+
+        ID columns are taken straight from the Arrow batches, so their
+        types can't change from one batch to the next.
+
+        """
+        import pyarrow.parquet as pq
+
+        columns = self._input_columns()
+        missing = [column for column in columns if column not in schema.names]
+        if missing:
+            raise SurgeoException(f'Columns {missing} not found in the dataset.')
+        batches = fragment.to_batches(
+            schema=schema,
+            columns=columns,
+            batch_size=self._batch_size,
+        )
+        output_path.parent.mkdir(parents=True, exist_ok=True)
+        writer = None
+        rows = 0
+        try:
+            for batch in batches:
+                if writer is not None and not batch.num_rows:
+                    continue
+                table = self._result_table(batch)
+                if writer is None:
+                    writer = pq.ParquetWriter(output_path, table.schema)
+                writer.write_table(table.cast(writer.schema))
+                rows += batch.num_rows
+            if writer is None:
+                # An empty fragment still gets a file with the columns
+                table = self._result_table(schema.empty_table().select(columns))
+                writer = pq.ParquetWriter(output_path, table.schema)
+                writer.write_table(table)
+        finally:
+            if writer is not None:
+                writer.close()
+        return rows
+
+    def _result_table(self, batch):
+        """Score an Arrow batch (or table) into a table of results"""
+        import pyarrow as pa
+
+        # Integer ZCTAs with blanks would otherwise become floats (631.0)
+        result = self._score(batch.to_pandas(integer_object_nulls=True))
+        table = pa.Table.from_pandas(result, preserve_index=False)
+        for i, column in enumerate(self._id_columns):
+            table = table.add_column(i, column, batch.column(column))
+        return table
+
+    def _open_dataset(self, source, format):
+        """Open the source as a pyarrow dataset"""
+        import pyarrow.dataset as ds
+
+        if isinstance(source, ds.Dataset):
+            return source
+        if format == 'csv':
+            import pyarrow.csv
+
+            # Blank names and ZCTAs are missing, as they are in pandas
+            format = ds.CsvFileFormat(
+                convert_options=pyarrow.csv.ConvertOptions(strings_can_be_null=True),
+            )
+        if isinstance(source, (list, tuple)):
+            return ds.dataset([str(path) for path in source], format=format)
+        source = str(source)
+        if any(character in source for character in '*?['):
+            paths = sorted(glob.glob(source, recursive=True))
+            if not paths:
+                raise SurgeoException(f'No files match "{source}".')
+            return ds.dataset(paths, format=format)
+        if not os.path.exists(source):
+            raise SurgeoException(f'"{source}" not found.')
+        return ds.dataset(source, format=format, partitioning='hive')
+
+    def _output_paths(self, fragments, output_dir) -> list:
+        """Each fragment's path relative to their common folder, as parquet"""
+        paths = [pathlib.PurePath(fragment.path) for fragment in fragments]
+        if not paths:
+            return []
+        root = pathlib.PurePath(os.path.commonpath([path.parent for path in paths]))
+        output_paths = []
+        for path in paths:
+            relative = path.relative_to(root)
+            if relative.suffix in self._COMPRESSION_SUFFIXES:
+                relative = relative.with_suffix('')
+            output_paths.append(output_dir / relative.with_suffix('.parquet'))
+        if len(set(output_paths)) < len(output_paths):
+            raise SurgeoException('Several input files would be written to the same output file.')
+        return output_paths
@@ -12,6 +12,15 @@ class FirstNameModel(BaseModel):
     mechanism for obtaining race data. It is created using a simple join
     of a race data table and the first names that are input.
 
+    Parameters
+    ----------
+    dtype : str
+        Precision of the probability tables and results: 'float64'
+        (default) or 'float32', which halves their memory
+    progress : callable
+        Optional callback given a surgeo.models.progress.StageEvent as
+        each stage of get_probabilities() starts and finishes
+
     Notes
     -----
     The manner in which the first name data file was created can be found in
@@ -22,9 +31,11 @@ class FirstNameModel(BaseModel):
 
     """
 
-    def __init__(self):
-        super().__init__()
-        self._PROB_RACE_GIVEN_FIRST_NAME = self._get_prob_race_given_first_name()
+    def __init__(self, dtype='float64', progress=None):
+        super().__init__(dtype, progress)
+        self._PROB_RACE_GIVEN_FIRST_NAME = self._load_lookup(
+            'prob_race_given_first_name_harvard'
+        )
 
     def get_probabilities(self, names):
         """Obtain race probabilities for a set of first names.
@@ -41,18 +52,39 @@ class FirstNameModel(BaseModel):
 
         """
 
-        # Clean and process names (consistent with Word et al)
-        normalized_names = (
-            self._normalize_names(names)
-                .to_frame()
-        )
-        # Do a simple join to obtain the names along with provs.
-        first_name_probs = normalized_names.merge(
+        # Clean and process names (consistent with Word et al) and join
+        # them to their probs.
+        first_name_probs = self._get_name_probs(
+            names,
             self._PROB_RACE_GIVEN_FIRST_NAME,
-            left_on='name',
-            right_index=True,
-            how='left',
         )
         # Rename to avoid clashes with "name"
         first_name_probs = first_name_probs.rename(columns={'name': 'first_name'})
         return first_name_probs
+
+    def score_records(self, names) -> list:
+        """Obtain race probabilities for a few first names without pandas.
+
+        This is a faster equivalent of get_probabilities() for small
+        batches (one to a few hundred names). Each name is looked up in a
+        dictionary, and one dictionary of results is returned per name,
+        keyed like the columns of get_probabilities().
+
+        Parameters
+        ----------
+        names : list
+            first names to which to attach race probability data
+
+        Return
+        ------
+        list
+            One dictionary of race probability results per name
+
+        """
+        names = [self._normalize_record_name(name) for name in names]
+        probs = self._record_probs(names, self._PROB_RACE_GIVEN_FIRST_NAME)
+        return self._to_records(
+            {'first_name': names},
+            probs,
+            self._PROB_RACE_GIVEN_FIRST_NAME.columns,
+        )
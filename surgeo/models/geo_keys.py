@@ -0,0 +1,205 @@
+"""Module containing the integer encodings of the geographic keys
+
+ZCTAs, census tracts and census blocks are joined to their probabilities as
+integers rather than as strings:
+
+* ZCTA: the five digit code as a uint32 (e.g. '00631' -> 631);
+* Tract: state, county and tract packed into one 11 digit int64
+  (state * 10**9 + county * 10**6 + tract); and,
+* Block: the 15 digit GEOID as an int64.
+
+Values that are missing, or that are not made up of the expected number of
+digits, are encoded as MISSING_KEY and so never match a reference key.
+
+"""
+
+import numpy as np
+import pandas as pd
+
+from surgeo.utility.surgeo_exception import SurgeoException
+
+
+# Code given to missing and malformed values
+MISSING_KEY = -1
+
+# dtype of the encoded keys stored in lookup tables
+KEY_DTYPES = {
+    'zcta': np.uint32,
+    'tract': np.int64,
+    'block': np.int64,
+}
+
+_ZCTA_WIDTH = 5
+
+_BLOCK_WIDTH = 15
+
+# Name and number of digits of each part of a tract key
+_TRACT_PARTS = (('state', 2), ('county', 3), ('tract', 6))
+
+
+def encode_keys(keys, encoding: str) -> np.ndarray:
+    """Encode ZCTAs, blocks, or state/county/tract keys as int64 codes
+
+    Parameters
+    ----------
+    keys : Union[pd.Series, pd.DataFrame, pd.Index, np.ndarray]
+        Normalized ZCTA or block strings (or integers); for tracts, a
+        dataframe (or MultiIndex) of state, county and tract columns
+    encoding : str
+        One of 'zcta', 'tract' or 'block'
+
+    Returns
+    -------
+    np.ndarray
+        An int64 code per key (MISSING_KEY where the key is not valid)
+
+    """
+    if encoding == 'zcta':
+        return encode_digits(keys, _ZCTA_WIDTH)
+    if encoding == 'block':
+        return encode_digits(keys, _BLOCK_WIDTH)
+    if encoding == 'tract':
+        return encode_tracts(keys)
+    raise SurgeoException(f'Unknown key encoding: {encoding}')
+
+
+def decode_keys(codes: np.ndarray, encoding: str) -> pd.Index:
+    """Turn codes back into the zero-padded string keys they came from"""
+    codes = np.asarray(codes, dtype=np.int64)
+    if encoding == 'zcta':
+        return pd.Index(_zero_pad(codes, _ZCTA_WIDTH), name='zcta5')
+    if encoding == 'block':
+        return pd.Index(_zero_pad(codes, _BLOCK_WIDTH), name='block')
+    if encoding == 'tract':
+        return pd.MultiIndex.from_arrays(
+            [
+                _zero_pad(codes // 10 ** 9, 2),
+                _zero_pad(codes // 10 ** 6 % 10 ** 3, 3),
+                _zero_pad(codes % 10 ** 6, 6),
+            ],
+            names=[name for name, _ in _TRACT_PARTS],
+        )
+    raise SurgeoException(f'Unknown key encoding: {encoding}')
+
+
+def encode_key(key, encoding: str) -> int:
+    """Encode a single key (see encode_keys()) without building arrays
+
+    Parameters
+    ----------
+    key : Union[str, int, tuple]
+        A normalized ZCTA or block, or a (state, county, tract) tuple
+    encoding : str
+        One of 'zcta', 'tract' or 'block'
+
+    Returns
+    -------
+    int
+        The key's code (MISSING_KEY if the key is not valid)
+
+    """
+    if encoding == 'zcta':
+        return _encode_digit(key, _ZCTA_WIDTH, exact=True)
+    if encoding == 'block':
+        return _encode_digit(key, _BLOCK_WIDTH, exact=True)
+    if encoding == 'tract':
+        if not isinstance(key, tuple) or len(key) != len(_TRACT_PARTS):
+            return MISSING_KEY
+        state, county, tract = (
+            _encode_digit(part, width, exact=False)
+            for part, (_, width) in zip(key, _TRACT_PARTS)
+        )
+        if state < 0 or county < 0 or tract < 0:
+            return MISSING_KEY
+        return state * 10 ** 9 + county * 10 ** 6 + tract
+    raise SurgeoException(f'Unknown key encoding: {encoding}')
+
+
+def _encode_digit(value, width: int, exact: bool) -> int:
+    """Encode one digit string or non-negative integer (see encode_digits())"""
+    if isinstance(value, str):
+        valid = (
+            value.isascii()
+            and value.isdigit()
+            and (len(value) == width if exact else 1 <= len(value) <= width)
+        )
+        return int(value) if valid else MISSING_KEY
+    if isinstance(value, (int, float, np.integer, np.floating)) and not isinstance(value, bool):
+        if 0 <= value < 10 ** width and value == int(value):
+            return int(value)
+    return MISSING_KEY
+
+
+def encode_tracts(keys) -> np.ndarray:
+    """Pack state, county and tract columns into 11 digit int64 codes
+
+    Each part may be given as digits without its leading zeros (e.g. a
+    state of 1 or '1' is read as '01').
+    """
+    if isinstance(keys, pd.MultiIndex):
+        keys = keys.to_frame(index=False)
+    if keys.shape[1] != len(_TRACT_PARTS):
+        raise SurgeoException(
+            f'Tract keys need state, county, and tract columns. '
+            f'Columns found: {list(keys.columns)}.'
+        )
+    state, county, tract = (
+        encode_digits(keys.iloc[:, position], width, exact=False)
+        for position, (_, width) in enumerate(_TRACT_PARTS)
+    )
+    codes = state * 10 ** 9 + county * 10 ** 6 + tract
+    codes[(state < 0) | (county < 0) | (tract < 0)] = MISSING_KEY
+    return codes
+
+
+def encode_digits(values, width: int, exact: bool = True) -> np.ndarray:
+    """Encode digit strings (or non-negative integers) as int64 codes
+
+    Parameters
+    ----------
+    values : Union[pd.Series, pd.Index, np.ndarray, pyarrow.Array]
+        Strings or numbers to encode
+    width : int
+        The number of digits of a valid value
+    exact : bool
+        Whether strings must have exactly width digits (otherwise 1 to
+        width digits are accepted, as if they had been zero-padded)
+
+    Returns
+    -------
+    np.ndarray
+        An int64 code per value (MISSING_KEY where the value is not valid)
+
+    """
+    import pyarrow as pa
+    import pyarrow.compute as pc
+
+    if isinstance(values, (pa.Array, pa.ChunkedArray)):
+        values = pd.Series(pd.arrays.ArrowExtensionArray(values))
+    series = pd.Series(values, copy=False).reset_index(drop=True)
+    if pd.api.types.is_numeric_dtype(series) and not pd.api.types.is_bool_dtype(series):
+        numbers = series.to_numpy(dtype=np.float64, na_value=np.nan)
+        valid = (numbers >= 0) & (numbers < 10 ** width) & (numbers == np.floor(numbers))
+        codes = np.full(len(numbers), MISSING_KEY, dtype=np.int64)
+        codes[valid] = series[valid].to_numpy(dtype=np.int64)
+        return codes
+    try:
+        strings = pa.array(series, type=pa.large_string(), from_pandas=True)
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        # e.g. object columns mixing numbers and strings
+        strings = pa.array(
+            series.map(lambda value: value if pd.isna(value) else str(value)),
+            type=pa.large_string(),
+            from_pandas=True,
+        )
+    digits = f'{{{width}}}' if exact else f'{{1,{width}}}'
+    valid = pc.fill_null(pc.match_substring_regex(strings, f'^[0-9]{digits}$'), False)
+    codes = pc.cast(pc.if_else(valid, strings, '0'), pa.int64())
+    codes = codes.to_numpy(zero_copy_only=False).astype(np.int64, copy=True)
+    codes[~valid.to_numpy(zero_copy_only=False)] = MISSING_KEY
+    return codes
+
+
+def _zero_pad(codes: np.ndarray, width: int) -> np.ndarray:
+    """Format integer codes as zero-padded strings"""
+    return pd.Series(codes).astype(str).str.zfill(width).to_numpy(dtype=object)
@@ -12,6 +12,17 @@ class GeocodeModel(BaseModel):
     mechanism for obtaining race data. It is created using a simple join
     of a race data table and the ZIPs/ZCTAs that are input.
 
+    Parameters
+    ----------
+    geo_level : str
+        The geography level: 'ZCTA' or 'TRACT'
+    dtype : str
+        Precision of the probability tables and results: 'float64'
+        (default) or 'float32', which halves their memory
+    progress : callable
+        Optional callback given a surgeo.models.progress.StageEvent as
+        each stage of get_probabilities() starts and finishes
+
     Notes
     -----
     ZIP Code Tabulation Areas (ZCTAs) are approximations for US Postal ZIP
@@ -30,12 +41,22 @@ class GeocodeModel(BaseModel):
 
     """
 
-    def __init__(self, geo_level='ZCTA'):
-        super().__init__()
+    def __init__(self, geo_level='ZCTA', dtype='float64', progress=None):
+        super().__init__(dtype, progress)
         if geo_level.upper() == 'TRACT':
-            self._PROB_RACE_GIVEN_GEO = self._get_prob_race_given_tract()
+            self._PROB_RACE_GIVEN_GEO = self._load_lookup(
+                'prob_race_given_tract_2010',
+                'TRACT',
+                lambda: self._compile_lookup(
+                    self._get_prob_race_given_tract(),
+                    'tract',
+                ),
+            )
         else:
-            self._PROB_RACE_GIVEN_GEO = self._get_prob_race_given_zcta()
+            self._PROB_RACE_GIVEN_GEO = self._load_lookup(
+                'prob_race_given_zcta_2010',
+                'ZCTA',
+            )
 
     def get_probabilities(self, zctas):
         """Obtain race probabilities for a set of ZIP codes or ZCTAs.
@@ -52,18 +73,8 @@ class GeocodeModel(BaseModel):
 
         """
 
-        # Clean ZCTAs
-        normalized_zctas = (
-            self._normalize_zctas(zctas)
-                .to_frame()
-        )
-        # Merge ZCTAs to race probabilities
-        geocode_probs = normalized_zctas.merge(
-            self._PROB_RACE_GIVEN_GEO,
-            left_on='zcta5',
-            right_index=True,
-            how='left',
-        )
+        # Clean ZCTAs and merge them to race probabilities
+        geocode_probs = self._get_zcta_probs(zctas, self._PROB_RACE_GIVEN_GEO)
         return geocode_probs
 
     def get_probabilities_tract(self, geo_df):
@@ -81,14 +92,28 @@ class GeocodeModel(BaseModel):
 
         """
 
-        normalized_tracts = (
-            self._normalize_tracts(geo_df)
-        )
-        # Merge ZCTAs to race probabilities
-        geocode_probs = normalized_tracts.merge(
-            self._PROB_RACE_GIVEN_GEO,
-            left_on=['state','county','tract'],
-            right_index=True,
-            how='left',
-        )
+        # Clean tracts and look up their race probabilities
+        geocode_probs = self._get_tract_probs(geo_df, self._PROB_RACE_GIVEN_GEO)
         return geocode_probs
+
+    def score_records(self, geos) -> list:
+        """Obtain race probabilities for a few ZCTAs or tracts without pandas.
+
+        This is a faster equivalent of get_probabilities() (or, for tract
+        models, get_probabilities_tract()) for small batches. One
+        dictionary of results is returned per input, keyed like the
+        columns of the dataframe version.
+
+        Parameters
+        ----------
+        geos : list
+            ZIPs/ZCTAs, or (state, county, tract) tuples for tract models
+
+        Return
+        ------
+        list
+            One dictionary of race probability results per input
+
+        """
+        geo_columns, probs = self._record_geo_probs(geos, self._PROB_RACE_GIVEN_GEO)
+        return self._to_records(geo_columns, probs, self._PROB_RACE_GIVEN_GEO.columns)
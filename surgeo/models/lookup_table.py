@@ -0,0 +1,344 @@
+"""Module containing the LookupTable class used by the Surgeo models"""
+
+import json
+import pathlib
+
+import numpy as np
+import pandas as pd
+
+from surgeo.models.geo_keys import (
+    KEY_DTYPES,
+    MISSING_KEY,
+    decode_keys,
+    encode_key,
+    encode_keys,
+)
+from surgeo.utility.surgeo_exception import SurgeoException
+
+
+class LookupTable(object):
+    """A compiled, read-only probability table.
+
+    Rather than joining inputs to a string-indexed dataframe with
+    DataFrame.merge() on every call (which rebuilds a hash table and copies
+    the frame each time), the models compile each of their probability
+    dataframes into a LookupTable once when they load. A lookup is then a
+    vectorized key -> row id step followed by a take() from a contiguous
+    float array.
+
+    The keys are held in one of two forms:
+
+    1. A pandas Index, whose hash table is built once and cached (used when
+       a table is compiled in memory from a dataframe); or,
+    2. A sorted NumPy array searched with np.searchsorted() (used by tables
+       saved with save() and memory-mapped with open(), which need no hash
+       table at all and can be shared through the page cache).
+
+    Geographic tables are keyed by integers (see surgeo.models.geo_keys)
+    rather than strings. Such a table records its key_encoding, and the
+    ZCTA, block, or state/county/tract keys passed to get_rows() are
+    encoded the same way before they are matched.
+
+    The value array carries one extra all-NaN row at the end. Keys that are
+    not found are given a row id of -1, which takes that row, so missing
+    keys produce NaN probabilities exactly as a left merge would.
+
+    Parameters
+    ----------
+    keys : Union[pd.Index, np.ndarray]
+        Unique keys (a MultiIndex for multi-column keys such as tracts), or
+        a sorted array of unique keys (which is trusted, not checked)
+    values : np.ndarray
+        A 2-D array of probabilities with one row per key plus the trailing
+        all-NaN row
+    columns : list
+        The column labels of values
+    key_names : list
+        The name of each key level (defaults to the index names)
+    key_encoding : str
+        'zcta', 'tract' or 'block' if the keys are integer codes, or None
+
+    """
+
+    _KEYS_FILE = 'keys.npy'
+
+    _VALUES_FILE = 'values.npy'
+
+    _META_FILE = 'meta.json'
+
+    # Smallest input (as a share of the table's keys) looked up with Arrow
+    _INDEX_IN_MIN_RATIO = 0.25
+
+    def __init__(self,
+                 keys,
+                 values: np.ndarray,
+                 columns: list,
+                 key_names: list = None,
+                 key_encoding: str = None):
+        if len(keys) + 1 != len(values):
+            raise SurgeoException(
+                f'Length mismatch. '
+                f'Key length: {len(keys)}. '
+                f'Value length: {len(values)} (including the missing row).'
+            )
+        if isinstance(keys, pd.Index):
+            if not keys.is_unique:
+                raise SurgeoException('Lookup table keys must be unique.')
+            if key_names is None:
+                key_names = list(keys.names)
+        self._keys = keys
+        self._values = values
+        if self._values.flags.writeable:
+            self._values.flags.writeable = False
+        self.columns = list(columns)
+        self.key_names = list(key_names) if key_names is not None else [None]
+        self.key_encoding = key_encoding
+        # Arrow copy of string keys, built on the first string lookup
+        self._arrow_keys = None
+        # Key -> row id dictionary, built on the first get_row()
+        self._row_map = None
+
+    @classmethod
+    def from_frame(cls,
+                   df: pd.DataFrame,
+                   key_encoding: str = None,
+                   dtype=np.float64) -> 'LookupTable':
+        """Compile a key-indexed dataframe of probabilities
+
+        If key_encoding is given, the index is stored as integer codes. The
+        probabilities are stored as dtype (float64 or float32).
+        """
+        values = df.to_numpy(dtype=dtype)
+        missing_row = np.full((1, values.shape[1]), np.nan, dtype=dtype)
+        values = np.ascontiguousarray(np.vstack([values, missing_row]))
+        keys = df.index
+        if key_encoding is not None:
+            codes = encode_keys(df.index, key_encoding)
+            if (codes == MISSING_KEY).any():
+                raise SurgeoException(
+                    f'Lookup table has keys that are not valid {key_encoding} '
+                    f'codes: {list(df.index[codes == MISSING_KEY][:5])}'
+                )
+            keys = pd.Index(codes.astype(KEY_DTYPES[key_encoding]))
+        return cls(keys, values, df.columns, list(df.index.names), key_encoding)
+
+    @classmethod
+    def open(cls, directory) -> 'LookupTable':
+        """Memory-map a table written by save() without copying it"""
+        directory = pathlib.Path(directory)
+        with open(directory / cls._META_FILE) as f:
+            meta = json.load(f)
+        keys = np.load(directory / cls._KEYS_FILE, mmap_mode='r')
+        values = np.load(directory / cls._VALUES_FILE, mmap_mode='r')
+        return cls(
+            keys,
+            values,
+            meta['columns'],
+            meta['key_names'],
+            meta.get('key_encoding'),
+        )
+
+    @classmethod
+    def concat(cls, tables: list) -> 'LookupTable':
+        """Combine tables with the same columns, encoding and disjoint keys"""
+        first = tables[0]
+        if any(table.key_encoding != first.key_encoding for table in tables):
+            raise SurgeoException('Lookup tables with different key encodings.')
+        if any(isinstance(table._keys, pd.MultiIndex) for table in tables):
+            return cls.from_frame(pd.concat([table.to_frame() for table in tables]))
+        values = np.concatenate([table._values[:-1] for table in tables])
+        if all(not isinstance(table._keys, pd.Index) for table in tables):
+            # Keep memory-mapped tables searchable by sorting the result
+            keys = np.concatenate([table._keys for table in tables])
+            order = np.argsort(keys, kind='stable')
+            keys = keys.take(order)
+            values = values.take(order, axis=0)
+        else:
+            indexes = [pd.Index(np.asarray(table._keys)) for table in tables]
+            keys = indexes[0].append(indexes[1:]).rename(first.key_names[0])
+        values = np.vstack([values, first._values[-1:]])
+        return cls(keys, values, first.columns, first.key_names, first.key_encoding)
+
+    def save(self, directory) -> None:
+        """Write the table as sorted .npy arrays that open() can memory-map"""
+        if isinstance(self._keys, pd.MultiIndex):
+            raise SurgeoException('Multi-column keys cannot be saved.')
+        directory = pathlib.Path(directory)
+        directory.mkdir(parents=True, exist_ok=True)
+        keys = np.asarray(self._keys)
+        if keys.dtype == object:
+            keys = keys.astype(str)
+        order = np.argsort(keys, kind='stable')
+        values = np.vstack([self._values[:-1].take(order, axis=0), self._values[-1:]])
+        np.save(directory / self._KEYS_FILE, keys.take(order))
+        np.save(directory / self._VALUES_FILE, np.ascontiguousarray(values))
+        with open(directory / self._META_FILE, 'w') as f:
+            json.dump({
+                'columns': self.columns,
+                'key_names': self.key_names,
+                'key_encoding': self.key_encoding,
+                'dtype': self.dtype.name,
+            }, f)
+
+    @classmethod
+    def saved_dtype(cls, directory) -> np.dtype:
+        """The dtype of the probabilities of a table written by save()"""
+        directory = pathlib.Path(directory)
+        with open(directory / cls._META_FILE) as f:
+            dtype = json.load(f).get('dtype')
+        if dtype is None:
+            # Saved before the dtype was recorded; read the array's header
+            return np.load(directory / cls._VALUES_FILE, mmap_mode='r').dtype
+        return np.dtype(dtype)
+
+    def __len__(self):
+        return len(self._keys)
+
+    @property
+    def dtype(self) -> np.dtype:
+        """The dtype of the probabilities"""
+        return self._values.dtype
+
+    def astype(self, dtype) -> 'LookupTable':
+        """A copy of the table with probabilities of another precision
+
+        The table itself is returned if it already has that dtype.
+        """
+        if np.dtype(dtype) == self.dtype:
+            return self
+        return LookupTable(
+            self._keys,
+            np.ascontiguousarray(self._values, dtype=dtype),
+            self.columns,
+            self.key_names,
+            self.key_encoding,
+        )
+
+    @property
+    def nbytes(self) -> int:
+        """Approximate memory used by the keys and values"""
+        if isinstance(self._keys, pd.Index):
+            key_bytes = self._keys.memory_usage(deep=True)
+        else:
+            key_bytes = self._keys.nbytes
+        return int(key_bytes + self._values.nbytes)
+
+    def get_rows(self, keys) -> np.ndarray:
+        """Map keys to row ids (-1 for keys that are not present)"""
+        if self.key_encoding is not None:
+            return self._get_encoded_rows(keys)
+        # Arrow rebuilds its hash set of the table's keys on every call, so
+        # it only pays off for inputs that are large next to the table
+        if (
+            self._has_string_keys()
+            and not isinstance(keys, pd.DataFrame)
+            and len(keys) >= len(self._keys) * self._INDEX_IN_MIN_RATIO
+        ):
+            arrow_rows = self._index_in(keys)
+            if arrow_rows is not None:
+                return arrow_rows
+        if isinstance(self._keys, pd.Index):
+            if isinstance(keys, pd.DataFrame):
+                keys = pd.MultiIndex.from_frame(keys)
+            return self._keys.get_indexer(keys)
+        return self._search_sorted(keys)
+
+    def get_row(self, key) -> int:
+        """Map a single key to its row id (-1 if it is not present)
+
+        This is the fast path for looking up a handful of keys: it avoids
+        building any arrays. The first call builds a dictionary of every
+        key, which costs some memory (tens of MB for the name tables).
+        """
+        if self._row_map is None:
+            if isinstance(self._keys, pd.Index):
+                keys = self._keys.tolist()
+            else:
+                keys = np.asarray(self._keys).tolist()
+            self._row_map = dict(zip(keys, range(len(keys))))
+        if self.key_encoding is not None:
+            key = encode_key(key, self.key_encoding)
+        try:
+            return self._row_map.get(key, -1)
+        except TypeError:
+            # Unhashable keys are never present
+            return -1
+
+    def _search_sorted(self, keys) -> np.ndarray:
+        """Binary search for keys in the sorted key array"""
+        keys = pd.Series(np.asarray(keys, dtype=object))
+        missing = keys.isna().to_numpy()
+        search = keys.mask(missing, '').to_numpy(dtype=str)
+        rows = np.full(len(search), -1, dtype=np.intp)
+        if len(self._keys) == 0:
+            return rows
+        positions = np.searchsorted(self._keys, search)
+        positions = np.minimum(positions, len(self._keys) - 1)
+        found = (self._keys[positions] == search) & ~missing
+        rows[found] = positions[found]
+        return rows
+
+    def _get_encoded_rows(self, keys) -> np.ndarray:
+        """Encode keys as integer codes and look the codes up"""
+        codes = encode_keys(keys, self.key_encoding)
+        rows = np.full(len(codes), -1, dtype=np.intp)
+        valid = codes != MISSING_KEY
+        if not valid.any() or len(self._keys) == 0:
+            return rows
+        search = codes[valid].astype(self._keys.dtype)
+        if isinstance(self._keys, pd.Index):
+            rows[valid] = self._keys.get_indexer(search)
+        else:
+            positions = np.searchsorted(self._keys, search)
+            positions = np.minimum(positions, len(self._keys) - 1)
+            found = self._keys[positions] == search
+            rows[valid] = np.where(found, positions, -1)
+        return rows
+
+    def _has_string_keys(self) -> bool:
+        """Whether the keys are a single column of strings"""
+        if isinstance(self._keys, pd.MultiIndex):
+            return False
+        if isinstance(self._keys, pd.Index):
+            return pd.api.types.is_string_dtype(self._keys)
+        return self._keys.dtype.kind == 'U'
+
+    def _index_in(self, keys):
+        """Hash lookup of string keys with Arrow, without Python objects
+
+        Returns None (so that the caller falls back to the pandas/NumPy
+        lookup) if the keys cannot be read as an Arrow string array.
+        """
+        import pyarrow as pa
+        import pyarrow.compute as pc
+
+        try:
+            keys = pa.array(keys, type=pa.large_string(), from_pandas=True)
+        except (pa.ArrowInvalid, pa.ArrowTypeError):
+            return None
+        if self._arrow_keys is None:
+            if isinstance(self._keys, pd.Index):
+                arrow_keys = pa.Array.from_pandas(self._keys)
+            else:
+                arrow_keys = pa.array(np.asarray(self._keys))
+            self._arrow_keys = arrow_keys.cast(pa.large_string())
+        rows = pc.index_in(keys, value_set=self._arrow_keys)
+        return pc.fill_null(rows, -1).to_numpy(zero_copy_only=False).astype(np.intp)
+
+    def take(self, rows: np.ndarray) -> np.ndarray:
+        """Gather the probability rows for a set of row ids"""
+        return self._values.take(rows, axis=0)
+
+    def to_frame(self) -> pd.DataFrame:
+        """Rebuild the key-indexed dataframe of probabilities"""
+        keys = self._keys
+        if self.key_encoding is not None:
+            keys = decode_keys(np.asarray(keys), self.key_encoding)
+            keys.names = self.key_names
+        elif not isinstance(keys, pd.Index):
+            keys = pd.Index(np.asarray(keys), name=self.key_names[0])
+        return pd.DataFrame(
+            np.array(self._values[:-1]),
+            index=keys,
+            columns=self.columns,
+        )
@@ -0,0 +1,159 @@
+"""Module containing the ParallelModel class"""
+
+import concurrent.futures
+import math
+import os
+
+import pandas as pd
+
+from surgeo.utility.surgeo_exception import SurgeoException
+
+
+# Model owned by each worker process (populated by _init_worker)
+_WORKER_MODEL = None
+
+
+def _init_worker(model_class, model_args, model_kwargs=None):
+    """Instantiate the model (and load its lookup tables) once per worker"""
+    global _WORKER_MODEL
+    _WORKER_MODEL = model_class(*model_args, **(model_kwargs or {}))
+
+
+def _score_partition(method_name, partition):
+    """Run a model method against a single partition in a worker process"""
+    method = getattr(_WORKER_MODEL, method_name)
+    return method(*partition)
+
+
+class ParallelModel(object):
+    """Runs any of the Surgeo models across a pool of worker processes.
+
+    This class:
+
+    1. Starts a process pool in which every worker instantiates the wrapped
+       model exactly once (so the lookup tables are loaded once per worker
+       rather than being pickled along with every task);
+    2. Splits the inputs to get_probabilities() into row partitions and
+       scores them in the pool; and,
+    3. Reassembles the partition results in input order.
+
+    The pool is started on first use and reused by later calls. Call
+    close() (or use the model as a context manager) to shut it down.
+
+    Parameters
+    ----------
+    model_class : type
+        The model class to run (e.g. SurgeoModel or BIFSGModel)
+    *model_args
+        Positional arguments used to instantiate model_class (e.g. 'TRACT')
+    workers : int
+        Number of worker processes (defaults to os.cpu_count())
+    partition_size : int
+        Number of rows per task (defaults to splitting the input into four
+        partitions per worker, with at least 10,000 rows per partition)
+    **model_kwargs
+        Keyword arguments used to instantiate model_class in every worker
+        (e.g. dtype='float32'). They are pickled, and a progress callback
+        is called in the worker processes.
+
+    Example
+    -------
+        .. code-block:: python
+
+            with surgeo.ParallelModel(surgeo.SurgeoModel, workers=8) as model:
+                result = model.get_probabilities(surnames, zctas)
+
+    """
+
+    _MIN_PARTITION_SIZE = 10_000
+
+    _PARTITIONS_PER_WORKER = 4
+
+    def __init__(self, model_class, *model_args, workers=None, partition_size=None, **model_kwargs):
+        if workers is None:
+            workers = os.cpu_count() or 1
+        if workers < 1:
+            raise SurgeoException('workers must be a positive integer.')
+        if partition_size is not None and partition_size < 1:
+            raise SurgeoException('partition_size must be a positive integer.')
+        self._model_class = model_class
+        self._model_args = model_args
+        self._model_kwargs = model_kwargs
+        self._workers = workers
+        self._partition_size = partition_size
+        self._executor = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        """Shut down the worker processes"""
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+
+    def get_probabilities(self, *args):
+        """Obtain probabilities from the wrapped model in parallel
+
+        Parameters
+        ----------
+        *args : pd.Series or pd.DataFrame
+            The same inputs taken by the wrapped model's get_probabilities()
+
+        Returns
+        -------
+        pd.DataFrame
+            Dataframe of probability results in input order
+
+        """
+        return self._map('get_probabilities', args)
+
+    def get_probabilities_tract(self, geo_df):
+        """Obtain tract probabilities from a wrapped GeocodeModel in parallel"""
+        return self._map('get_probabilities_tract', (geo_df,))
+
+    def _get_executor(self):
+        """Start the process pool on first use"""
+        if self._executor is None:
+            self._executor = concurrent.futures.ProcessPoolExecutor(
+                max_workers=self._workers,
+                initializer=_init_worker,
+                initargs=(self._model_class, self._model_args, self._model_kwargs),
+            )
+        return self._executor
+
+    def _partition(self, args):
+        """Split each input into matching row partitions"""
+        lengths = set(len(arg) for arg in args)
+        if len(lengths) > 1:
+            raise SurgeoException(f'Length mismatch. Input lengths: {lengths}.')
+        row_count = lengths.pop() if lengths else 0
+        partition_size = self._partition_size
+        if partition_size is None:
+            partition_size = max(
+                math.ceil(row_count / (self._workers * self._PARTITIONS_PER_WORKER)),
+                self._MIN_PARTITION_SIZE,
+            )
+        partitions = []
+        for start in range(0, max(row_count, 1), partition_size):
+            # Models align their component frames on a fresh RangeIndex
+            partition = tuple(
+                arg.iloc[start:start + partition_size].reset_index(drop=True)
+                for arg in args
+            )
+            partitions.append(partition)
+        return partitions
+
+    def _map(self, method_name, args):
+        """Score each partition in the pool and concatenate in order"""
+        partitions = self._partition(args)
+        executor = self._get_executor()
+        results = executor.map(
+            _score_partition,
+            [method_name] * len(partitions),
+            partitions,
+        )
+        return pd.concat(list(results), ignore_index=True)
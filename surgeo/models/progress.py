@@ -0,0 +1,372 @@
+"""Module containing the progress callbacks used by the models"""
+
+import sys
+import threading
+import time
+import tracemalloc
+
+
+class StageEvent(object):
+    """A report of one stage of a model's get_probabilities() call.
+
+    Models built with a progress callback call it with one of these when
+    each stage starts (finished is False and elapsed is 0) and again when
+    it finishes. The stages are:
+
+    1. 'read': reading a probability table, the first time it is used in
+       the process (rows is 0 when it starts, and the table's length when
+       it finishes);
+    2. 'load': reading block tables needed by the inputs (BIFSG blocks);
+    3. 'normalize': cleaning names, ZCTAs or tracts;
+    4. 'lookup': finding the probabilities of the normalized keys;
+    5. 'combine': multiplying and normalizing the component probabilities;
+       and,
+    6. 'assemble': building the result frame.
+
+    Models with several inputs normalize and look up each of them in turn,
+    so those stages are reported once per input. Tables are read while a
+    model is created, and 'read' stages may run inside 'load' stages.
+
+    Attributes
+    ----------
+    model : str
+        The model's class name (e.g. 'SurgeoModel')
+    stage : str
+        The stage name (see above)
+    rows : int
+        The number of input rows the stage processes
+    elapsed : float
+        Seconds spent in the stage (0 until it has finished)
+    finished : bool
+        Whether the stage has finished
+    thread : str
+        Name of the thread running the model (models shared by threads
+        report interleaved stages)
+
+    """
+
+    __slots__ = ('model', 'stage', 'rows', 'elapsed', 'finished', 'thread')
+
+    def __init__(self, model, stage, rows, elapsed=0.0, finished=False):
+        self.model = model
+        self.stage = stage
+        self.rows = rows
+        self.elapsed = elapsed
+        self.finished = finished
+        self.thread = threading.current_thread().name
+
+    def __repr__(self):
+        return (
+            f'StageEvent(model={self.model!r}, stage={self.stage!r}, '
+            f'rows={self.rows}, elapsed={self.elapsed:.6f}, '
+            f'finished={self.finished})'
+        )
+
+    @property
+    def rows_per_second(self) -> float:
+        """Throughput of a finished stage (None if it isn't measurable)"""
+        if not self.finished or self.elapsed <= 0:
+            return None
+        return self.rows / self.elapsed
+
+
+class ProgressPrinter(object):
+    """A progress callback that writes one line per finished stage.
+
+    Parameters
+    ----------
+    stream : file
+        Where to write (defaults to sys.stderr)
+
+    Example
+    -------
+        .. code-block:: python
+
+            model = surgeo.SurgeoModel(progress=ProgressPrinter())
+            model.get_probabilities(names, zctas)
+
+            # SurgeoModel normalize     1,000,000 rows   0.412 s   2,427,184 rows/s
+
+    """
+
+    def __init__(self, stream=None):
+        self._stream = stream
+        self._lock = threading.Lock()
+
+    def __getstate__(self):
+        # Sent to ParallelModel workers, which write to the same stderr
+        state = self.__dict__.copy()
+        del state['_lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def __call__(self, event: StageEvent) -> None:
+        if event.finished:
+            rate = event.rows_per_second
+            rate = f'{rate:>13,.0f} rows/s' if rate is not None else ''
+            self.write(
+                f'{event.model} {event.stage:<9} {event.rows:>11,} rows '
+                f'{event.elapsed:>8.3f} s {rate}'.rstrip()
+            )
+
+    def write(self, line: str) -> None:
+        """Write a line (e.g. a running total) between stage reports"""
+        stream = self._stream if self._stream is not None else sys.stderr
+        with self._lock:
+            print(line, file=stream, flush=True)
+
+
+class StageStats(object):
+    """The totals for one stage of one model in a ProfileReport
+
+    Attributes
+    ----------
+    model : str
+        The model's class name
+    stage : str
+        The stage name
+    calls : int
+        How many times the stage ran
+    rows : int
+        The rows processed across all calls
+    seconds : float
+        The time spent across all calls
+    peak_bytes : int
+        The most memory allocated by one call above what was in use when it
+        started (None unless the profiler tracks memory)
+
+    """
+
+    __slots__ = ('model', 'stage', 'calls', 'rows', 'seconds', 'peak_bytes')
+
+    def __init__(self, model, stage, calls=0, rows=0, seconds=0.0, peak_bytes=None):
+        self.model = model
+        self.stage = stage
+        self.calls = calls
+        self.rows = rows
+        self.seconds = seconds
+        self.peak_bytes = peak_bytes
+
+    def __repr__(self):
+        return (
+            f'StageStats(model={self.model!r}, stage={self.stage!r}, '
+            f'calls={self.calls}, rows={self.rows}, '
+            f'seconds={self.seconds:.6f}, peak_bytes={self.peak_bytes})'
+        )
+
+    @property
+    def rows_per_second(self) -> float:
+        """Throughput across all calls (None if it isn't measurable)"""
+        if self.seconds <= 0:
+            return None
+        return self.rows / self.seconds
+
+
+class ProfileReport(object):
+    """A breakdown of the time (and memory) spent in each stage
+
+    Attributes
+    ----------
+    stages : list
+        A StageStats for each model and stage, in the order they first ran
+    wall_seconds : float
+        The time from the profiler's creation (or reset) to the report
+
+    Notes
+    -----
+    Nested stages (tables read while blocks load) are counted in both, so
+    the stage times can add up to more than the wall time.
+
+    """
+
+    def __init__(self, stages, wall_seconds):
+        self.stages = stages
+        self.wall_seconds = wall_seconds
+
+    def __str__(self):
+        lines = [
+            f'{"model":<14} {"stage":<9} {"calls":>7} {"rows":>13} '
+            f'{"seconds":>9} {"share":>6} {"rows/s":>13} {"peak MiB":>9}'
+        ]
+        for stats in self.stages:
+            share = stats.seconds / self.wall_seconds if self.wall_seconds > 0 else 0
+            rate = stats.rows_per_second
+            rate = f'{rate:,.0f}' if rate is not None else ''
+            peak = stats.peak_bytes
+            peak = f'{peak / 2 ** 20:,.1f}' if peak is not None else ''
+            lines.append(
+                f'{stats.model:<14} {stats.stage:<9} {stats.calls:>7,} '
+                f'{stats.rows:>13,} {stats.seconds:>9.3f} {share:>6.1%} '
+                f'{rate:>13} {peak:>9}'.rstrip()
+            )
+        lines.append(f'{self.wall_seconds:.3f} s wall time')
+        return '\n'.join(lines)
+
+    def to_records(self) -> list:
+        """The stage totals as a list of dictionaries (e.g. for a dataframe)"""
+        return [
+            {
+                'model': stats.model,
+                'stage': stats.stage,
+                'calls': stats.calls,
+                'rows': stats.rows,
+                'seconds': stats.seconds,
+                'rows_per_second': stats.rows_per_second,
+                'peak_bytes': stats.peak_bytes,
+            }
+            for stats in self.stages
+        ]
+
+
+class StageProfiler(object):
+    """A progress callback that adds up the time spent in each stage.
+
+    Parameters
+    ----------
+    memory : bool
+        Also track the memory each stage allocates with tracemalloc. This
+        slows scoring down considerably, and only counts memory allocated
+        through Python (including NumPy and pandas, but not Arrow).
+    logger : logging.Logger
+        Optional logger given a DEBUG record for each finished stage, with
+        the event's attributes in its 'stage_event' attribute
+
+    Example
+    -------
+        .. code-block:: python
+
+            profiler = StageProfiler()
+            model = surgeo.SurgeoModel(progress=profiler)
+            model.get_probabilities(names, zctas)
+            print(profiler.report())
+
+    """
+
+    def __init__(self, memory=False, logger=None):
+        self._memory = memory
+        self._logger = logger
+        self._lock = threading.Lock()
+        self._started_tracing = False
+        self.reset()
+
+    def __call__(self, event: StageEvent) -> None:
+        key = (event.thread, event.model, event.stage)
+        with self._lock:
+            allocated = self._check_memory() if self._memory else None
+            if not event.finished:
+                self._running[key] = [allocated, allocated]
+                return
+            start, peak = self._running.pop(key, (None, None))
+            stats = self._stats.get((event.model, event.stage))
+            if stats is None:
+                stats = StageStats(event.model, event.stage)
+                self._stats[(event.model, event.stage)] = stats
+            stats.calls += 1
+            stats.rows += event.rows
+            stats.seconds += event.elapsed
+            if start is not None:
+                stats.peak_bytes = max(stats.peak_bytes or 0, peak - start)
+        if self._logger is not None:
+            self._logger.debug(
+                '%s %s: %d rows in %.6f s',
+                event.model,
+                event.stage,
+                event.rows,
+                event.elapsed,
+                extra={'stage_event': event},
+            )
+
+    def report(self) -> ProfileReport:
+        """Get the totals of the stages that have finished so far"""
+        with self._lock:
+            stages = [
+                StageStats(
+                    stats.model,
+                    stats.stage,
+                    stats.calls,
+                    stats.rows,
+                    stats.seconds,
+                    stats.peak_bytes,
+                )
+                for stats in self._stats.values()
+            ]
+        return ProfileReport(stages, time.perf_counter() - self._started)
+
+    def reset(self) -> None:
+        """Forget the stages so far and restart the wall clock"""
+        with self._lock:
+            self._stats = {}
+            self._running = {}
+            self._started = time.perf_counter()
+
+    def close(self) -> None:
+        """Stop tracemalloc, if this profiler started it"""
+        if self._started_tracing:
+            tracemalloc.stop()
+            self._started_tracing = False
+
+    def _check_memory(self) -> int:
+        """Fold the peak since the last event into the running stages
+
+        tracemalloc keeps a single peak, which is reset at every event so
+        that stages starting later measure their own peaks. Returns the
+        memory currently allocated.
+
+        """
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracing = True
+        allocated, peak = tracemalloc.get_traced_memory()
+        for running in self._running.values():
+            running[1] = max(running[1], peak)
+        tracemalloc.reset_peak()
+        return allocated
+
+
+class _NoProgress(object):
+    """Stage timer used by models without a progress callback"""
+
+    # Stages that count their rows as they go set this
+    rows = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+
+class _Stage(object):
+    """Context manager reporting a stage's start and finish to a callback"""
+
+    __slots__ = ('_progress', '_model', '_stage', 'rows', '_started')
+
+    def __init__(self, progress, model, stage, rows):
+        self._progress = progress
+        self._model = model
+        self._stage = stage
+        # May be updated before the stage finishes
+        self.rows = rows
+
+    def __enter__(self):
+        self._progress(StageEvent(self._model, self._stage, self.rows))
+        self._started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            elapsed = time.perf_counter() - self._started
+            self._progress(StageEvent(
+                self._model,
+                self._stage,
+                self.rows,
+                elapsed,
+                finished=True,
+            ))
+        return False
+
+
+_NO_PROGRESS = _NoProgress()
@@ -20,6 +20,17 @@ class SurgeoModel(BaseModel):
        multiplying probabilities, checking input values, and obtaining
        ZCTA/name data components.
 
+    Parameters
+    ----------
+    geo_level : str
+        The geography level: 'ZCTA' or 'TRACT'
+    dtype : str
+        Precision of the probability tables and results: 'float64'
+        (default) or 'float32', which halves their memory
+    progress : callable
+        Optional callback given a surgeo.models.progress.StageEvent as
+        each stage of get_probabilities() starts and finishes
+
     Notes
     -----
     The surname probability dataframe for this model is identical to that
@@ -68,14 +79,26 @@ class SurgeoModel(BaseModel):
         69. `<https://link.springer.com/article/10.1007/s10742-009-0047-1>`_
 
     """
-    def __init__(self, geo_level="ZCTA"):
-        super().__init__()
+    def __init__(self, geo_level="ZCTA", dtype='float64', progress=None):
+        super().__init__(dtype, progress)
         self.geo_level = geo_level.upper()
         if geo_level == "TRACT":
-            self._PROB_GEO_GIVEN_RACE = self._get_prob_race_given_tract()
+            self._PROB_GEO_GIVEN_RACE = self._load_lookup(
+                'prob_race_given_tract_2010',
+                'TRACT',
+                lambda: self._compile_lookup(
+                    self._get_prob_race_given_tract(),
+                    'tract',
+                ),
+            )
         else:
-            self._PROB_GEO_GIVEN_RACE = self._get_prob_zcta_given_race()
-        self._PROB_RACE_GIVEN_SURNAME = self._get_prob_race_given_surname()
+            self._PROB_GEO_GIVEN_RACE = self._load_lookup(
+                'prob_zcta_given_race_2010',
+                'ZCTA',
+            )
+        self._PROB_RACE_GIVEN_SURNAME = self._load_lookup(
+            'prob_race_given_surname_2010'
+        )
 
     def get_probabilities(self, names, geo_df):
         """Obtain a set of BISG probabilities for name/ZCTA series
@@ -118,16 +141,56 @@ class SurgeoModel(BaseModel):
         )
         return result
 
+    def score_records(self, names, geos) -> list:
+        """Obtain BISG probabilities for a few records without pandas.
+
+        This is a faster equivalent of get_probabilities() for small
+        batches (one to a few hundred records): names and ZCTAs are looked
+        up in dictionaries and the posterior is computed on small NumPy
+        arrays. One dictionary of results is returned per record, keyed
+        like the columns of get_probabilities().
+
+        Parameters
+        ----------
+        names : list
+            Surnames to use for the BISG algorithm
+        geos : list
+            ZIP/ZCTA codes, or (state, county, tract) tuples for tract models
+
+        Returns
+        -------
+        list
+            One dictionary of BISG probability results per record
+
+        """
+        self._check_inputs(names, geos)
+        race_columns = self._PROB_RACE_GIVEN_SURNAME.columns
+        names = [self._normalize_record_name(name) for name in names]
+        sur_probs = self._record_probs(names, self._PROB_RACE_GIVEN_SURNAME)
+        geo_columns, geo_probs = self._record_geo_probs(
+            geos,
+            self._PROB_GEO_GIVEN_RACE,
+            race_columns,
+        )
+        surgeo_probs = self._fused_posterior([sur_probs, geo_probs])
+        return self._to_records({**geo_columns, 'name': names}, surgeo_probs, race_columns)
+
     def _combined_probs(self,
                         sur_probs: pd.DataFrame,
                         geo_probs: pd.DataFrame) -> pd.DataFrame:
         """Performs the BISG calculation"""
-        # Calculate each of the numerators
-        surgeo_numer = sur_probs.iloc[:, 1:] * geo_probs.iloc[:, 1:]
-        # Calculate the denominator
-        surgeo_denom = surgeo_numer.sum(axis=1)
-        # Caluclate the surgeo probabilities (each num / denom)
-        surgeo_probs = surgeo_numer.div(surgeo_denom, axis=0)
+        race_columns = self._PROB_RACE_GIVEN_SURNAME.columns
+        with self._stage('combine', len(sur_probs)):
+            # Multiply the components and divide by their row sums in one pass
+            surgeo_array = self._fused_posterior([
+                sur_probs[race_columns].to_numpy(),
+                geo_probs[race_columns].to_numpy(),
+            ])
+            surgeo_probs = pd.DataFrame(
+                surgeo_array,
+                index=sur_probs.index,
+                columns=race_columns,
+            )
         return surgeo_probs
 
     def _adjust_frame(self,
@@ -135,17 +198,18 @@ class SurgeoModel(BaseModel):
                       geo_probs: pd.DataFrame,
                       surgeo_probs: pd.DataFrame) -> pd.DataFrame:
         # Build frame from zctas, names, and probabilities
-        if self.geo_level == 'TRACT':
-            surgeo_data = pd.concat([geo_probs[['state','county','tract']], 
-                sur_probs['name'].to_frame(),
-                surgeo_probs
-            ], axis=1)
-        else:
-            surgeo_data = pd.concat([
-                geo_probs['zcta5'].to_frame(),
-                sur_probs['name'].to_frame(),
-                surgeo_probs
-            ], axis=1)
+        with self._stage('assemble', len(surgeo_probs)):
+            if self.geo_level == 'TRACT':
+                surgeo_data = pd.concat([geo_probs[['state','county','tract']], 
+                    sur_probs['name'].to_frame(),
+                    surgeo_probs
+                ], axis=1)
+            else:
+                surgeo_data = pd.concat([
+                    geo_probs['zcta5'].to_frame(),
+                    sur_probs['name'].to_frame(),
+                    surgeo_probs
+                ], axis=1)
         return surgeo_data
 
     def _check_inputs(self,
@@ -163,17 +227,9 @@ class SurgeoModel(BaseModel):
     def _get_surname_probs(self,
                            names: pd.Series) -> pd.DataFrame:
         """Normalizes names and joins names to their race probabilities."""
-        # Normalize names
-        normalized_names = (
-            self._normalize_names(names)
-                .to_frame()
-        )
-        # Merge names to dataframe, which gives probs for each name
-        surname_probs = normalized_names.merge(
+        surname_probs = self._get_name_probs(
+            names,
             self._PROB_RACE_GIVEN_SURNAME,
-            left_on='name',
-            right_index=True,
-            how='left',
         )
         return surname_probs
 
@@ -181,25 +237,13 @@ class SurgeoModel(BaseModel):
         """Normalizes ZCTAs/ZIPs and joins them to their race probs."""
         # Normalize
         if self.geo_level == 'TRACT':
-            normalized_tracts = (
-                self._normalize_tracts(geo_df)
-            )
-            geocode_probs = normalized_tracts.merge(
+            geocode_probs = self._get_tract_probs(
+                geo_df,
                 self._PROB_GEO_GIVEN_RACE,
-                left_on=['state','county','tract'],
-                right_index=True,
-                how='left',
             )
         else: 
-            normalized_zctas = (
-                self._normalize_zctas(geo_df)
-                    .to_frame()
-            )
-            # Merge names to dataframe, which gives probs for each name.
-            geocode_probs = normalized_zctas.merge(
+            geocode_probs = self._get_zcta_probs(
+                geo_df,
                 self._PROB_GEO_GIVEN_RACE,
-                left_on='zcta5',
-                right_index=True,
-                how='left',
             )
         return geocode_probs
@@ -0,0 +1,93 @@
+"""Module containing the process-wide registry of loaded lookup tables"""
+
+import threading
+
+
+class TableRegistry(object):
+    """A process-wide cache of loaded LookupTables.
+
+    Every model loads its reference tables through this registry, so all
+    model instances in a process share one read-only copy of each table.
+    Creating a model after the first one therefore costs almost nothing,
+    and memory does not grow with the number of model instances.
+
+    Entries are keyed by (table name, geo level, dtype), so float32 and
+    float64 copies of a table are held separately. They stay loaded until
+    they are explicitly evicted with evict(). Eviction only drops the
+    registry's reference: models that already hold a table keep working,
+    and the memory is released once the last of them is gone.
+
+    Example
+    -------
+        .. code-block:: python
+
+            import surgeo
+
+            # Drop every cached table
+            surgeo.TABLE_REGISTRY.evict()
+            # Drop only the geography tables for ZCTAs
+            surgeo.TABLE_REGISTRY.evict(geo_level='ZCTA')
+
+    """
+
+    def __init__(self):
+        self._tables = {}
+        self._lock = threading.RLock()
+
+    def __contains__(self, key):
+        return key in self._tables
+
+    def __len__(self):
+        return len(self._tables)
+
+    def keys(self) -> list:
+        """The (table name, geo level, dtype) keys of the loaded tables"""
+        with self._lock:
+            return list(self._tables)
+
+    def get(self, table_name: str, geo_level: str, loader, dtype: str = 'float64'):
+        """Return a loaded table, calling loader() to load it the first time
+
+        Parameters
+        ----------
+        table_name : str
+            The name of the table (its data file name without a suffix)
+        geo_level : str
+            The geography level of the table ('ZCTA', 'TRACT', ...) or None
+            for tables that are not geographic (e.g. surnames)
+        loader : callable
+            A function taking no arguments that loads the table
+        dtype : str
+            The precision the table is loaded at ('float64' or 'float32')
+
+        """
+        key = (table_name, geo_level, dtype)
+        with self._lock:
+            if key not in self._tables:
+                self._tables[key] = loader()
+            return self._tables[key]
+
+    def evict(self, table_name: str = None, geo_level: str = None) -> int:
+        """Drop cached tables matching the table name and/or geo level
+
+        If neither argument is given, every table is dropped.
+
+        Returns
+        -------
+        int
+            The number of tables evicted
+
+        """
+        with self._lock:
+            evicted = [
+                key for key in self._tables
+                if (table_name is None or key[0] == table_name)
+                and (geo_level is None or key[1] == geo_level)
+            ]
+            for key in evicted:
+                del self._tables[key]
+        return len(evicted)
+
+
+# The registry shared by every model in this process
+TABLE_REGISTRY = TableRegistry()
@@ -0,0 +1,104 @@
+"""Build step that compiles the reference data into memory-mappable tables.
+
+The models ship with their reference tables as parquet files, which have to
+be decoded into dataframes every time a model is created. Running this
+module writes each table under surgeo/data as a sorted key array and a
+contiguous float array (.npy files) in surgeo/data/compiled. The models
+memory-map these instead, so creating a model is close to instant and
+concurrent processes share a single copy through the page cache.
+
+Example
+-------
+    .. code-block::
+
+        $ python -m surgeo.utility.compile_data
+        $ python -m surgeo.utility.compile_data --no-blocks
+        $ python -m surgeo.utility.compile_data --dtype float32
+
+"""
+
+import argparse
+import pathlib
+
+from surgeo.models.base_model import BaseModel
+
+
+def compile_reference_data(data_dir=None,
+                           output_dir=None,
+                           include_blocks=True,
+                           dtype='float64') -> list:
+    """Compile every parquet table in data_dir into output_dir
+
+    Parameters
+    ----------
+    data_dir : str
+        Directory of parquet tables (defaults to the package's data folder)
+    output_dir : str
+        Directory for the compiled tables (defaults to data_dir / 'compiled')
+    include_blocks : bool
+        Whether to compile the per-state census block partitions
+    dtype : str
+        Precision of the compiled probabilities ('float64' or 'float32').
+        Models of the same precision memory-map them directly; others
+        load a converted copy.
+
+    Returns
+    -------
+    list
+        The names of the tables that were compiled
+
+    """
+    model = BaseModel(dtype)
+    data_dir = pathlib.Path(data_dir or model._package_root / 'data')
+    output_dir = pathlib.Path(output_dir or data_dir / 'compiled')
+    compiled = []
+    for parquet_path in sorted(data_dir.glob('*.parquet')):
+        table_name = parquet_path.stem
+        if '_block_' in table_name and not include_blocks:
+            continue
+        lookup = model._compile_lookup(
+            model._parquet_to_df(parquet_path),
+            model._key_encoding(table_name),
+        )
+        lookup.save(output_dir / table_name)
+        compiled.append(table_name)
+    return compiled
+
+
+def main():
+    """Parse arguments and compile the reference data"""
+    parser = argparse.ArgumentParser(
+        description='Compile Surgeo reference data into memory-mappable tables.'
+    )
+    parser.add_argument(
+        '--data_dir',
+        help='Directory of parquet tables (defaults to the package data)',
+    )
+    parser.add_argument(
+        '--output_dir',
+        help='Directory for the compiled tables (defaults to DATA_DIR/compiled)',
+    )
+    parser.add_argument(
+        '--no-blocks',
+        help='Skip the per-state census block partitions',
+        action='store_false',
+        dest='include_blocks',
+    )
+    parser.add_argument(
+        '--dtype',
+        help='Precision of the compiled probabilities',
+        choices=['float64', 'float32'],
+        default='float64',
+    )
+    args = parser.parse_args()
+    for table_name in compile_reference_data(
+        args.data_dir,
+        args.output_dir,
+        args.include_blocks,
+        args.dtype,
+    ):
+        print(f'Compiled {table_name}')
+
+
+if __name__ == '__main__':
+    main()
@@ -4,6 +4,7 @@ import subprocess
 import sys
 import tempfile
 import unittest
+import unittest.mock
 
 import numpy as np
 import pandas as pd
@@ -107,6 +108,28 @@ class TestSurgeoCLI(unittest.TestCase):
             first_name_column='first_name'
         )
 
+    def test_bifsg_chunked_cli(self):
+        """Test chunked (streaming) functionality of CLI"""
+        self._compare(
+            'bifsg_input.csv',
+            'bifsg',
+            'bifsg_output.csv',
+            surname_column='surname',
+            first_name_column='first_name',
+            chunksize='2',
+        )
+
+    def test_bifsg_parallel_cli(self):
+        """Test parallel (multi-process) functionality of CLI"""
+        self._compare(
+            'bifsg_input.csv',
+            'bifsg',
+            'bifsg_output.csv',
+            surname_column='surname',
+            first_name_column='first_name',
+            workers='2',
+        )
+
     def test_first_cli(self):
         """Test first name model functionality of CLI"""
         self._compare(
@@ -149,6 +172,138 @@ class TestSurgeoCLI(unittest.TestCase):
         df_true = pd.read_excel(self._DATA_FOLDER / 'surgeo_output.xlsx', engine='openpyxl')
         self._is_close_enough(df_generated, df_true)
 
+    def test_columnar(self):
+        """Test parquet, feather and compressed CSV inputs and outputs"""
+        with tempfile.TemporaryDirectory() as directory:
+            folder = pathlib.Path(directory)
+            # An unused column, which columnar inputs skip reading
+            input_df = pd.read_csv(self._DATA_FOLDER / 'bifsg_input.csv').assign(unused=1)
+            input_df.to_parquet(folder / 'input.parquet')
+            input_df.to_csv(folder / 'input.csv.gz', index=False)
+            df_true = pd.read_csv(self._DATA_FOLDER / 'bifsg_output.csv')
+            for input_name, output_name, extra_args in [
+                ('input.parquet', 'output.feather', []),
+                ('input.parquet', 'output.parquet', ['--chunksize', '2']),
+                ('input.csv.gz', 'output.csv.gz', ['--chunksize', '2']),
+            ]:
+                subprocess.run([
+                    sys.executable,
+                    self._CLI_SCRIPT,
+                    str(folder / input_name),
+                    str(folder / output_name),
+                    'bifsg',
+                    '--surname_column',
+                    'surname',
+                    *extra_args,
+                ])
+                if output_name.endswith('.feather'):
+                    df_generated = pd.read_feather(folder / output_name)
+                elif output_name.endswith('.parquet'):
+                    df_generated = pd.read_parquet(folder / output_name)
+                else:
+                    df_generated = pd.read_csv(folder / output_name)
+                self._is_close_enough(df_generated, df_true)
+
+    def test_id_columns(self):
+        """Test only the needed columns are read and ID columns pass through"""
+        with tempfile.TemporaryDirectory() as directory:
+            folder = pathlib.Path(directory)
+            input_df = pd.read_csv(self._DATA_FOLDER / 'bifsg_input.csv')
+            input_df.insert(0, 'loan_id', [f'L{i}' for i in range(len(input_df))])
+            # An unused column, which is skipped while parsing
+            input_df['unused'] = 'x'
+            input_df.to_csv(folder / 'input.csv', index=False)
+            df_true = pd.read_csv(self._DATA_FOLDER / 'bifsg_output.csv')
+            for extra_args in [[], ['--chunksize', '2']]:
+                subprocess.run([
+                    sys.executable,
+                    self._CLI_SCRIPT,
+                    str(folder / 'input.csv'),
+                    self._CSV_OUTPUT_PATH,
+                    'bifsg',
+                    '--surname_column',
+                    'surname',
+                    '--id_columns',
+                    'loan_id, surname',
+                    *extra_args,
+                ])
+                df_generated = pd.read_csv(self._CSV_OUTPUT_PATH)
+                self.assertEqual(list(df_generated['loan_id']), list(input_df['loan_id']))
+                self.assertEqual(list(df_generated.columns[:2]), ['loan_id', 'surname'])
+                self._is_close_enough(df_generated, df_true)
+
+    def test_progress(self):
+        """Test stage timings and running totals are reported to stderr"""
+        process = subprocess.run(
+            [
+                sys.executable,
+                self._CLI_SCRIPT,
+                str(self._DATA_FOLDER / 'bifsg_input.csv'),
+                self._CSV_OUTPUT_PATH,
+                'bifsg',
+                '--surname_column',
+                'surname',
+                '--chunksize',
+                '2',
+                '--progress',
+            ],
+            stderr=subprocess.PIPE,
+            text=True,
+        )
+        self.assertIn('BIFSGModel combine', process.stderr)
+        self.assertIn('2 rows written', process.stderr)
+        self.assertIn('5 rows written', process.stderr)
+        df_generated = pd.read_csv(self._CSV_OUTPUT_PATH)
+        df_true = pd.read_csv(self._DATA_FOLDER / 'bifsg_output.csv')
+        self._is_close_enough(df_generated, df_true)
+
+    def test_workers_progress(self):
+        """Test model stages are printed by the workers with --workers"""
+        process = subprocess.run(
+            [
+                sys.executable,
+                self._CLI_SCRIPT,
+                str(self._DATA_FOLDER / 'surgeo_input.csv'),
+                self._CSV_OUTPUT_PATH,
+                'surgeo',
+                '--workers',
+                '2',
+                '--progress',
+                '--profile',
+            ],
+            stderr=subprocess.PIPE,
+            text=True,
+        )
+        self.assertIn('SurgeoModel combine', process.stderr)
+        self.assertIn('--profile only times reading and writing', process.stderr)
+        df_generated = pd.read_csv(self._CSV_OUTPUT_PATH)
+        df_true = pd.read_csv(self._DATA_FOLDER / 'surgeo_output.csv')
+        self._is_close_enough(df_generated, df_true)
+
+    def test_profile(self):
+        """Test a breakdown of the stages is printed at the end"""
+        process = subprocess.run(
+            [
+                sys.executable,
+                self._CLI_SCRIPT,
+                str(self._DATA_FOLDER / 'surgeo_input.csv'),
+                self._CSV_OUTPUT_PATH,
+                'surgeo',
+                '--profile',
+            ],
+            stderr=subprocess.PIPE,
+            text=True,
+        )
+        lines = process.stderr.splitlines()
+        self.assertTrue(lines[0].startswith('model'))
+        self.assertTrue(lines[-1].endswith('wall time'))
+        stages = [line.split()[:2] for line in lines[1:-1]]
+        for stage in [['SurgeoCLI', 'input'], ['SurgeoModel', 'combine'], ['SurgeoCLI', 'output']]:
+            self.assertIn(stage, stages)
+        df_generated = pd.read_csv(self._CSV_OUTPUT_PATH)
+        df_true = pd.read_csv(self._DATA_FOLDER / 'surgeo_output.csv')
+        self._is_close_enough(df_generated, df_true)
+
     def test_malformed(self):
         """Test arguments to specify column names"""
         # Generate input name based on input file
@@ -198,5 +353,55 @@ class TestSurgeoCLI(unittest.TestCase):
         df_true = pd.read_csv(self._DATA_FOLDER / 'tract_output.csv')
         self._is_close_enough(df_generated, df_true)
 
+    def test_tract_zcta_columns(self):
+        """Test census tract columns are read even when a ZCTA column is named"""
+        for model_type in ['geo', 'surgeo']:
+            argv = [
+                'surgeo_cli.py',
+                'input.csv',
+                'output.csv',
+                model_type,
+                '--census_tract',
+                '--zcta_column',
+                'zip',
+                '--state_column',
+                'state',
+                '--county_column',
+                'county',
+                '--tract_column',
+                'tract',
+            ]
+            with unittest.mock.patch.object(sys, 'argv', argv):
+                cli = surgeo.app.surgeo_cli.SurgeoCLI()
+            self.assertIn('state', cli._input_columns())
+            self.assertNotIn('zip', cli._input_columns())
+            self.assertIsNone(cli._text_columns())
+
+    def test_tract_with_zcta_column(self):
+        """Test --census_tract takes precedence over --zcta_column"""
+        with tempfile.TemporaryDirectory() as directory:
+            input_path = pathlib.Path(directory) / 'input.csv'
+            input_df = pd.read_csv(self._DATA_FOLDER / 'tract_input.csv', dtype=str)
+            input_df.assign(zip='63144').to_csv(input_path, index=False)
+            subprocess.run([
+                sys.executable,
+                self._CLI_SCRIPT,
+                str(input_path),
+                self._CSV_OUTPUT_PATH,
+                'geo',
+                '--census_tract',
+                '--zcta_column',
+                'zip',
+                '--state_column',
+                'state',
+                '--county_column',
+                'county',
+                '--tract_column',
+                'tract',
+            ])
+        df_generated = pd.read_csv(self._CSV_OUTPUT_PATH)
+        df_true = pd.read_csv(self._DATA_FOLDER / 'tract_output.csv')
+        self._is_close_enough(df_generated, df_true)
+
 if __name__ == '__main__':
     unittest.main()
@@ -1,7 +1,9 @@
 import os
 import pathlib
 import tempfile
+import time
 import unittest
+import unittest.mock
 
 import tkinter as tk
 
@@ -202,6 +204,41 @@ class TestSurgeoGUI(unittest.TestCase):
         # Compare values
         self._is_close_enough(df_generated, df_true)
 
+    def _wait_for_job(self):
+        """Run the main loop until the background job finishes"""
+        while self._GUI._job is not None:
+            self._GUI._objects['root'].update()
+            time.sleep(0.01)
+
+    def test_background(self):
+        """Test background execution reports progress and can be cancelled"""
+        self._run_model(
+            self._DATA_FOLDER / 'bifsg_input.csv',
+            'BIFSG',
+            self._CSV_OUTPUT_PATH,
+            'first_name',
+            'surname',
+            'zcta5',
+        )
+        os.unlink(self._CSV_OUTPUT_PATH)
+        # The button and the enter key run the job on a worker thread
+        self._GUI._start()
+        self.assertTrue(self._GUI._objects['execute_button'].instate(['disabled']))
+        self._wait_for_job()
+        self.assertEqual(self._GUI._objects['progress_bar']['value'], 100)
+        self.assertEqual(self._GUI._objects['status_var'].get(), 'Finished')
+        df_generated = pd.read_csv(self._CSV_OUTPUT_PATH)
+        df_true = pd.read_csv(self._DATA_FOLDER / 'bifsg_output.csv')
+        self._is_close_enough(df_generated, df_true)
+        os.unlink(self._CSV_OUTPUT_PATH)
+        # A cancelled job leaves no output behind
+        with unittest.mock.patch.object(self._GUI, '_CHUNKSIZE', 1):
+            self._GUI._execute(show_msgbox=False, background=True)
+            self._GUI._cancel()
+            self._wait_for_job()
+        self.assertEqual(self._GUI._objects['status_var'].get(), 'Cancelled')
+        self.assertFalse(pathlib.Path(self._CSV_OUTPUT_PATH).exists())
+
     def test_excel(self):
         """Test Excel input and output"""
         INPUT = 'surgeo_input.xlsx'
@@ -0,0 +1,154 @@
+import importlib.util
+import pathlib
+import tempfile
+import unittest
+import unittest.mock
+
+import pandas as pd
+
+from surgeo.app import surgeo_io
+from surgeo.utility.surgeo_exception import SurgeoException
+
+
+class TestSurgeoIO(unittest.TestCase):
+
+    _DF = pd.DataFrame({
+        'name': ['SMITH', 'GARCIA', None, 'WANG', 'JONES'],
+        'zcta5': ['63144', '00631', '99999', None, '10001'],
+        'score': [1.0, 2.5, 3.0, None, 5.0],
+    })
+
+    def setUp(self):
+        self._directory = tempfile.TemporaryDirectory()
+        self._folder = pathlib.Path(self._directory.name)
+
+    def tearDown(self):
+        self._directory.cleanup()
+
+    def _round_trip(self, file_name, columns=None):
+        path = self._folder / file_name
+        surgeo_io.write_table(self._DF, path)
+        return surgeo_io.read_table(path, columns)
+
+    def test_file_format(self):
+        """Test formats are identified from file endings"""
+        for file_name, format_name in [
+            ('data.csv', surgeo_io.CSV),
+            ('data.CSV.GZ', surgeo_io.CSV),
+            ('data.csv.zst', surgeo_io.CSV),
+            ('data.2020.parquet', surgeo_io.PARQUET),
+            ('data.feather', surgeo_io.FEATHER),
+            ('data.arrow', surgeo_io.FEATHER),
+            ('data.xlsx', surgeo_io.EXCEL),
+            ('data.xls', surgeo_io.EXCEL),
+        ]:
+            self.assertEqual(surgeo_io.file_format(file_name), format_name)
+        for file_name in ['data.txt', 'data.gz', 'data']:
+            with self.assertRaises(SurgeoException):
+                surgeo_io.file_format(file_name)
+
+    def test_round_trip(self):
+        """Test every format reads back what was written"""
+        for file_name in ['data.csv', 'data.csv.gz', 'data.parquet', 'data.feather', 'data.xlsx']:
+            result = self._round_trip(file_name)
+            self.assertEqual(list(result.columns), list(self._DF.columns))
+            pd.testing.assert_series_equal(result['score'], self._DF['score'])
+            self.assertEqual(list(result['name'].fillna('')), list(self._DF['name'].fillna('')))
+            # CSV and Excel don't keep the ZCTAs' types (or leading zeros)
+            if surgeo_io.file_format(file_name) in (surgeo_io.PARQUET, surgeo_io.FEATHER):
+                pd.testing.assert_series_equal(result['zcta5'], self._DF['zcta5'], check_dtype=False)
+
+    def test_gzip(self):
+        """Test .csv.gz files are compressed"""
+        path = self._folder / 'data.csv.gz'
+        surgeo_io.write_table(self._DF, path)
+        self.assertEqual(path.read_bytes()[:2], b'\x1f\x8b')
+
+    @unittest.skipIf(importlib.util.find_spec('zstandard') is None, 'zstandard is not installed')
+    def test_zstd(self):
+        """Test .csv.zst files round trip"""
+        result = self._round_trip('data.csv.zst')
+        self.assertEqual(list(result['name'].fillna('')), list(self._DF['name'].fillna('')))
+
+    def test_columns(self):
+        """Test only the requested columns are read"""
+        for file_name in ['data.parquet', 'data.feather', 'data.csv', 'data.csv.gz', 'data.xlsx']:
+            result = self._round_trip(file_name, ['zcta5', 'name'])
+            self.assertEqual(list(result.columns), ['zcta5', 'name'])
+            for chunk in surgeo_io.iter_tables(self._folder / file_name, 2, ['score', 'name']):
+                self.assertEqual(list(chunk.columns), ['score', 'name'])
+            with self.assertRaises(SurgeoException):
+                self._round_trip(file_name, ['surname'])
+
+    def test_chunks(self):
+        """Test chunked reads and writes of the streaming formats"""
+        for file_name in ['data.csv', 'data.csv.gz', 'data.parquet', 'data.feather', 'data.xlsx']:
+            path = self._folder / file_name
+            with surgeo_io.TableWriter(path) as writer:
+                writer.write(self._DF.iloc[2:3])
+                writer.write(self._DF.iloc[3:])
+            chunks = list(surgeo_io.iter_tables(path, 1, ['name']))
+            self.assertEqual(len(chunks), 3)
+            self.assertTrue(all(list(chunk.index) == [0] for chunk in chunks))
+            self.assertEqual(list(pd.concat(chunks)['name'].fillna('')), ['', 'WANG', 'JONES'])
+
+    def test_text_columns(self):
+        """Test text columns keep their leading zeros in every chunk"""
+        zctas = ['63144', '00631', '99999', '', '10001']
+        for file_name in ['data.csv', 'data.csv.gz', 'data.xlsx']:
+            path = self._folder / file_name
+            surgeo_io.write_table(self._DF, path)
+            result = surgeo_io.read_table(path, ['zcta5'], ['zcta5'])
+            self.assertEqual(list(result['zcta5'].fillna('')), zctas)
+            chunks = surgeo_io.iter_tables(path, 3, ['zcta5', 'score'], ['zcta5'])
+            result = pd.concat(chunks, ignore_index=True)
+            self.assertEqual(list(result['zcta5'].fillna('')), zctas)
+            self.assertEqual(result['score'].dtype, float)
+
+    def test_count_rows(self):
+        """Test row counts come from metadata or a scan of the file"""
+        for file_name in ['data.csv', 'data.parquet', 'data.feather']:
+            path = self._folder / file_name
+            surgeo_io.write_table(self._DF, path)
+            self.assertEqual(surgeo_io.count_rows(path), len(self._DF))
+        # Workbooks saved by Excel (or pandas) record their dimensions
+        path = self._folder / 'data.xlsx'
+        self._DF.to_excel(path, index=False)
+        self.assertEqual(surgeo_io.count_rows(path), len(self._DF))
+        # A CSV without a final line break
+        path = self._folder / 'short.csv'
+        path.write_text('name\nSMITH\nWANG')
+        self.assertEqual(surgeo_io.count_rows(path), 2)
+        surgeo_io.write_table(self._DF, self._folder / 'data.csv.gz')
+        self.assertIsNone(surgeo_io.count_rows(self._folder / 'data.csv.gz'))
+
+    def test_excel_sheets(self):
+        """Test long results continue on new sheets and are read back whole"""
+        import openpyxl
+
+        path = self._folder / 'data.xlsx'
+        with unittest.mock.patch.object(surgeo_io, 'EXCEL_MAX_ROWS', 3):
+            with surgeo_io.TableWriter(path) as writer:
+                writer.write(self._DF.iloc[:3])
+                writer.write(self._DF.iloc[3:])
+        workbook = openpyxl.load_workbook(path)
+        self.assertEqual(workbook.sheetnames, ['Sheet1', 'Sheet2', 'Sheet3'])
+        self.assertTrue(all(sheet.max_row <= 3 for sheet in workbook.worksheets))
+        # An unrelated sheet after the data isn't part of the table
+        workbook.create_sheet('Notes').append(['Sent by compliance'])
+        workbook.save(path)
+        result = surgeo_io.read_table(path)
+        pd.testing.assert_series_equal(result['score'], self._DF['score'])
+        self.assertEqual(list(result['name'].fillna('')), list(self._DF['name'].fillna('')))
+        chunks = list(surgeo_io.iter_tables(path, 2, ['name']))
+        self.assertEqual([len(chunk) for chunk in chunks], [2, 2, 1])
+        # Blank rows in the middle of a sheet are kept
+        workbook = openpyxl.Workbook()
+        for row in [['name'], ['SMITH'], [None], ['WANG'], [None]]:
+            workbook.active.append(row)
+        workbook.save(path)
+        self.assertEqual(list(surgeo_io.read_table(path)['name'].fillna('')), ['SMITH', '', 'WANG'])
+
+
+if __name__ == '__main__':
+    unittest.main()
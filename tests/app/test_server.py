@@ -0,0 +1,166 @@
+import io
+import json
+import pathlib
+import tempfile
+import threading
+import unittest
+import urllib.error
+import urllib.request
+
+import pandas as pd
+
+from surgeo.app.surgeo_server import ARROW_STREAM_TYPE, SurgeoServer
+from surgeo.models.bifsg_model import BIFSGModel
+from surgeo.models.surgeo_model import SurgeoModel
+
+
+class TestSurgeoServer(unittest.TestCase):
+
+    _BATCH = {
+        'first_name': ['AARON', 'MARIA', None],
+        'name': ['SMITH', 'garcia', 'WANG'],
+        'zcta5': ['63144', '00631', '99999'],
+    }
+
+    @classmethod
+    def setUpClass(cls):
+        cls._server = SurgeoServer(port=0)
+        cls._thread = threading.Thread(target=cls._server.serve_forever, daemon=True)
+        cls._thread.start()
+        host, port = cls._server.address
+        cls._url = f'http://{host}:{port}'
+
+    @classmethod
+    def tearDownClass(cls):
+        cls._server.shutdown()
+        cls._thread.join()
+
+    def _request(self, path, body=None, headers=None):
+        request = urllib.request.Request(
+            self._url + path,
+            data=body,
+            headers=headers or {},
+        )
+        with urllib.request.urlopen(request) as response:
+            return response.headers['Content-Type'], response.read()
+
+    def _read_json_result(self, body):
+        payload = json.loads(body)
+        return pd.DataFrame(payload['data'], columns=payload['columns'])
+
+    def test_score_json(self):
+        """Test JSON batches match the models' own results"""
+        _, body = self._request('/score/surgeo', json.dumps(self._BATCH).encode())
+        result = self._read_json_result(body)
+        expected = SurgeoModel().get_probabilities(
+            pd.Series(self._BATCH['name']),
+            pd.Series(self._BATCH['zcta5']),
+        )
+        pd.testing.assert_frame_equal(result, expected, check_dtype=False)
+        # Records are accepted as well as columns
+        records = pd.DataFrame(self._BATCH).to_dict(orient='records')
+        _, body = self._request('/score/bifsg', json.dumps(records).encode())
+        result = self._read_json_result(body)
+        expected = BIFSGModel().get_probabilities(
+            pd.Series(self._BATCH['first_name']),
+            pd.Series(self._BATCH['name']),
+            pd.Series(self._BATCH['zcta5']),
+        )
+        pd.testing.assert_frame_equal(result, expected, check_dtype=False)
+
+    def test_score_arrow(self):
+        """Test Arrow IPC stream batches are answered with Arrow streams"""
+        import pyarrow as pa
+
+        table = pa.table(self._BATCH)
+        sink = io.BytesIO()
+        with pa.ipc.new_stream(sink, table.schema) as writer:
+            writer.write_table(table)
+        content_type, body = self._request(
+            '/score/sur',
+            sink.getvalue(),
+            {'Content-Type': ARROW_STREAM_TYPE},
+        )
+        self.assertEqual(content_type, ARROW_STREAM_TYPE)
+        result = pa.ipc.open_stream(body).read_all().to_pandas()
+        self.assertEqual(list(result['name']), ['SMITH', 'GARCIA', 'WANG'])
+        self.assertEqual(len(result.columns), 7)
+
+    def test_errors(self):
+        """Test bad requests get a 400 and unknown paths a 404"""
+        for path, body, status in [
+            ('/score/nobody', b'{}', 400),
+            ('/score/surgeo', json.dumps({'name': ['SMITH']}).encode(), 400),
+            ('/score/sur?geo_level=BLOCK', b'{}', 400),
+            ('/score/surgeo', b'not json', 400),
+            ('/nowhere', b'{}', 404),
+        ]:
+            with self.assertRaises(urllib.error.HTTPError) as context:
+                self._request(path, body)
+            self.assertEqual(context.exception.code, status)
+            self.assertIn('error', json.loads(context.exception.read()))
+
+    def test_content_length(self):
+        """Test missing, malformed and oversized Content-Lengths are refused"""
+        import http.client
+
+        host, port = self._server.address
+        for length, status in [(None, 411), ('-1', 400), ('ten', 400), ('1e3', 400), ('1000000000', 413)]:
+            connection = http.client.HTTPConnection(host, port)
+            connection.putrequest('POST', '/score/sur')
+            if length is not None:
+                connection.putheader('Content-Length', length)
+            connection.endheaders()
+            response = connection.getresponse()
+            self.assertEqual(response.status, status)
+            self.assertIn('error', json.loads(response.read()))
+            connection.close()
+
+    def test_metrics(self):
+        """Test request counts, rows and latencies are reported"""
+        for _ in range(3):
+            self._request('/score/geo', json.dumps(self._BATCH).encode())
+        _, body = self._request('/metrics')
+        metrics = json.loads(body)
+        endpoint = metrics['endpoints']['geo[ZCTA]']
+        self.assertGreaterEqual(endpoint['requests'], 3)
+        self.assertGreaterEqual(endpoint['rows'], 9)
+        self.assertGreaterEqual(endpoint['latency_ms']['p99'], endpoint['latency_ms']['p50'])
+        self.assertEqual(metrics['in_flight'], 0)
+        self.assertGreaterEqual(metrics['max_in_flight'], 1)
+
+    def test_invalid_metrics(self):
+        """Test requests for unknown models share one metrics entry"""
+        for path in ['/score/nobody1', '/score/nobody2', '/score/sur?geo_level=BLOCK']:
+            with self.assertRaises(urllib.error.HTTPError):
+                self._request(path, b'{}')
+        _, body = self._request('/metrics')
+        endpoints = json.loads(body)['endpoints']
+        self.assertGreaterEqual(endpoints['invalid']['errors'], 3)
+        self.assertFalse([name for name in endpoints if 'nobody' in name or 'BLOCK' in name])
+
+    def test_unix_socket(self):
+        """Test the server can listen on a Unix domain socket"""
+        import http.client
+        import socket
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = str(pathlib.Path(directory) / 'surgeo.sock')
+            server = SurgeoServer(socket_path=path, preload=())
+            thread = threading.Thread(target=server.serve_forever, daemon=True)
+            thread.start()
+            try:
+                connection = http.client.HTTPConnection('localhost')
+                connection.sock = socket.socket(socket.AF_UNIX)
+                connection.sock.connect(path)
+                connection.request('GET', '/health')
+                response = connection.getresponse()
+                self.assertEqual(json.loads(response.read()), {'status': 'ok'})
+                connection.close()
+            finally:
+                server.shutdown()
+                thread.join()
+
+
+if __name__ == '__main__':
+    unittest.main()
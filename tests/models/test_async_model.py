@@ -0,0 +1,154 @@
+import asyncio
+import pathlib
+import unittest
+import unittest.mock
+
+import pandas as pd
+
+from surgeo.models.async_model import AsyncModel
+from surgeo.models.batching import concat_requests, split_result
+from surgeo.models.bifsg_model import BIFSGModel
+from surgeo.models.surgeo_model import SurgeoModel
+from surgeo.utility.surgeo_exception import SurgeoException
+
+
+class TestAsyncModel(unittest.TestCase):
+
+    _DATA_FOLDER = pathlib.Path(__file__).resolve().parents[1] / 'data'
+
+    def test_get_probabilities(self):
+        """Test concurrent requests are batched and get their own rows"""
+        input_data = pd.read_csv(
+            self._DATA_FOLDER / 'bifsg_input.csv',
+            skip_blank_lines=False,
+        )
+        true_result = pd.read_csv(self._DATA_FOLDER / 'bifsg_output.csv')
+        model = AsyncModel(BIFSGModel, batch_wait_ms=50)
+        calls = []
+        score = model._score
+
+        def counted_score(*args):
+            calls.append(1)
+            return score(*args)
+
+        async def run():
+            requests = [
+                model.get_probabilities(
+                    input_data['first_name'].iloc[[i]],
+                    input_data['surname'].iloc[[i]],
+                    input_data['zcta5'].iloc[[i]],
+                )
+                for i in range(len(input_data))
+            ]
+            return await asyncio.gather(*requests)
+
+        with unittest.mock.patch.object(model, '_score', counted_score):
+            with model:
+                results = asyncio.run(run())
+        self.assertEqual(len(calls), 1)
+        self.assertTrue(all(len(result) == 1 for result in results))
+        result = pd.concat(results, ignore_index=True).round(4).fillna('')
+        pd.testing.assert_frame_equal(result, true_result.round(4).fillna(''))
+
+    def test_back_pressure(self):
+        """Test no more than max_pending requests are in flight at once"""
+        model = AsyncModel(SurgeoModel, max_pending=2, batch_size=1)
+        active = []
+        peak = []
+        score = model._score
+
+        def tracked_score(*args):
+            active.append(1)
+            peak.append(len(active))
+            try:
+                return score(*args)
+            finally:
+                active.pop()
+
+        async def run():
+            return await asyncio.gather(*[
+                model.get_probabilities(pd.Series(['SMITH']), pd.Series(['63144']))
+                for _ in range(8)
+            ])
+
+        with unittest.mock.patch.object(model, '_score', tracked_score):
+            results = asyncio.run(run())
+        model.close()
+        self.assertEqual(len(results), 8)
+        self.assertLessEqual(max(peak), 2)
+
+    def test_process_executor(self):
+        """Test scoring in worker processes matches scoring in threads"""
+        async def run(model):
+            async with model:
+                return await model.get_probabilities(
+                    pd.Series(['SMITH', 'DIAZ']),
+                    pd.Series(['63144', '63110']),
+                )
+
+        expected = asyncio.run(run(AsyncModel(SurgeoModel)))
+        result = asyncio.run(run(AsyncModel(SurgeoModel, executor='process', max_workers=1)))
+        pd.testing.assert_frame_equal(result, expected)
+
+    def test_errors(self):
+        """Test malformed requests and bad options are reported"""
+        model = AsyncModel(SurgeoModel)
+
+        async def run():
+            return await asyncio.gather(
+                model.get_probabilities(pd.Series(['SMITH']), pd.Series(['63144', '63110'])),
+                return_exceptions=True,
+            )
+
+        results = asyncio.run(run())
+        model.close()
+        self.assertIsInstance(results[0], SurgeoException)
+        with self.assertRaises(SurgeoException):
+            AsyncModel(SurgeoModel, executor='fiber')
+
+    def test_isolated_errors(self):
+        """Test a bad request doesn't fail the requests batched with it"""
+        model = AsyncModel(SurgeoModel, batch_wait_ms=50)
+        score = model._score
+
+        def failing_score(method_name, inputs):
+            # Stands in for an input the model itself can't score
+            if 'BAD' in list(inputs[0]):
+                raise SurgeoException('Cannot score BAD.')
+            return score(method_name, inputs)
+
+        async def run():
+            return await asyncio.gather(
+                model.get_probabilities(pd.Series(['SMITH']), pd.Series(['63144'])),
+                model.get_probabilities(pd.Series(['A', 'B']), pd.Series(['63144'])),
+                model.get_probabilities(pd.Series(['SMITH'])),
+                model.get_probabilities(pd.Series(['BAD']), pd.Series(['63144'])),
+                model.get_probabilities(pd.Series(['DIAZ']), pd.Series(['63110'])),
+                return_exceptions=True,
+            )
+
+        with unittest.mock.patch.object(model, '_score', failing_score):
+            with model:
+                results = asyncio.run(run())
+        for i in [1, 2, 3]:
+            self.assertIsInstance(results[i], SurgeoException)
+        self.assertEqual(list(results[0]['name']), ['SMITH'])
+        self.assertEqual(list(results[4]['name']), ['DIAZ'])
+        expected = SurgeoModel().get_probabilities(pd.Series(['SMITH']), pd.Series(['63144']))
+        pd.testing.assert_frame_equal(results[0], expected)
+
+    def test_concat_and_split(self):
+        """Test batched inputs split back into per-request results"""
+        inputs, lengths = concat_requests([
+            (['SMITH', 'DIAZ'], pd.Series(['63144', '63110'], index=[5, 6])),
+            (pd.Series(['WANG']), ['10001']),
+        ])
+        self.assertEqual(lengths, [2, 1])
+        self.assertEqual(list(inputs[0]), ['SMITH', 'DIAZ', 'WANG'])
+        self.assertEqual(list(inputs[1].index), [0, 1, 2])
+        frames = split_result(pd.DataFrame({'x': [1, 2, 3]}), lengths)
+        self.assertEqual([list(frame['x']) for frame in frames], [[1, 2], [3]])
+
+
+if __name__ == '__main__':
+    unittest.main()
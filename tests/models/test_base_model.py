@@ -1,8 +1,36 @@
+import itertools
+import pathlib
+import string
+import tempfile
 import unittest
 
+import numpy as np
 import pandas as pd
 
 from surgeo.models.base_model import BaseModel
+from surgeo.utility.compile_data import compile_reference_data
+
+
+def legacy_normalize_names(names: pd.Series) -> pd.Series:
+    """The original chained normalization, used as a parity reference
+
+    The object dtype pins Python regex semantics (where \\s also matches
+    non-ASCII whitespace) regardless of the pandas string backend.
+    """
+    translation_table = str.maketrans(
+        '', '', string.digits + string.punctuation + string.whitespace
+    )
+    return (
+        names.fillna('')
+             .astype(str)
+             .astype(object)
+             .str.translate(translation_table)
+             .str.upper()
+             .str.replace(r'\s?J\.*?R\.*\s*?$', '', regex=True)
+             .str.replace(r'\s?S\.*?R\.*\s*?$', '', regex=True)
+             .str.replace(r'\s?III\s*?$',      '', regex=True)
+             .str.replace(r'\s?IV\s*?$',       '', regex=True)
+    )
 
 
 class TestBaseModel(unittest.TestCase):
@@ -49,6 +77,40 @@ class TestBaseModel(unittest.TestCase):
         self.assertIsInstance(df, pd.DataFrame)
         self.assertEqual(len(df), self._SURNAME_DF_LENGTH)
 
+    def test_read_lookup(self):
+        """Test compiled tables load with the same contents as parquet ones"""
+        model = BaseModel()
+        with tempfile.TemporaryDirectory() as directory:
+            model._COMPILED_DIR = pathlib.Path(directory)
+            parquet_lookup = model._read_lookup('prob_race_given_first_name_harvard')
+            compile_reference_data(output_dir=directory, include_blocks=False)
+            compiled_lookup = model._read_lookup('prob_race_given_first_name_harvard')
+            self.assertIsInstance(compiled_lookup._values, np.memmap)
+            pd.testing.assert_frame_equal(
+                compiled_lookup.to_frame(),
+                parquet_lookup.to_frame(),
+            )
+            del compiled_lookup
+
+    def test_read_lookup_precision(self):
+        """Test float64 models don't use tables compiled at float32"""
+        model = BaseModel()
+        model_32 = BaseModel('float32')
+        with tempfile.TemporaryDirectory() as directory:
+            model._COMPILED_DIR = model_32._COMPILED_DIR = pathlib.Path(directory)
+            parquet_lookup = model._read_lookup('prob_race_given_first_name_harvard')
+            compile_reference_data(output_dir=directory, include_blocks=False, dtype='float32')
+            self.assertFalse(model._is_compiled('prob_race_given_first_name_harvard'))
+            self.assertTrue(model_32._is_compiled('prob_race_given_first_name_harvard'))
+            lookup = model._read_lookup('prob_race_given_first_name_harvard')
+            self.assertEqual(lookup.dtype, np.float64)
+            pd.testing.assert_frame_equal(lookup.to_frame(), parquet_lookup.to_frame())
+            # A float64 copy serves both precisions
+            compile_reference_data(output_dir=directory, include_blocks=False)
+            self.assertTrue(model_32._is_compiled('prob_race_given_first_name_harvard'))
+            lookup = model_32._read_lookup('prob_race_given_first_name_harvard')
+            self.assertEqual(lookup.dtype, np.float32)
+
     def test_normalize_names(self):
         """Test string normalization routines for names"""
         # Generate series
@@ -60,6 +122,46 @@ class TestBaseModel(unittest.TestCase):
         for correct_output, function_output in zip_object:
             self.assertEqual(correct_output, function_output)
 
+    def test_normalize_names_parity(self):
+        """Test name normalization matches the original chained version"""
+        # Every short string over an alphabet of suffix letters, dots,
+        # ASCII and non-ASCII whitespace, digits, lower case and non-ASCII
+        alphabet = 'JSRIVX. 1jsiv\xa0\u2003\u00df'
+        names = [
+            ''.join(characters)
+            for length in range(5)
+            for characters in itertools.product(alphabet, repeat=length)
+        ]
+        names += [
+            np.nan, None, 5, 1.5, True,
+            'Smith Jr.', 'SMITH J.R.', 'smith sr', 'King III', 'KING IV',
+            'Smith IV Jr', 'SMITHIIIIV', 'Smith\xa0Jr', 'Jr', 'Smith-Jones',
+            'Müller', 'straße', 'Ng\u3000Sr', 'O\'Neil III.',
+        ]
+        original = pd.Series(names, dtype=object)
+        np.testing.assert_array_equal(
+            self._BASE_MODEL._normalize_names(original).to_numpy(dtype=object),
+            legacy_normalize_names(original).to_numpy(dtype=object),
+        )
+
+    def test_normalize_names_parity_random(self):
+        """Test name normalization parity on longer random names"""
+        rng = np.random.default_rng(0)
+        alphabet = np.array(list('JSRIVXAE. -\'1jsiv\xa0\u2003'))
+        names = pd.Series([
+            ''.join(rng.choice(alphabet, rng.integers(5, 20)))
+            for _ in range(20000)
+        ])
+        np.testing.assert_array_equal(
+            self._BASE_MODEL._normalize_names(names).to_numpy(dtype=object),
+            legacy_normalize_names(names).to_numpy(dtype=object),
+        )
+
+    def test_normalize_name(self):
+        """Test the single name normalizer"""
+        for original, correct in self._NORMALIZED_NAME_MAPPING.items():
+            self.assertEqual(self._BASE_MODEL._normalize_name(original), correct)
+
     def test_normalize_zctas(self):
         """Test string normalization routines for ZCTAs"""
         # Generate series
@@ -71,6 +173,94 @@ class TestBaseModel(unittest.TestCase):
         for correct_output, function_output in zip_object:
             self.assertEqual(correct_output, function_output)
 
+    def test_get_name_probs(self):
+        """Test factorized name lookup matches a row-by-row merge"""
+        # Repeated, dirty, and missing names
+        names = pd.Series(['Davis Jr. ', 'DAVIS', None, 'Nobody123', 'davis'] * 3)
+        prob_table = pd.DataFrame(
+            {'white': [0.5], 'black': [0.5]},
+            index=pd.Index(['DAVIS'], name='name'),
+        )
+        expected = (
+            self._BASE_MODEL._normalize_names(names)
+                .to_frame()
+                .merge(prob_table, left_on='name', right_index=True, how='left')
+        )
+        result = self._BASE_MODEL._get_name_probs(
+            names,
+            self._BASE_MODEL._compile_lookup(prob_table),
+        )
+        pd.testing.assert_frame_equal(result, expected)
+
+    def test_get_probs_arrow(self):
+        """Test Arrow-backed inputs give the same results in Arrow dtypes"""
+        import pyarrow as pa
+
+        names = pd.Series(['Davis Jr. ', 'DAVIS', None, 'Nobody123', 'davis'] * 3)
+        zctas = pd.Series(['63144', '631', None, ' 65201'] * 3)
+        name_table = self._BASE_MODEL._compile_lookup(pd.DataFrame(
+            {'white': [0.5], 'black': [0.5]},
+            index=pd.Index(['DAVIS'], name='name'),
+        ))
+        zcta_table = self._BASE_MODEL._compile_lookup(pd.DataFrame(
+            {'white': [0.1, 0.2], 'black': [0.9, 0.8]},
+            index=pd.Index(['63144', '00631'], name='zcta5'),
+        ))
+        expected_names = self._BASE_MODEL._get_name_probs(names, name_table)
+        expected_zctas = self._BASE_MODEL._get_zcta_probs(zctas, zcta_table)
+        for convert in (
+            lambda series: pa.array(series, from_pandas=True),
+            lambda series: pa.chunked_array([pa.array(series, from_pandas=True)]),
+            lambda series: series.astype('string[pyarrow]'),
+        ):
+            name_result = self._BASE_MODEL._get_name_probs(convert(names), name_table)
+            zcta_result = self._BASE_MODEL._get_zcta_probs(convert(zctas), zcta_table)
+            for result, expected, key in (
+                (name_result, expected_names, 'name'),
+                (zcta_result, expected_zctas, 'zcta5'),
+            ):
+                self.assertTrue(self._BASE_MODEL._is_arrow_string(result[key].dtype))
+                pd.testing.assert_frame_equal(
+                    result.astype({key: object}).fillna({key: ''}),
+                    expected.astype({key: object}).fillna({key: ''}),
+                )
+
+    def test_get_zcta_probs(self):
+        """Test factorized ZCTA lookup matches a row-by-row merge"""
+        # Repeated, mixed-type, and missing ZCTAs
+        zctas = pd.Series([631, '00631', ' 63144', None, 63144] * 3)
+        prob_table = pd.DataFrame(
+            {'white': [0.25, 0.75]},
+            index=pd.Index(['00631', '63144'], name='zcta5'),
+        )
+        expected = (
+            self._BASE_MODEL._normalize_zctas(zctas)
+                .to_frame()
+                .merge(prob_table, left_on='zcta5', right_index=True, how='left')
+        )
+        result = self._BASE_MODEL._get_zcta_probs(
+            zctas,
+            self._BASE_MODEL._compile_lookup(prob_table),
+        )
+        pd.testing.assert_frame_equal(result, expected)
+
+    def test_fused_posterior(self):
+        """Test the NumPy posterior matches the dataframe calculation exactly"""
+        rng = np.random.default_rng(0)
+        components = [rng.random((1_000, 6)) ** 5 for _ in range(3)]
+        # Include missing cells, fully missing rows, and all-zero rows
+        components[0][rng.random((1_000, 6)) < 0.05] = np.nan
+        components[1][rng.random(1_000) < 0.05] = np.nan
+        components[2][rng.random(1_000) < 0.05] = 0.0
+        frames = [pd.DataFrame(component) for component in components]
+        numer = frames[0] * frames[1] * frames[2]
+        expected = numer.div(numer.sum(axis=1), axis=0).to_numpy()
+        # Write into a preallocated output
+        out = np.empty((1_000, 6))
+        result = self._BASE_MODEL._fused_posterior(components, out=out)
+        self.assertIs(result, out)
+        np.testing.assert_array_equal(result, expected)
+
 
 if __name__ == '__main__':
     unittest.main()
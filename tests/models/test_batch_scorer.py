@@ -0,0 +1,123 @@
+import threading
+import unittest
+
+import pandas as pd
+
+from surgeo.models.batch_scorer import BatchScorer
+from surgeo.models.surgeo_model import SurgeoModel
+from surgeo.utility.surgeo_exception import SurgeoException
+
+
+class TestBatchScorer(unittest.TestCase):
+
+    _RECORDS = [
+        ('SMITH', '63144'),
+        ('garcia', '00631'),
+        ('WANG', '99999'),
+        (None, '10001'),
+    ]
+
+    def test_score(self):
+        """Test records scored from many threads match a vectorized call"""
+        names, zctas = zip(*self._RECORDS)
+        expected = SurgeoModel().get_probabilities(
+            pd.Series(names, dtype=object),
+            pd.Series(zctas, dtype=object),
+        ).to_dict(orient='records')
+        results = {}
+        with BatchScorer(SurgeoModel, max_batch=64, max_wait_ms=20) as scorer:
+
+            def score(position):
+                results[position] = scorer.score(*self._RECORDS[position % 4])
+
+            threads = [threading.Thread(target=score, args=(i,)) for i in range(40)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            stats = scorer.stats()
+        for position, result in results.items():
+            pd.testing.assert_series_equal(
+                pd.Series(result),
+                pd.Series(expected[position % 4]),
+            )
+        self.assertEqual(stats['records'], 40)
+        self.assertLess(stats['batches'], 40)
+        self.assertGreaterEqual(stats['latency_ms']['p99'], stats['latency_ms']['p50'])
+        self.assertGreater(stats['records_per_second'], 0)
+
+    def test_max_batch(self):
+        """Test batches never exceed max_batch records"""
+        with BatchScorer(SurgeoModel, max_batch=3, max_wait_ms=50) as scorer:
+            futures = [scorer.submit('SMITH', '63144') for _ in range(7)]
+            for future in futures:
+                self.assertEqual(future.result()['name'], 'SMITH')
+            self.assertGreaterEqual(scorer.stats()['batches'], 3)
+
+    def test_errors(self):
+        """Test bad records are rejected and closed scorers refuse work"""
+        scorer = BatchScorer(SurgeoModel)
+        with self.assertRaises(SurgeoException):
+            scorer.submit('SMITH')
+        scorer.close()
+        with self.assertRaises(SurgeoException):
+            scorer.submit('SMITH', '63144')
+        with self.assertRaises(SurgeoException):
+            BatchScorer(SurgeoModel, max_batch=0)
+
+
+    def test_isolated_errors(self):
+        """Test a record the model can't score fails only its own caller"""
+        with BatchScorer(SurgeoModel, max_batch=8, max_wait_ms=50) as scorer:
+            score_records = scorer._model.score_records
+
+            def failing_score_records(names, zctas):
+                # Stands in for a record the model itself can't score
+                if 'BAD' in names:
+                    raise SurgeoException('Cannot score BAD.')
+                return score_records(names, zctas)
+
+            scorer._model.score_records = failing_score_records
+            futures = [
+                scorer.submit(name, '63144')
+                for name in ['SMITH', 'BAD', 'DIAZ']
+            ]
+            self.assertEqual(futures[0].result(timeout=5)['name'], 'SMITH')
+            with self.assertRaises(SurgeoException):
+                futures[1].result(timeout=5)
+            self.assertEqual(futures[2].result(timeout=5)['name'], 'DIAZ')
+
+    def test_cancelled(self):
+        """Test a cancelled record is dropped and scoring carries on"""
+        with BatchScorer(SurgeoModel, max_wait_ms=200) as scorer:
+            # Cancelled while the scoring thread waits for a fuller batch
+            future = scorer.submit('SMITH', '63144')
+            self.assertTrue(future.cancel())
+            self.assertEqual(scorer.score('DIAZ', '63144', timeout=5)['name'], 'DIAZ')
+            self.assertEqual(scorer.score('WANG', '99999', timeout=5)['name'], 'WANG')
+            self.assertEqual(scorer.stats()['records'], 2)
+
+    def test_close_while_submitting(self):
+        """Test a record queued while close() runs is still scored"""
+        scorer = BatchScorer(SurgeoModel)
+        put = scorer._queue.put
+        closing = []
+
+        def put_during_close(item, *args, **kwargs):
+            # Close from another thread just as the record is queued
+            if item is not None and not closing:
+                closing.append(threading.Thread(target=scorer.close))
+                closing[0].start()
+                closing[0].join(0.2)
+            return put(item, *args, **kwargs)
+
+        scorer._queue.put = put_during_close
+        future = scorer.submit('SMITH', '63144')
+        self.assertEqual(future.result(timeout=5)['name'], 'SMITH')
+        closing[0].join()
+        with self.assertRaises(SurgeoException):
+            scorer.submit('SMITH', '63144')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,9 +1,12 @@
 import pathlib
 import unittest
+import unittest.mock
 
+import numpy as np
 import pandas as pd
 
-from surgeo.models.bifsg_model import BIFSGModel
+from surgeo.models.bifsg_model import BIFSGModel, BlockLoader
+from surgeo.utility.surgeo_exception import SurgeoException
 
 
 class TestSurgeoModel(unittest.TestCase):
@@ -42,6 +45,101 @@ class TestSurgeoModel(unittest.TestCase):
         # Check that all items in the series are equal
         pd.testing.assert_frame_equal(result, true_result)
 
+    def test_get_probabilities_float32(self):
+        """Test float32 tables give float32 results close to float64"""
+        model = BIFSGModel(dtype='float32')
+        self.assertEqual(model._PROB_RACE_GIVEN_SURNAME.dtype, np.float32)
+        first_names = pd.Series(['AARON', 'MARIA', 'JAMES', 'NOBODYX'])
+        surnames = pd.Series(['SMITH', 'GARCIA', 'DIAZ', 'WANG'])
+        zctas = pd.Series(['63144', '00631', '10001', '99999'])
+        result = model.get_probabilities(first_names, surnames, zctas)
+        expected = self._BIFSG_MODEL.get_probabilities(first_names, surnames, zctas)
+        races = result.columns[3:]
+        self.assertTrue((result[races].dtypes == np.float32).all())
+        np.testing.assert_allclose(
+            result[races].to_numpy(dtype=np.float64),
+            expected[races].to_numpy(),
+            atol=1e-6,
+        )
+        with self.assertRaises(SurgeoException):
+            BIFSGModel(dtype='float16')
+
+    def test_load_family(self):
+        """Test that block partitions are filtered to the requested blocks"""
+        loader = BlockLoader()
+        full = loader.load_family(['10', '11'])
+        self.assertTrue(full.index.str[:2].isin(['10', '11']).all())
+        self.assertEqual(set(full.index.str[:2]), {'10', '11'})
+        blocks = list(full.index[::50]) + ['109999999999999']
+        filtered = loader.load_family(['10', '11'], blocks=blocks)
+        pd.testing.assert_frame_equal(
+            filtered.sort_index(),
+            full.loc[blocks[:-1]].sort_index(),
+        )
+        race_given_block = loader.load_family(['11'], 'race_given_block')
+        self.assertTrue((race_given_block.index.str[:2] == '11').all())
+        with self.assertRaises(SurgeoException):
+            loader.load_family(['11'], 'block_given_zcta')
+
+    def test_block_cache(self):
+        """Test that block partitions are cached by state within a budget"""
+        loader = BlockLoader()
+        blocks = {
+            state: pd.Series(frame.index[::100])
+            for state, frame in loader.load_partitions(['10', '11']).items()
+        }
+
+        def score(model, state):
+            names = pd.Series(['JOHN'] * len(blocks[state]))
+            return model.get_probabilities(names, names, blocks[state])
+
+        model = BIFSGModel('BLOCK')
+        uncached = BIFSGModel('BLOCK', block_cache_bytes=0)
+        pd.testing.assert_frame_equal(score(model, '10'), score(uncached, '10'))
+        score(model, '11')
+        self.assertEqual(list(model._block_cache), ['10', '11'])
+        # Cached states are not read again
+        with unittest.mock.patch.object(BlockLoader, 'load_partitions') as load:
+            score(model, '10')
+            score(model, '11')
+            load.assert_not_called()
+        self.assertEqual(list(model._block_cache), ['10', '11'])
+        self.assertEqual(uncached._block_cache_size, 0)
+        # The least recently used state is evicted to stay within budget
+        budget = model._block_cache['11'].nbytes
+        small = BIFSGModel('BLOCK', block_cache_bytes=budget)
+        score(small, '10')
+        score(small, '11')
+        self.assertEqual(list(small._block_cache), ['11'])
+        self.assertLessEqual(small._block_cache_size, budget)
+        # Missing blocks get NaN probabilities rather than raising
+        names = pd.Series(['JOHN', 'JOHN'])
+        result = model.get_probabilities(names, names, pd.Series([blocks['11'][0], None]))
+        self.assertFalse(result.loc[0, 'white':].isna().any())
+        self.assertTrue(result.loc[1, 'white':].isna().all())
+
+    def test_score_records(self):
+        """Test the dictionary fast path matches get_probabilities()"""
+        input_data = pd.read_csv(
+            self._DATA_FOLDER / 'bifsg_input.csv',
+            skip_blank_lines=False,
+        )
+        records = self._BIFSG_MODEL.score_records(
+            list(input_data['first_name']),
+            list(input_data['surname']),
+            list(input_data['zcta5']),
+        )
+        expected = self._BIFSG_MODEL.get_probabilities(
+            input_data['first_name'],
+            input_data['surname'],
+            input_data['zcta5'],
+        )
+        pd.testing.assert_frame_equal(
+            pd.DataFrame(records),
+            expected,
+            check_dtype=False,
+        )
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,127 @@
+import pathlib
+import tempfile
+import unittest
+
+import pandas as pd
+
+from surgeo.models.bifsg_model import BIFSGModel
+from surgeo.models.dataset_scorer import DatasetScorer
+from surgeo.models.surname_model import SurnameModel
+from surgeo.utility.surgeo_exception import SurgeoException
+
+
+class TestDatasetScorer(unittest.TestCase):
+
+    _DATA_FOLDER = pathlib.Path(__file__).resolve().parents[1] / 'data'
+
+    _COLUMNS = ['first_name', 'surname', 'zcta5']
+
+    def setUp(self):
+        self._directory = tempfile.TemporaryDirectory()
+        self._folder = pathlib.Path(self._directory.name)
+        self._input = pd.read_csv(
+            self._DATA_FOLDER / 'bifsg_input.csv',
+            dtype={'zcta5': str},
+            skip_blank_lines=False,
+        )
+        self._input['loan_id'] = range(len(self._input))
+        # A hive partitioned dataset with one file per state
+        for state in ['MO', 'PR']:
+            partition = self._folder / 'input' / f'state={state}'
+            partition.mkdir(parents=True)
+            self._input.to_parquet(partition / 'part-0.parquet', index=False)
+
+    def tearDown(self):
+        self._directory.cleanup()
+
+    def _expected(self):
+        """The BIFSG results for the test input"""
+        return BIFSGModel().get_probabilities(
+            self._input['first_name'],
+            self._input['surname'],
+            self._input['zcta5'],
+        )
+
+    def _check_output(self, output_paths, id_columns):
+        """Check each output file holds the IDs and results of its input"""
+        self.assertEqual(
+            [path.relative_to(self._folder / 'output').as_posix() for path in output_paths],
+            ['state=MO/part-0.parquet', 'state=PR/part-0.parquet'],
+        )
+        expected = self._expected()
+        for path, state in zip(output_paths, ['MO', 'PR']):
+            result = pd.read_parquet(path)
+            self.assertEqual(list(result.columns), id_columns + list(expected.columns))
+            self.assertEqual(list(result['loan_id']), list(self._input['loan_id']))
+            if 'state' in id_columns:
+                self.assertEqual(set(result['state']), {state})
+            pd.testing.assert_frame_equal(
+                result[expected.columns].select_dtypes(float),
+                expected.select_dtypes(float),
+            )
+
+    def test_score_dataset(self):
+        """Test each fragment is scored in batches into its own file"""
+        scorer = DatasetScorer(
+            BIFSGModel,
+            columns=self._COLUMNS,
+            id_columns=['loan_id', 'state'],
+            batch_size=2,
+        )
+        output_paths = scorer.score_dataset(self._folder / 'input', self._folder / 'output')
+        self._check_output(output_paths, ['loan_id', 'state'])
+
+    def test_workers(self):
+        """Test a glob of files scored across worker processes"""
+        scorer = DatasetScorer(
+            BIFSGModel,
+            columns=self._COLUMNS,
+            id_columns=['loan_id'],
+            workers=2,
+        )
+        output_paths = scorer.score_dataset(
+            str(self._folder / 'input' / '*' / '*.parquet'),
+            self._folder / 'output',
+        )
+        self._check_output(output_paths, ['loan_id'])
+
+    def test_score_frame(self):
+        """Test a single frame (e.g. a Dask partition) keeps its index"""
+        scorer = DatasetScorer(BIFSGModel, columns=self._COLUMNS, id_columns=['loan_id'])
+        df = self._input.set_index(pd.Index(list('abcde')))
+        result = scorer.score_frame(df)
+        self.assertEqual(list(result.index), list('abcde'))
+        self.assertEqual(list(result['loan_id']), list(df['loan_id']))
+        expected = self._expected()
+        pd.testing.assert_frame_equal(
+            result[expected.columns].reset_index(drop=True).select_dtypes(float),
+            expected.select_dtypes(float),
+        )
+        # An empty frame (as Dask uses to infer the output) is scored too
+        self.assertEqual(list(scorer.score_frame(df.iloc[:0]).columns), list(result.columns))
+
+    def test_empty_fragment(self):
+        """Test an empty file still gets an output with the columns"""
+        self._input.iloc[:0].to_parquet(self._folder / 'empty.parquet', index=False)
+        scorer = DatasetScorer(SurnameModel, columns=['surname'], id_columns=['loan_id'])
+        [output_path] = scorer.score_dataset(
+            [self._folder / 'empty.parquet'],
+            self._folder / 'output',
+        )
+        result = pd.read_parquet(output_path)
+        self.assertEqual(len(result), 0)
+        self.assertEqual(list(result.columns)[:2], ['loan_id', 'name'])
+
+    def test_errors(self):
+        """Test invalid options, columns and sources are reported"""
+        with self.assertRaises(SurgeoException):
+            DatasetScorer(SurnameModel, columns=['surname'], workers=0)
+        scorer = DatasetScorer(SurnameModel, columns=['last_name'])
+        with self.assertRaises(SurgeoException):
+            scorer.score_dataset(self._folder / 'input', self._folder / 'output')
+        with self.assertRaises(SurgeoException):
+            scorer.score_dataset(str(self._folder / '*.csv'), self._folder / 'output')
+
+
+if __name__ == '__main__':
+    unittest.main()
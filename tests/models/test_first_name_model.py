@@ -32,5 +32,20 @@ class TestFirstNameModel(unittest.TestCase):
         # Check that all items in the series are equal
         pd.testing.assert_frame_equal(result, true_result)
 
+    def test_score_records(self):
+        """Test the dictionary fast path matches get_probabilities()"""
+        input_data = pd.read_csv(
+            self._DATA_FOLDER / 'first_name_input.csv',
+            skip_blank_lines=False,
+        )
+        records = self._FIRST_NAME_MODEL.score_records(list(input_data['first_name']))
+        expected = self._FIRST_NAME_MODEL.get_probabilities(input_data['first_name'])
+        pd.testing.assert_frame_equal(
+            pd.DataFrame(records),
+            expected,
+            check_dtype=False,
+        )
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,113 @@
+import tempfile
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from surgeo.models.base_model import BaseModel
+from surgeo.models.geo_keys import MISSING_KEY, decode_keys, encode_key, encode_keys
+from surgeo.models.lookup_table import LookupTable
+
+
+class TestGeoKeys(unittest.TestCase):
+
+    _TRACT_DF = pd.DataFrame(
+        {'white': [0.1, 0.2, 0.3], 'black': [0.9, 0.8, 0.7]},
+        index=pd.MultiIndex.from_tuples(
+            [('01', '001', '020100'), ('01', '003', '010705'), ('29', '189', '215200')],
+            names=['state', 'county', 'tract'],
+        ),
+    )
+
+    def test_encode_zctas(self):
+        """Test ZCTAs must be exactly five digits"""
+        zctas = pd.Series(['00631', '63144', '631', 'abcde', '631440', None, ''])
+        np.testing.assert_array_equal(
+            encode_keys(zctas, 'zcta'),
+            [631, 63144] + [MISSING_KEY] * 5,
+        )
+        np.testing.assert_array_equal(
+            encode_keys(pd.Series([631, 63144.0, 63144.5, -1, np.nan]), 'zcta'),
+            [631, 63144, MISSING_KEY, MISSING_KEY, MISSING_KEY],
+        )
+
+    def test_encode_blocks(self):
+        """Test blocks are encoded as their 15 digit GEOID"""
+        blocks = pd.Series(['110010001001000', '11001000100100', '11001000100100X'])
+        np.testing.assert_array_equal(
+            encode_keys(blocks, 'block'),
+            [110010001001000, MISSING_KEY, MISSING_KEY],
+        )
+
+    def test_encode_tracts(self):
+        """Test tracts pack into one code from strings or integers"""
+        strings = pd.DataFrame({
+            'state': ['01', '1', '29', '01', None],
+            'county': ['001', '1', '189', '0001', '001'],
+            'tract': ['020100', '20100', '215200', '020100', '020100'],
+        })
+        integers = pd.DataFrame({
+            'state': [1, 1, 29],
+            'county': [1, 1, 189],
+            'tract': [20100, 20100, 215200],
+        })
+        expected = [1001020100, 1001020100, 29189215200, MISSING_KEY, MISSING_KEY]
+        np.testing.assert_array_equal(encode_keys(strings, 'tract'), expected)
+        np.testing.assert_array_equal(encode_keys(integers, 'tract'), expected[:3])
+
+    def test_encode_key(self):
+        """Test single keys encode as they would in an array"""
+        for value in ['00631', '631', 'abcde', None, '', 631, 63144.5]:
+            self.assertEqual(
+                encode_key(value, 'zcta'),
+                encode_keys(pd.Series([value]), 'zcta')[0],
+            )
+        self.assertEqual(encode_key(('01', '1', 20100), 'tract'), 1001020100)
+        self.assertEqual(encode_key(('01', None, '020100'), 'tract'), MISSING_KEY)
+        self.assertEqual(encode_key('01001020100', 'tract'), MISSING_KEY)
+        lookup = BaseModel()._compile_lookup(self._TRACT_DF, 'tract')
+        self.assertEqual(lookup.get_row(('29', '189', '215200')), 2)
+        self.assertEqual(lookup.get_row(('29', '189', '999999')), -1)
+
+    def test_decode_keys(self):
+        """Test decoding restores the zero-padded string keys"""
+        codes = encode_keys(self._TRACT_DF.index, 'tract')
+        pd.testing.assert_index_equal(
+            decode_keys(codes, 'tract'),
+            self._TRACT_DF.index,
+            exact=False,
+        )
+        self.assertEqual(list(decode_keys([631], 'zcta')), ['00631'])
+
+    def test_tract_lookup(self):
+        """Test tract tables match the string keys they were built from"""
+        model = BaseModel()
+        lookup = model._compile_lookup(self._TRACT_DF, 'tract')
+        geo_df = pd.DataFrame({
+            'st': ['29', '01', 1, '02'],
+            'co': ['189', '003', 1, '001'],
+            'tr': ['215200', '010705', 20100, '000100'],
+        })
+        result = model._get_tract_probs(geo_df, lookup)
+        np.testing.assert_array_equal(result['white'].iloc[:3], [0.3, 0.2, 0.1])
+        self.assertTrue(np.isnan(result['white'].iloc[3]))
+        self.assertEqual(list(result.columns[:3]), ['state', 'county', 'tract'])
+        # Encoded tables can be saved, memory-mapped, and rebuilt
+        with tempfile.TemporaryDirectory() as directory:
+            lookup.save(directory)
+            opened = LookupTable.open(directory)
+            self.assertEqual(opened.key_encoding, 'tract')
+            np.testing.assert_array_equal(
+                opened.get_rows(geo_df),
+                lookup.get_rows(geo_df),
+            )
+            pd.testing.assert_frame_equal(
+                opened.to_frame(),
+                self._TRACT_DF,
+                check_index_type=False,
+            )
+            del opened
+
+
+if __name__ == '__main__':
+    unittest.main()
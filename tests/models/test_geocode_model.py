@@ -56,5 +56,20 @@ class TestGeocodeModel(unittest.TestCase):
             result.equals(true_result)
         )
 
+    def test_score_records(self):
+        """Test the dictionary fast path matches get_probabilities()"""
+        input_data = pd.read_csv(
+            self._DATA_FOLDER / 'geocode_input.csv',
+            skip_blank_lines=False,
+        )
+        records = self._GEOCODE_MODEL.score_records(list(input_data['zcta5']))
+        expected = self._GEOCODE_MODEL.get_probabilities(input_data['zcta5'])
+        pd.testing.assert_frame_equal(
+            pd.DataFrame(records),
+            expected,
+            check_dtype=False,
+        )
+
+
 if __name__ == '__main__':
     unittest.main()
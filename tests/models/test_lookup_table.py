@@ -0,0 +1,128 @@
+import tempfile
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from surgeo.models.lookup_table import LookupTable
+from surgeo.utility.surgeo_exception import SurgeoException
+
+
+class TestLookupTable(unittest.TestCase):
+
+    _PROB_DF = pd.DataFrame(
+        {'white': [0.1, 0.2, 0.3], 'black': [0.9, 0.8, 0.7]},
+        index=pd.Index(['ADAMS', 'BAKER', 'CLARK'], name='name'),
+    )
+
+    _LOOKUP = LookupTable.from_frame(_PROB_DF)
+
+    def test_get_rows(self):
+        """Test keys map to row ids and missing keys map to -1"""
+        rows = self._LOOKUP.get_rows(pd.Series(['CLARK', 'NOBODY', 'ADAMS']))
+        np.testing.assert_array_equal(rows, [2, -1, 0])
+
+    def test_get_rows_arrow(self):
+        """Test Arrow string keys map to the same row ids"""
+        import pyarrow as pa
+
+        keys = pa.array(['CLARK', None, 'NOBODY', 'ADAMS'])
+        np.testing.assert_array_equal(self._LOOKUP.get_rows(keys), [2, -1, -1, 0])
+        with tempfile.TemporaryDirectory() as directory:
+            self._LOOKUP.save(directory)
+            lookup = LookupTable.open(directory)
+            np.testing.assert_array_equal(lookup.get_rows(keys), [2, -1, -1, 0])
+            del lookup
+        # Small inputs against large tables skip Arrow's hash set build
+        prob_df = pd.DataFrame(
+            {'white': np.linspace(0, 1, 100)},
+            index=pd.Index([f'NAME{i:03}' for i in range(100)], name='name'),
+        )
+        lookup = LookupTable.from_frame(prob_df)
+        np.testing.assert_array_equal(
+            lookup.get_rows(pa.array(['NAME005', None, 'NOBODY'])),
+            [5, -1, -1],
+        )
+
+    def test_get_row(self):
+        """Test single keys map to the same row ids as get_rows()"""
+        for key in ['CLARK', 'ADAMS', 'NOBODY', None, float('nan')]:
+            self.assertEqual(
+                self._LOOKUP.get_row(key),
+                self._LOOKUP.get_rows(pd.Series([key]))[0],
+            )
+
+    def test_take(self):
+        """Test missing row ids produce NaN probabilities"""
+        values = self._LOOKUP.take(np.array([1, -1]))
+        np.testing.assert_array_equal(values[0], [0.2, 0.8])
+        self.assertTrue(np.isnan(values[1]).all())
+
+    def test_nbytes(self):
+        """Test the memory estimate covers the keys and values"""
+        # Three keys plus the missing row, two float64 columns
+        self.assertGreater(self._LOOKUP.nbytes, 4 * 2 * 8)
+
+    def test_astype(self):
+        """Test converting the precision keeps keys and missing rows"""
+        lookup = self._LOOKUP.astype('float32')
+        self.assertEqual(lookup.dtype, np.float32)
+        self.assertIs(self._LOOKUP.astype(np.float64), self._LOOKUP)
+        self.assertLess(lookup.nbytes, self._LOOKUP.nbytes)
+        values = lookup.take(lookup.get_rows(pd.Series(['BAKER', 'NOBODY'])))
+        np.testing.assert_array_equal(values[0], np.float32([0.2, 0.8]))
+        self.assertTrue(np.isnan(values[1]).all())
+
+    def test_multi_key(self):
+        """Test multi-column keys such as state/county/tract"""
+        prob_df = self._PROB_DF.copy()
+        prob_df.index = pd.MultiIndex.from_tuples(
+            [('01', '001', '020100'), ('01', '001', '020200'), ('02', '001', '000100')],
+            names=['state', 'county', 'tract'],
+        )
+        lookup = LookupTable.from_frame(prob_df)
+        keys = pd.DataFrame({
+            'state': ['02', '01'],
+            'county': ['001', '999'],
+            'tract': ['000100', '020100'],
+        })
+        np.testing.assert_array_equal(lookup.get_rows(keys), [2, -1])
+
+    def test_to_frame(self):
+        """Test the compiled table round trips to a dataframe"""
+        pd.testing.assert_frame_equal(self._LOOKUP.to_frame(), self._PROB_DF)
+
+    def test_save_and_open(self):
+        """Test saved tables memory-map and look up like in-memory ones"""
+        keys = pd.Series(['CLARK', 'NOBODY', None, 'ADAMS', 'BAKER'])
+        with tempfile.TemporaryDirectory() as directory:
+            self._LOOKUP.save(directory)
+            opened = LookupTable.open(directory)
+            self.assertIsInstance(opened._values, np.memmap)
+            self.assertEqual(LookupTable.saved_dtype(directory), self._LOOKUP.dtype)
+            expected = self._LOOKUP.take(self._LOOKUP.get_rows(keys))
+            result = opened.take(opened.get_rows(keys))
+            np.testing.assert_array_equal(result, expected)
+            pd.testing.assert_frame_equal(opened.to_frame(), self._PROB_DF)
+            del opened, result
+
+    def test_concat(self):
+        """Test combining tables keeps every key reachable"""
+        first = LookupTable.from_frame(self._PROB_DF.iloc[:2])
+        second = LookupTable.from_frame(self._PROB_DF.iloc[2:])
+        combined = LookupTable.concat([second, first])
+        pd.testing.assert_frame_equal(
+            combined.to_frame().sort_index(),
+            self._PROB_DF,
+        )
+
+    def test_duplicate_keys(self):
+        """Test duplicate keys are rejected"""
+        prob_df = self._PROB_DF.copy()
+        prob_df.index = ['ADAMS', 'ADAMS', 'CLARK']
+        with self.assertRaises(SurgeoException):
+            LookupTable.from_frame(prob_df)
+
+
+if __name__ == '__main__':
+    unittest.main()
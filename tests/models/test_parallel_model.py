@@ -0,0 +1,65 @@
+import pathlib
+import unittest
+
+import pandas as pd
+
+from surgeo.models.bifsg_model import BIFSGModel
+from surgeo.models.parallel_model import ParallelModel
+from surgeo.utility.surgeo_exception import SurgeoException
+
+
+class TestParallelModel(unittest.TestCase):
+
+    _DATA_FOLDER = pathlib.Path(__file__).resolve().parents[1] / 'data'
+
+    def test_get_probabilities(self):
+        """Test parallel BIFSG model versus known result"""
+        # Load data and repeat it so that it spans several partitions
+        input_data = pd.read_csv(
+            self._DATA_FOLDER / 'bifsg_input.csv',
+            skip_blank_lines=False,
+        )
+        input_data = pd.concat([input_data] * 3, ignore_index=True)
+        true_result = pd.read_csv(self._DATA_FOLDER / 'bifsg_output.csv')
+        true_result = pd.concat([true_result] * 3, ignore_index=True)
+        # Get probs using two workers and partitions of two rows
+        with ParallelModel(BIFSGModel, workers=2, partition_size=2) as model:
+            result = model.get_probabilities(
+                input_data['first_name'],
+                input_data['surname'],
+                input_data['zcta5'],
+            )
+        # Clean for consistency
+        result = result.round(4).fillna('')
+        true_result = true_result.round(4).fillna('')
+        # Check that all items in the series are equal
+        pd.testing.assert_frame_equal(result, true_result)
+
+    def test_model_kwargs(self):
+        """Test keyword arguments reach the models in the workers"""
+        with ParallelModel(BIFSGModel, workers=2, partition_size=2, dtype='float32') as model:
+            result = model.get_probabilities(
+                pd.Series(['ADAM', 'MARIA', 'WEI']),
+                pd.Series(['WILSON', 'GARCIA', 'WANG']),
+                pd.Series(['00631', '63110', '10001']),
+            )
+        self.assertEqual(result['white'].dtype, 'float32')
+
+    def test_length_mismatch(self):
+        """Test inputs of different lengths are rejected"""
+        model = ParallelModel(BIFSGModel, workers=1)
+        with self.assertRaises(SurgeoException):
+            model.get_probabilities(
+                pd.Series(['ADAM']),
+                pd.Series(['WILSON', 'DIAZ']),
+                pd.Series(['63110']),
+            )
+
+    def test_invalid_workers(self):
+        """Test a non-positive worker count is rejected"""
+        with self.assertRaises(SurgeoException):
+            ParallelModel(BIFSGModel, workers=0)
+
+
+if __name__ == '__main__':
+    unittest.main()
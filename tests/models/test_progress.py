@@ -0,0 +1,137 @@
+import io
+import logging
+import unittest
+
+import pandas as pd
+
+from surgeo.models.bifsg_model import BIFSGModel
+from surgeo.models.progress import ProgressPrinter, StageEvent, StageProfiler
+from surgeo.models.surgeo_model import SurgeoModel
+from surgeo.models.surname_model import SurnameModel
+from surgeo.models.table_registry import TABLE_REGISTRY
+
+
+class TestProgress(unittest.TestCase):
+
+    _NAMES = pd.Series(['SMITH', 'garcia', None, 'WANG'])
+
+    _ZCTAS = pd.Series(['63144', '00631', '99999', '631'])
+
+    def test_stage_events(self):
+        """Test each stage reports its start and finish with row counts"""
+        events = []
+        model = SurgeoModel(progress=events.append)
+        # Tables may be read while the model is created
+        events.clear()
+        result = model.get_probabilities(self._NAMES, self._ZCTAS)
+        finished = [event for event in events if event.finished]
+        self.assertEqual(
+            [event.stage for event in finished],
+            ['normalize', 'lookup', 'normalize', 'lookup', 'combine', 'assemble'],
+        )
+        # Every stage starts before it finishes
+        self.assertEqual(len(events), 2 * len(finished))
+        for start, finish in zip(events[::2], events[1::2]):
+            self.assertFalse(start.finished)
+            self.assertEqual((start.stage, start.rows), (finish.stage, finish.rows))
+        for event in finished:
+            self.assertEqual(event.model, 'SurgeoModel')
+            self.assertEqual(event.rows, 4)
+            self.assertGreaterEqual(event.elapsed, 0)
+        # Reporting doesn't change the results
+        expected = SurgeoModel().get_probabilities(self._NAMES, self._ZCTAS)
+        pd.testing.assert_frame_equal(result, expected)
+
+    def test_other_models(self):
+        """Test the single-table and BIFSG models report their stages"""
+        events = []
+        model = SurnameModel(progress=events.append)
+        events.clear()
+        model.get_probabilities(self._NAMES)
+        self.assertEqual(
+            [event.stage for event in events if event.finished],
+            ['normalize', 'lookup'],
+        )
+        events = []
+        model = BIFSGModel(progress=events.append)
+        events.clear()
+        model.get_probabilities(
+            self._NAMES,
+            self._NAMES,
+            self._ZCTAS,
+        )
+        self.assertEqual(
+            [event.stage for event in events if event.finished][-2:],
+            ['combine', 'assemble'],
+        )
+
+    def test_read_stage(self):
+        """Test tables are reported as they are read, but not once cached"""
+        TABLE_REGISTRY.evict('prob_race_given_surname_2010')
+        events = []
+        model = SurnameModel(progress=events.append)
+        self.assertEqual([event.stage for event in events], ['read', 'read'])
+        self.assertEqual(events[1].rows, len(model._PROB_RACE_GIVEN_SURNAME))
+        events.clear()
+        SurnameModel(progress=events.append)
+        self.assertEqual(events, [])
+
+    def test_profiler(self):
+        """Test the profiler adds up each stage's calls, rows and time"""
+        profiler = StageProfiler()
+        for elapsed in [0.25, 0.5]:
+            profiler(StageEvent('SurgeoModel', 'lookup', 100))
+            profiler(StageEvent('SurgeoModel', 'lookup', 100, elapsed, True))
+        profiler(StageEvent('SurgeoModel', 'combine', 100, 0.25, True))
+        # Unfinished stages aren't counted
+        profiler(StageEvent('SurgeoModel', 'assemble', 100))
+        report = profiler.report()
+        self.assertEqual([stats.stage for stats in report.stages], ['lookup', 'combine'])
+        lookup = report.stages[0]
+        self.assertEqual((lookup.calls, lookup.rows, lookup.seconds), (2, 200, 0.75))
+        self.assertIsNone(lookup.peak_bytes)
+        self.assertEqual(report.to_records()[1]['rows_per_second'], 400)
+        self.assertIn('SurgeoModel    combine', str(report))
+        profiler.reset()
+        self.assertEqual(profiler.report().stages, [])
+
+    def test_profiler_memory(self):
+        """Test the profiler tracks memory and logs stages from a model"""
+        logger = logging.getLogger('surgeo.tests.profile')
+        profiler = StageProfiler(memory=True, logger=logger)
+        model = SurgeoModel(progress=profiler)
+        profiler.reset()
+        with self.assertLogs(logger, logging.DEBUG) as logs:
+            model.get_probabilities(self._NAMES, self._ZCTAS)
+        profiler.close()
+        report = profiler.report()
+        self.assertEqual(
+            [(stats.stage, stats.calls) for stats in report.stages],
+            [('normalize', 2), ('lookup', 2), ('combine', 1), ('assemble', 1)],
+        )
+        self.assertTrue(all(stats.peak_bytes > 0 for stats in report.stages))
+        self.assertEqual(len(logs.records), 6)
+        self.assertEqual(logs.records[-1].stage_event.stage, 'assemble')
+
+    def test_rows_per_second(self):
+        """Test throughput is only given for measurable finished stages"""
+        self.assertEqual(StageEvent('SurgeoModel', 'lookup', 100, 0.5, True).rows_per_second, 200)
+        self.assertIsNone(StageEvent('SurgeoModel', 'lookup', 100).rows_per_second)
+        self.assertIsNone(StageEvent('SurgeoModel', 'lookup', 100, 0.0, True).rows_per_second)
+
+    def test_printer(self):
+        """Test the printer writes one line per finished stage"""
+        stream = io.StringIO()
+        printer = ProgressPrinter(stream)
+        printer(StageEvent('SurgeoModel', 'lookup', 1000))
+        printer(StageEvent('SurgeoModel', 'lookup', 1000, 0.5, True))
+        printer.write('1,000 rows written')
+        lines = stream.getvalue().splitlines()
+        self.assertEqual(len(lines), 2)
+        self.assertIn('SurgeoModel lookup', lines[0])
+        self.assertIn('2,000 rows/s', lines[0])
+        self.assertEqual(lines[1], '1,000 rows written')
+
+
+if __name__ == '__main__':
+    unittest.main()
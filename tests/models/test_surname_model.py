@@ -34,5 +34,20 @@ class TestSurnameModel(unittest.TestCase):
             result.equals(true_result)
         )
 
+    def test_score_records(self):
+        """Test the dictionary fast path matches get_probabilities()"""
+        input_data = pd.read_csv(
+            self._DATA_FOLDER / 'surname_input.csv',
+            skip_blank_lines=False,
+        )
+        records = self._SURNAME_MODEL.score_records(list(input_data['name']))
+        expected = self._SURNAME_MODEL.get_probabilities(input_data['name'])
+        pd.testing.assert_frame_equal(
+            pd.DataFrame(records),
+            expected,
+            check_dtype=False,
+        )
+
+
 if __name__ == '__main__':
     unittest.main()
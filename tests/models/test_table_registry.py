@@ -0,0 +1,53 @@
+import unittest
+
+from surgeo.models.geocode_model import GeocodeModel
+from surgeo.models.surgeo_model import SurgeoModel
+from surgeo.models.surname_model import SurnameModel
+from surgeo.models.table_registry import TABLE_REGISTRY, TableRegistry
+
+
+class TestTableRegistry(unittest.TestCase):
+
+    def test_models_share_tables(self):
+        """Test model instances share a single copy of each table"""
+        first = SurgeoModel()
+        second = SurgeoModel()
+        surname = SurnameModel()
+        self.assertIs(first._PROB_GEO_GIVEN_RACE, second._PROB_GEO_GIVEN_RACE)
+        self.assertIs(first._PROB_RACE_GIVEN_SURNAME, surname._PROB_RACE_GIVEN_SURNAME)
+        self.assertIn(('prob_zcta_given_race_2010', 'ZCTA', 'float64'), TABLE_REGISTRY)
+
+    def test_evict(self):
+        """Test evicted tables are reloaded by the next model"""
+        first = GeocodeModel()
+        evicted = TABLE_REGISTRY.evict(geo_level='ZCTA')
+        self.assertGreaterEqual(evicted, 1)
+        self.assertNotIn(('prob_race_given_zcta_2010', 'ZCTA', 'float64'), TABLE_REGISTRY)
+        second = GeocodeModel()
+        self.assertIsNot(first._PROB_RACE_GIVEN_GEO, second._PROB_RACE_GIVEN_GEO)
+
+    def test_dtype(self):
+        """Test each precision gets its own copy of a table"""
+        double = SurnameModel()
+        single = SurnameModel(dtype='float32')
+        self.assertIsNot(double._PROB_RACE_GIVEN_SURNAME, single._PROB_RACE_GIVEN_SURNAME)
+        self.assertIs(
+            single._PROB_RACE_GIVEN_SURNAME,
+            SurnameModel(dtype='float32')._PROB_RACE_GIVEN_SURNAME,
+        )
+        self.assertIn(('prob_race_given_surname_2010', None, 'float32'), TABLE_REGISTRY)
+
+    def test_get(self):
+        """Test the loader is only called the first time"""
+        registry = TableRegistry()
+        calls = []
+        loader = lambda: calls.append(1) or object()
+        table = registry.get('table', None, loader)
+        self.assertIs(registry.get('table', None, loader), table)
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(registry.evict('table'), 1)
+        self.assertEqual(len(registry), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -7,23 +7,43 @@ from surgeo import models
 # Import test modules
 import app.test_cli
 import app.test_gui
+import app.test_io
+import app.test_server
+import models.test_async_model
 import models.test_base_model
+import models.test_batch_scorer
 import models.test_bifsg_model
+import models.test_dataset_scorer
 import models.test_first_name_model
+import models.test_geo_keys
 import models.test_geocode_model
+import models.test_lookup_table
+import models.test_parallel_model
+import models.test_progress
 import models.test_surgeo_model
 import models.test_surname_model
+import models.test_table_registry
 
 # List test modules
 test_modules = [
     app.test_cli,
     app.test_gui,
+    app.test_io,
+    app.test_server,
+    models.test_async_model,
     models.test_base_model,
+    models.test_batch_scorer,
     models.test_bifsg_model,
+    models.test_dataset_scorer,
     models.test_first_name_model,
+    models.test_geo_keys,
     models.test_geocode_model,
+    models.test_lookup_table,
+    models.test_parallel_model,
+    models.test_progress,
     models.test_surgeo_model,
     models.test_surname_model,
+    models.test_table_registry,
 ]
 
 # Create loader and suite